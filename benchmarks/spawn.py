@@ -0,0 +1,78 @@
+"""
+---------------------------------------------------------------------
+spawn.py
+---------------------------------------------------------------------
+Measures the cost of starting a command in every instance of a
+synthetic project, through the shell as `lc run` does by default,
+straight as `lc run --exec_` does and in the long-lived shells of
+`lc run --pool`. The command itself does next
+to nothing, so the time per instance is the overhead of spawning
+it. The instances are created in a temporary directory.
+
+Usage: python benchmarks/spawn.py [--instances 10000] [--jobs 1] [--command true]
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(ROOT))
+
+from lordcommander.controllers import CommandController  # noqa: E402
+from lordcommander.executor import DirectCommand  # noqa: E402
+from lordcommander.pool import ShellPool  # noqa: E402
+
+
+def prepare(root, count):
+    """Create a project with the given number of instances"""
+    instances = ['instance%05d' % number for number in range(count)]
+    for name in instances:
+        os.mkdir(os.path.join(root, name))
+    return {'root': root, 'instances': instances}
+
+
+def measure(project, command, jobs, executor=None):
+    """Run the command throughout the project, return the wall time in seconds"""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        CommandController(executor=executor).run(project, command, jobs=jobs, aggregate=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the per instance cost of spawning a command.')
+    parser.add_argument('--instances', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--command', default='true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        project = prepare(root, args.instances)
+        shell = measure(project, args.command, args.jobs)
+        direct = measure(project, DirectCommand(args.command), args.jobs)
+        pool = ShellPool()
+        try:
+            pooled = measure(project, args.command, args.jobs, pool)
+        finally:
+            pool.close()
+
+    for name, seconds in (('shell', shell), ('--exec_', direct), ('--pool', pooled)):
+        print("%-7s %8.2f s in total, %7.1f us per instance" % (
+            name, seconds, seconds / args.instances * 1e6))
+    print("--exec_ saves %.1f us per instance (%.0f%%) over %d instances with %d jobs" % (
+        (shell - direct) / args.instances * 1e6, (shell - direct) / shell * 100, args.instances, args.jobs))
+    print("--pool saves %.1f us per instance (%.0f%%)" % (
+        (shell - pooled) / args.instances * 1e6, (shell - pooled) / shell * 100))
+
+
+if __name__ == '__main__':
+    main()
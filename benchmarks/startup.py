@@ -0,0 +1,98 @@
+"""
+---------------------------------------------------------------------
+startup.py
+---------------------------------------------------------------------
+Measures the cold start of lc, the wall-clock time of running
+`lc utils total` in a fresh interpreter along with the heaviest
+imports reported by `python -X importtime`. The store lives in a
+temporary data directory so the real data is never touched.
+
+Usage: python benchmarks/startup.py [--runs 20] [--top 10]
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.resolve()
+ENTRY = "import sys; sys.argv[0] = 'lc'; from lordcommander import main; main()"
+
+
+def environment(data_home):
+    env = dict(os.environ, XDG_DATA_HOME=data_home, NO_COLOR='1')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT), env.get('PYTHONPATH')]))
+    return env
+
+
+def lc(env, *args, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', ENTRY] + list(args)
+    return subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+
+
+def prepare(env, root):
+    """Create an active project with a few instances"""
+    lc(env, 'proj', 'add', root, '--name', 'bench')
+    lc(env, 'proj', 'active', 'bench')
+    lc(env, 'dirs', 'add', *['instance%d' % i for i in range(100)])
+
+
+def wall_times(env, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        lc(env, 'utils', 'total')
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def interpreter_times(runs):
+    """Start up time of a bare interpreter, the floor for lc"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def heaviest_imports(env, top):
+    """Parse importtime output, return (cumulative us, module) of top level imports"""
+    imports = []
+    for line in lc(env, 'utils', 'total', importtime=True).stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), module.rstrip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold start of lc utils total.')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as data_home:
+        env = environment(data_home)
+        prepare(env, data_home)
+        times = wall_times(env, args.runs)
+        interpreter = statistics.median(interpreter_times(args.runs))
+        
+        print("lc utils total: median %.1f ms, min %.1f ms, max %.1f ms over %d runs" % (
+            statistics.median(times), min(times), max(times), args.runs))
+        print("bare interpreter: median %.1f ms" % interpreter)
+        print("\nHeaviest imports (cumulative):")
+        for cumulative, module in heaviest_imports(env, args.top):
+            print("%8.1f ms  %s" % (cumulative / 1000, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+---------------------------------------------------------------------
+suite.py
+---------------------------------------------------------------------
+Times the everyday operations of lc on synthetic projects of 1k, 10k
+and 100k instances, so that anything growing faster than the number
+of instances shows up. For every size a project is created in a
+temporary directory, with a data directory of its own, and these
+are timed:
+
+- dirs add: adding all the instances in a single call
+- dirs view, utils search, utils dump and utils restore
+- run selection: picking the instances with --ex and with --inc
+- run no-op: running a no-op command in the first 1000 instances,
+  also given per instance
+- run aggregate: the same with --aggregate, collecting the output
+- cold start: `lc utils total` in a fresh interpreter
+
+The commands go through the same entry point as `lc` itself, only
+the output is thrown away. The data directory of lc is pointed at a
+temporary one, so the real store is never touched. The results are written as JSON, and two
+such files can be compared to find the operations that got slower.
+
+Usage: python benchmarks/suite.py run [--sizes 1000,10000,100000] [--output results.json]
+       python benchmarks/suite.py compare baseline.json results.json [--threshold 0.25]
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(ROOT))
+# The data directory is taken from the first argument
+ENTRY = ("import sys; import lordcommander.commander as commander; data_dir = sys.argv.pop(1); "
+         "commander.create_data_dir = lambda: data_dir; sys.argv[0] = 'lc'; commander.main()")
+
+# Differences smaller than this many seconds are noise, never a regression
+MIN_DELTA = 0.005
+
+
+def lc(*argv):
+    """Run an lc command line in this process, throwing the output away"""
+    from lordcommander.commander import execute, read_data
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        execute(list(argv), read_data)
+
+
+@contextlib.contextmanager
+def silenced():
+    """Throw away whatever is written to stdout and stderr, by children too"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    null = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(null, 1)
+        os.dup2(null, 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved + [null]:
+            os.close(fd)
+
+
+def timed(operation, *args, **kwargs):
+    """Seconds taken by the operation"""
+    started = time.perf_counter()
+    operation(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def cold_start(data_dir, runs):
+    """Median seconds of `lc utils total` in a fresh interpreter"""
+    env = dict(os.environ, NO_COLOR='1', LORDCOMMANDER_NO_DAEMON='1')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT), env.get('PYTHONPATH')]))
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', ENTRY, data_dir, 'utils', 'total'], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def scenario(size, run_limit, cold_runs):
+    """
+    Time the operations on a project of the given size.
+    :return: Dictionary of seconds by operation
+    """
+    import builtins
+    from lordcommander import commander
+    from lordcommander.commander import read_data
+    from lordcommander.controllers import CommandController
+
+    results = {}
+    create_data_dir = commander.create_data_dir
+    with tempfile.TemporaryDirectory() as temporary:
+        # A data directory of its own, the real data is never touched
+        data_dir = os.path.join(temporary, 'data')
+        os.mkdir(data_dir)
+        commander.create_data_dir = lambda: data_dir
+        os.environ['LORDCOMMANDER_NO_DAEMON'] = '1'
+        try:
+            root = os.path.join(temporary, 'project')
+            names = ['instance%06d' % number for number in range(size)]
+            os.makedirs(root)
+            for name in names:
+                os.mkdir(os.path.join(root, name))
+            lc('proj', 'add', root, '--name', 'bench')
+            lc('proj', 'active', 'bench')
+
+            results['dirs add'] = timed(lc, 'dirs', 'add', *names)
+            results['dirs view'] = timed(lc, 'dirs', 'view')
+            results['utils search'] = timed(lc, 'utils', 'search', names[-1])
+            results['utils dump'] = timed(lc, 'utils', 'dump', temporary)
+            answer, builtins.input = builtins.input, lambda prompt='': 'yes'
+            try:
+                results['utils restore'] = timed(lc, 'utils', 'restore', os.path.join(temporary, 'lcdb_dump.json'))
+            finally:
+                builtins.input = answer
+
+            store = read_data()
+            try:
+                project = {'root': root, 'instances': list(store['projects']['bench']['instances'])}
+            finally:
+                store.close()
+            cc = CommandController()
+            every_tenth = tuple(range(0, size, 10))
+            results['run selection --ex'] = timed(cc._get_instances, project, 0, None, every_tenth, ())
+            results['run selection --inc'] = timed(cc._get_instances, project, 0, None, (), every_tenth)
+
+            # Run a no-op command in the first instances, writing to the terminal as usual
+            count = min(size, run_limit)
+            limited = {'root': root, 'instances': project['instances'][:count]}
+            with silenced():
+                results['run no-op'] = timed(CommandController().run, limited, 'true')
+                results['run aggregate'] = timed(CommandController().run, limited, 'true', aggregate=True)
+            results['run per instance'] = results['run no-op'] / count
+
+            results['cold start'] = cold_start(data_dir, cold_runs)
+        finally:
+            commander.create_data_dir = create_data_dir
+    return results
+
+
+def run(args):
+    sizes = [int(size) for size in args.sizes.split(',')]
+    report = {'python': platform.python_version(), 'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': {}}
+    for size in sizes:
+        best = {}
+        for _ in range(args.repeat):
+            for operation, seconds in scenario(size, args.run_limit, args.cold_runs).items():
+                best[operation] = min(seconds, best.get(operation, seconds))
+        report['results'][str(size)] = best
+        for operation, seconds in best.items():
+            print("%7d %-22s %12.6f s" % (size, operation, seconds), flush=True)
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=4)
+    print("Results are written to %s" % args.output)
+
+
+def compare(baseline, current, threshold, min_delta=MIN_DELTA):
+    """
+    Find the operations that got slower.
+    :param baseline: Results read from the baseline file
+    :param current: Results read from the new file
+    :param threshold: Share of the baseline an operation may get slower by, e.g. 0.25
+    :param min_delta: Seconds an operation may get slower by anyway (optional)
+    :return: List of (size, operation, baseline seconds, current seconds, ratio, regressed)
+    """
+    rows = []
+    for size, operations in current['results'].items():
+        for operation, seconds in operations.items():
+            before = baseline['results'].get(size, {}).get(operation)
+            if before is None:
+                continue
+            ratio = seconds / before if before else float('inf')
+            rows.append((size, operation, before, seconds, ratio,
+                         ratio > 1 + threshold and seconds - before > min_delta))
+    return rows
+
+
+def compare_files(args):
+    with open(args.baseline) as baseline, open(args.current) as current:
+        rows = compare(json.load(baseline), json.load(current), args.threshold)
+    regressions = 0
+    print("%7s %-22s %12s %12s %8s" % ('Size', 'Operation', 'Baseline s', 'Current s', 'Change'))
+    for size, operation, before, seconds, ratio, regressed in rows:
+        regressions += regressed
+        print("%7s %-22s %12.6f %12.6f %+7.1f%% %s" % (size, operation, before, seconds, (ratio - 1) * 100,
+                                                       'REGRESSION' if regressed else ''))
+    print("%d regressions above %.0f%%." % (regressions, args.threshold * 100))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time lc on synthetic projects of many instances.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    runner = commands.add_parser('run', help='time the operations and write the results')
+    runner.add_argument('--sizes', default='1000,10000,100000')
+    runner.add_argument('--output', default='benchmark-results.json')
+    runner.add_argument('--repeat', type=int, default=1, help='keep the best of this many rounds')
+    runner.add_argument('--run-limit', type=int, default=1000, help='instances a no-op command is run in')
+    runner.add_argument('--cold-runs', type=int, default=5)
+    comparer = commands.add_parser('compare', help='flag operations slower than in the baseline')
+    comparer.add_argument('baseline')
+    comparer.add_argument('current')
+    comparer.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare_files(args))
+
+
+if __name__ == '__main__':
+    main()
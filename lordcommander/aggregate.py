@@ -0,0 +1,220 @@
+"""
+---------------------------------------------------------------------
+aggregate.py
+---------------------------------------------------------------------
+This module collapses identical output of many instances, like
+`dshbak -c` does. The output of every instance is captured instead
+of being printed, and instances whose output and exit code are the
+same are grouped by the digest of the output. At the end every
+distinct output is printed once, along with the indices of the
+instances that produced it.
+
+Only one copy of each distinct output is kept. A capture stays in
+memory up to SPILL_SIZE bytes, and while the captures of all the
+instances together stay under MEMORY_SIZE, and is moved to a file
+of its own beyond that. The file is only open while the instance is
+running and is opened again to print it, so neither memory nor file
+descriptors grow with the number of distinct outputs.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from lordcommander.executor import forward
+from lordcommander.output import Output
+
+# Bytes of output of an instance kept in memory before it goes to a temporary file
+SPILL_SIZE = 64 * 1024
+# Bytes of output of all the instances kept in memory at once
+MEMORY_SIZE = 16 * 1024 * 1024
+# Names of the instances shown above an output before they are cut short
+NAMES_SHOWN = 10
+
+
+def ranges(indices):
+    """
+    Write the indices compactly, e.g. 0-3,5,7-9.
+    :param indices: Iterable of integers
+    :return: str
+    """
+    parts = []
+    for index in sorted(indices):
+        if parts and parts[-1][1] == index - 1:
+            parts[-1][1] = index
+        else:
+            parts.append([index, index])
+    return ','.join(str(first) if first == last else "%d-%d" % (first, last) for first, last in parts)
+
+
+class Capture:
+    """
+    Output of a single instance, both streams in the order they were written.
+    """
+
+    def __init__(self, aggregator=None):
+        """
+        :param aggregator: Aggregator keeping count of the output held in memory (optional)
+        """
+        self._aggregator = aggregator
+        self._buffer = bytearray()
+        # The file the output is moved to, open only while more may come
+        self._path = None
+        self._file = None
+
+    def __call__(self, stream, chunk):
+        if self._path is not None:
+            self._file.write(chunk)
+            return
+        self._buffer += chunk
+        crowded = self._aggregator is not None and self._aggregator.hold(len(chunk))
+        if len(self._buffer) > SPILL_SIZE or crowded:
+            self._spill()
+
+    @property
+    def spilled(self):
+        return self._path is not None
+
+    def _spill(self):
+        directory = self._aggregator.directory() if self._aggregator is not None else None
+        fd, self._path = tempfile.mkstemp(prefix='capture-', dir=directory)
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write(self._buffer)
+        self._release()
+
+    def _release(self):
+        if self._aggregator is not None:
+            self._aggregator.release(len(self._buffer))
+        self._buffer = bytearray()
+
+    def finish(self):
+        """No more output is coming, let go of the file until it is printed"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def dump(self, stream):
+        """Copy the captured output to a text stream like sys.stdout"""
+        if self._path is None:
+            if self._buffer:
+                forward(stream, bytes(self._buffer))
+            return
+        self.finish()
+        with open(self._path, 'rb') as captured:
+            for chunk in iter(lambda: captured.read(65536), b''):
+                forward(stream, chunk)
+
+    def close(self):
+        self.finish()
+        self._release()
+        if self._path is not None:
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+            self._path = None
+
+
+class Aggregator:
+    """
+    Groups instances by their output, safe to use from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Groups by the digest of the output and the exit code
+        self._groups = {}
+        # Bytes of output of the captures held in memory
+        self._held = 0
+        self._directory = None
+
+    def open(self, index, name):
+        """
+        Start capturing the output of an instance.
+        :return: Capture, the sink of its output
+        """
+        return Capture(self)
+
+    def hold(self, size):
+        """
+        Account output kept in memory by a capture.
+        :return: Whether more is held than MEMORY_SIZE, so the capture should move to a file
+        """
+        with self._lock:
+            self._held += size
+            return self._held > MEMORY_SIZE
+
+    def release(self, size):
+        """Account output no longer kept in memory by a capture"""
+        with self._lock:
+            self._held -= size
+
+    def directory(self):
+        """Temporary directory of the captures moved to files, created when first needed"""
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='lc-aggregate-')
+            return self._directory
+
+    def add(self, index, name, result, capture):
+        """
+        Add the outcome of an instance, the capture is kept only if its output is new.
+        :param index: Index of the instance
+        :param name: Name of the instance
+        :param result: ExecutionResult
+        :param capture: Capture of the output of the instance
+        """
+        key = (result.output.hexdigest() if result.output is not None else None,
+               result.returncode, result.timed_out)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                self._groups[key] = {'capture': capture, 'result': result, 'members': [(index, name)]}
+            else:
+                group['members'].append((index, name))
+        if group is None:
+            capture.finish()
+        else:
+            capture.close()
+
+    def __len__(self):
+        return len(self._groups)
+
+    def show(self, stream=None):
+        """Print every distinct output once, in the order of the first instance producing it"""
+        stream = stream if stream is not None else sys.stdout
+        groups = sorted(self._groups.values(), key=lambda group: min(group['members']))
+        for group in groups:
+            result = group['result']
+            members = sorted(group['members'])
+            names = [name for _, name in members[:NAMES_SHOWN]]
+            if len(members) > NAMES_SHOWN:
+                names.append("and %d more" % (len(members) - NAMES_SHOWN))
+            if result.timed_out:
+                status = Output.colorize("timed out", Output.DANGER)
+            else:
+                status = Output.colorize("exited with %s" % result.returncode,
+                                         Output.SUCCESS if result.succeeded else Output.DANGER)
+            print('-' * 40)
+            Output.write("%s %s %s" % (
+                Output.colorize("[%s]" % ranges(index for index, _ in members), Output.WARNING),
+                Output.colorize("%d directories," % len(members), Output.INFO), status))
+            Output.muted(', '.join(names))
+            print('-' * 40)
+            group['capture'].dump(stream)
+            group['capture'].close()
+        self._groups.clear()
+
+    def close(self):
+        """Throw away the captures not shown and their files"""
+        for group in self._groups.values():
+            group['capture'].close()
+        self._groups.clear()
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
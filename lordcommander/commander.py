@@ -9,16 +9,12 @@ Version: 5.x
 License: GNU General Public License 3
 """
 
+import contextlib
 import os
-import shelve
+import sys
 
-from appdirs import user_data_dir
-from fire import Fire
-
-from .controllers import CommandController, DirectoryController, ProjectController
 from .lcex import ActiveProjectNotSetException
 from .output import Output
-from .utils import Utils
 
 
 class LordCommander:
@@ -26,21 +22,65 @@ class LordCommander:
     🐈 Run shell commands recursively throughout the predefined directories.
     """
     
-    def __init__(self, lcdb):
-        try:
-            # self._lcdb = self._read_data()
-            self._lcdb = lcdb
-            self._active = self._find_active()
-            self.proj = ProjectController(self._lcdb)
-            self.utils = Utils(self._lcdb, self._active)
-            self.dirs = DirectoryController(
-                self._active['instances'] if 'instances' in self._active else None)
-        except IOError as error:
-            Output.danger(error)
+    def __init__(self, lcdb, owns_store=True):
+        # lcdb is either an opened store or a callable opening it on first use
+        self._store = lcdb
+        self._owns_store = owns_store
+        self._controllers = {}
     
     def __del__(self):
-        # Close the shelve module
-        self._lcdb.close()
+        self._close()
+    
+    def _close(self):
+        """Close the store if it has ever been opened, pending changes are written back"""
+        if self._store is None or callable(self._store):
+            return
+        if self._owns_store:
+            self._store.close()
+        elif hasattr(self._store, 'sync'):
+            self._store.sync()
+        self._store = None
+    
+    @property
+    def _lcdb(self):
+        if callable(self._store):
+            self._store = self._store()
+        return self._store
+    
+    def _lazy(self, name, build):
+        """Build a controller the first time its subcommand is used"""
+        if name not in self._controllers:
+            self._controllers[name] = build()
+        return self._controllers[name]
+    
+    @property
+    def _active(self):
+        return self._lazy('active', self._find_active)
+    
+    @property
+    def daemon(self):
+        from .daemon import DaemonController
+        return self._lazy('daemon', lambda: DaemonController(create_data_dir()))
+    
+    # Controllers are imported on demand to keep the start up fast
+    
+    @property
+    def proj(self):
+        from .controllers import ProjectController
+        return self._lazy('proj', lambda: ProjectController(self._lcdb))
+    
+    @property
+    def utils(self):
+        from .utils import Utils
+        return self._lazy('utils', lambda: Utils(self._lcdb, self._active))
+    
+    @property
+    def dirs(self):
+        from .controllers import DirectoryController
+        from .index import InstanceIndex
+        return self._lazy('dirs', lambda: DirectoryController(
+            InstanceIndex(self._active['instances']) if 'instances' in self._active else None,
+            self._active.get('root')))
     
     def _find_active(self):
         """
@@ -49,56 +89,384 @@ class LordCommander:
         """
         return self._lcdb['projects'][self._lcdb['active']] if self._lcdb['active'] != '' else {}
     
-    def run(self, command, li=0, ui=None, ex=(), inc=()):
+    def run(self, command=None, li=0, ui=None, ex=(), inc=(), jobs=1, stream=False, failed=False, resume=False,
+            timeout=None, total_timeout=None, shard=None, balance=False, adaptive=False, dry_run=False,
+            canary=0, wave=None, max_failures=None, aggregate=False, logdir=None, log_limit=None,
+            compress=False, exec_=False, pool=False, script=None, step=(), output='text', metrics_file=None,
+            metrics_interval=None):
         """
         Run a command.
-        :param command: The command to run
+        :param command: The command to run, the first step if there are more (optional with steps)
         :param li: Lower index (optional)
         :param ui: Upper index (optional)
         :param ex: Tuple of indices to exclude during execution (optional)
         :param inc: Tuple of indices to include only during execution (optional)
+        :param jobs: Number of instances to run concurrently, 'auto' uses CPU count (optional)
+        :param stream: Prefix every line of output with the instance it came from (optional)
+        :param failed: Only run the instances where the command has last failed (optional)
+        :param resume: Only run what is left of the last interrupted run of the command (optional)
+        :param timeout: Seconds after which the command is killed in a directory (optional)
+        :param total_timeout: Seconds after which the whole run is stopped (optional)
+        :param shard: Only run the K-th of N shards of the selected directories, given as K/N (optional)
+        :param balance: Split the shards by past durations of the command instead of by name (optional)
+        :param adaptive: Run fewer than --jobs at once while the machine is busy (optional)
+        :param dry_run: Only show the order of the directories and the predicted run time (optional)
+        :param canary: Number of directories to run first, the rest only run if all of them succeed (optional)
+        :param wave: Number of directories to run at once after the canary (optional)
+        :param max_failures: Number of failures after which no more directories are started (optional)
+        :param aggregate: Print identical output of the directories only once, at the end (optional)
+        :param logdir: Write the output of every directory to its own files in here (optional)
+        :param log_limit: Bytes of stdout and of stderr written at most to the files of a directory (optional)
+        :param compress: Compress the log files with gzip once a directory is done (optional)
+        :param exec_: Run a plain command straight, without starting a shell for every directory (optional)
+        :param pool: Run the command in long-lived shells instead of starting one for every directory (optional)
+        :param script: File of commands, one per line, run one after another in every directory (optional)
+        :param step: Command or list of commands run after the command in every directory (optional)
+        :param output: 'text' for people or 'jsonl' for an event per line for other programs (optional)
+        :param metrics_file: Write the metrics of the run to this file in the OpenMetrics format (optional)
+        :param metrics_interval: Seconds between two writes of the metrics file during the run (optional)
+        """
+        events = None
+        # Only the events go to stdout, the messages and the output of the command to stderr
+        quiet = contextlib.nullcontext()
+        if output == 'jsonl':
+            from .events import EventStream
+            events = EventStream(sys.stdout)
+            quiet = contextlib.redirect_stdout(sys.stderr)
+        with quiet:
+            try:
+                if not self._active:
+                    raise ActiveProjectNotSetException(
+                        "May be no active project has been set. Please check.")
+                # Convert ex to tuple if only a single digit is inputted
+                ex = ex if isinstance(ex, tuple) else tuple([ex])
+                inc = inc if isinstance(inc, tuple) else tuple([inc])
+                if not ex == () and not inc == ():
+                    raise SyntaxError("You can not use --ex and --inc together.")
+                if failed and resume:
+                    raise SyntaxError("You can not use --failed and --resume together.")
+                if output not in ('text', 'jsonl'):
+                    raise SyntaxError("Output should be either 'text' or 'jsonl'.")
+                if output == 'jsonl' and (stream or aggregate or dry_run):
+                    raise SyntaxError("You can not use --output=jsonl with --stream, --aggregate or --dry-run.")
+                if pool and (stream or exec_):
+                    raise SyntaxError("You can not use --pool with --stream or --exec_.")
+                # Steps of a script run one after another in every directory
+                step = list(step) if isinstance(step, (tuple, list)) else [step]
+                steps = ([command] if command is not None else []) + [str(cmd) for cmd in step]
+                if script is not None:
+                    from .script import read_script
+                    steps += read_script(str(script))
+                if not steps:
+                    raise SyntaxError("Please provide a command to run.")
+                if len(steps) > 1 or script is not None:
+                    if stream:
+                        raise SyntaxError("You can not stream the output of a script.")
+                    from .script import Script
+                    command = Script(steps)
+                else:
+                    command = steps[0]
+                from .controllers import CommandController
+                from .history import RunHistory
+                history = RunHistory(create_data_dir())
+                selection = {'li': li, 'ui': ui, 'ex': list(ex), 'inc': list(inc), 'jobs': jobs, 'stream': stream,
+                             'timeout': timeout, 'total_timeout': total_timeout, 'adaptive': adaptive,
+                             'canary': canary, 'wave': wave, 'max_failures': max_failures, 'aggregate': aggregate,
+                             'logdir': logdir, 'exec': exec_, 'pool': pool}
+                if failed or resume:
+                    retry = self._retry(history, command, li, ui, ex, inc, resume)
+                    if retry is None:
+                        return
+                    inc, resumed_from = retry
+                    li, ui, ex = 0, None, ()
+                    selection.update(li=li, ui=ui, ex=[], inc=list(inc), failed=failed)
+                    if resumed_from is not None:
+                        selection['resumed_from'] = resumed_from
+                if shard is not None:
+                    number, shards = self._shards(history, command, shard, li, ui, ex, inc, balance)
+                    inc = tuple(position for position, _ in shards[number - 1])
+                    if not inc:
+                        Output.success("Shard %d/%d has no directories to run." % (number, len(shards)))
+                        return
+                    li, ui, ex = 0, None, ()
+                    selection.update(li=li, ui=ui, ex=[], inc=list(inc), shard="%d/%d" % (number, len(shards)),
+                                     balance=balance)
+                # Past durations put the longest first when several run at once
+                durations = history.durations(self._lcdb['active'], command) \
+                    if jobs != 1 or stream or dry_run else None
+                if dry_run:
+                    CommandController().preview(self._active, command, li, ui, ex, inc, jobs, durations)
+                    return
+                if exec_:
+                    from .executor import DirectCommand
+                    if getattr(command, 'steps', None) is not None:
+                        command.steps = [DirectCommand(cmd) for cmd in command.steps]
+                    else:
+                        command = DirectCommand(command)
+                spool = None
+                if logdir is not None:
+                    if log_limit is not None and (isinstance(log_limit, bool) or not isinstance(log_limit, int)
+                                                  or log_limit < 0):
+                        raise ValueError("Log limit should be a non-negative number of bytes.")
+                    from .spool import LogSpool
+                    try:
+                        spool = LogSpool(str(logdir), log_limit, compress, quiet=output == 'jsonl')
+                    except OSError as error:
+                        raise ValueError("Logs can't be written to %s: %s" % (logdir, error.strerror))
+                metrics = None
+                if metrics_file is not None:
+                    if metrics_interval is not None and (isinstance(metrics_interval, bool) or
+                                                         not isinstance(metrics_interval, (int, float))
+                                                         or metrics_interval <= 0):
+                        raise ValueError("Metrics interval should be a positive number of seconds.")
+                    from .metrics import RunMetrics
+                    metrics = RunMetrics(str(metrics_file), self._lcdb['active'], command, metrics_interval)
+                recorder = history.begin(self._lcdb['active'], command, selection)
+                executor = None
+                if pool:
+                    from .pool import ShellPool
+                    executor = ShellPool()
+                if getattr(command, 'steps', None) is not None:
+                    from .executor import Executor
+                    from .script import StepExecutor
+                    executor = StepExecutor(executor or Executor())
+                try:
+                    cc = CommandController(executor=executor, recorder=recorder, events=events, metrics=metrics)
+                    cc.run(self._active, command, li, ui, ex, inc, jobs, stream, timeout, total_timeout,
+                           adaptive, durations, canary=canary, wave=wave, max_failures=max_failures,
+                           aggregate=aggregate, spool=spool)
+                finally:
+                    if executor is not None:
+                        executor.close()
+            except (ActiveProjectNotSetException, SyntaxError, ValueError) as error:
+                Output.danger(error)
+                if events is not None:
+                    events.error(error)
+            except KeyboardInterrupt:
+                # The commands running have been stopped and the summary shown by now
+                Output.danger("Interrupted! What is left can be run with --resume.")
+                sys.exit(130)
+    
+    def plan(self, shard, command=None, li=0, ui=None, ex=(), inc=(), balance=False):
+        """
+        Show which directories a shard would run.
+        :param shard: The shard given as K/N
+        :param command: The command whose past durations balance the shards (optional)
+        :param li: Lower index (optional)
+        :param ui: Upper index (optional)
+        :param ex: Tuple of indices to exclude during execution (optional)
+        :param inc: Tuple of indices to include only during execution (optional)
+        :param balance: Split the shards by past durations instead of by name (optional)
         """
         try:
             if not self._active:
                 raise ActiveProjectNotSetException(
                     "May be no active project has been set. Please check.")
-            # Convert ex to tuple if only a single digit is inputted
             ex = ex if isinstance(ex, tuple) else tuple([ex])
             inc = inc if isinstance(inc, tuple) else tuple([inc])
             if not ex == () and not inc == ():
                 raise SyntaxError("You can not use --ex and --inc together.")
-            cc = CommandController()
-            cc.run(self._active, command, li, ui, ex, inc)
+            from .history import RunHistory
+            history = RunHistory(create_data_dir())
+            number, shards = self._shards(history, command, shard, li, ui, ex, inc, balance)
+            durations = history.durations(self._lcdb['active'], command) if balance else {}
+            
+            Output.info("Listing directories of shard %d/%d..." % (number, len(shards)))
+            print("\n".join("- {} ({})".format(name, position) for position, name in shards[number - 1]))
+            print("\n")
+            for current, members in enumerate(shards, 1):
+                estimate = sum(durations.get(name, 0) for _, name in members)
+                Output.write("%s shard %d/%d: %d directories%s" % (
+                    '>' if current == number else ' ', current, len(shards), len(members),
+                    Output.colorize(" (~%.2fs)" % estimate, Output.MUTED) if balance else ''))
         except ActiveProjectNotSetException as error:
             Output.danger(error)
         except SyntaxError as error:
             Output.danger(error)
+        except (TypeError, ValueError) as error:
+            Output.danger(error)
+    
+    def _shards(self, history, command, shard, li, ui, ex, inc, balance):
+        """
+        Split the selected instances into shards.
+        :return: Tuple of the number of the shard asked for and the list of
+                 (index, name) pairs in each shard
+        """
+        from .index import InstanceIndex
+        from .shard import parse, split
+        number, count = parse(shard)
+        selected = InstanceIndex.of(self._active['instances']).select(li, ui, ex, inc)
+        durations = history.durations(self._lcdb['active'], command) if balance else None
+        shard_of = {}
+        for current, names in enumerate(split([name for _, name in selected], count, durations)):
+            shard_of.update(dict.fromkeys(names, current))
+        shards = [[] for _ in range(count)]
+        for position, name in selected:
+            shards[shard_of[name]].append((position, name))
+        return number, shards
+    
+    def _retry(self, history, command, li, ui, ex, inc, resume):
+        """
+        Find the instances to run again from the history of the command,
+        narrowed down by the given selection.
+        :return: Tuple of the indices to include and the ID of the run being
+                 resumed, or None if there is nothing to run
+        """
+        from .index import InstanceIndex
+        index = InstanceIndex.of(self._active['instances'])
+        project = self._lcdb['active']
+        resumed_from = None
+        if resume:
+            unfinished = history.unfinished(project, command)
+            if unfinished is None:
+                Output.danger("No interrupted run of '%s' has been found." % command)
+                return None
+            original, done, resumed_from = unfinished
+            wanted = {name for _, name in index.select(
+                original.get('li', 0), original.get('ui'), original.get('ex', ()), original.get('inc', ()))}
+            wanted.difference_update(done)
+        else:
+            wanted = history.failed(project, command)
+        indices = tuple(position for position, name in index.select(li, ui, ex, inc) if name in wanted)
+        if not indices:
+            Output.success("Nothing is left to run for '%s'." % command)
+            return None
+        return indices, resumed_from
+    
+    def history(self, run=None, limit=20):
+        """
+        Show recent runs, or the instances of a run along with their exit codes.
+        :param run: ID of the run (optional)
+        :param limit: Number of most recent runs to list (optional)
+        """
+        from .history import RunHistory
+        RunHistory(create_data_dir()).view(run, limit)
 
 
 def create_data_dir():
     """Create the data directory."""
+    from appdirs import user_data_dir
     data_dir = user_data_dir('LordCommander')
     if not os.path.exists(data_dir):
         os.mkdir(data_dir)
     return data_dir
 
 
-def read_data():
+def read_data(backend=None):
     """
-    Load the shelve module and create expected structure if necessary.
-    :return: shelve
+    Open the store and create expected structure if necessary.
+    The backend is taken from LORDCOMMANDER_STORAGE environment variable,
+    'sqlite' by default or 'shelve' for the legacy store.
+    :param backend: Either 'sqlite' or 'shelve' (optional)
+    :return: SqliteStore | shelve
     """
+    from .storage import SQLITE, open_store
     data_dir = create_data_dir()
-    # Setting writeback mode to True to persist changes.
-    lcdb = shelve.open(data_dir + '/lcdb', writeback=True)
-    if not all(key in lcdb.keys() for key in ['active', 'projects']):
-        lcdb['active'] = ''
-        lcdb['projects'] = {}
-    
-    return lcdb
+    backend = backend or os.environ.get('LORDCOMMANDER_STORAGE', SQLITE)
+    return open_store(data_dir, backend)
+
+
+# Frequently called read-only commands answered without loading Fire,
+# anything else, including --help, goes through Fire as usual.
+FAST_COMMANDS = {
+    ('proj', 'view'): lambda lc: lc.proj.view(),
+    ('dirs', 'view'): lambda lc: lc.dirs.view(),
+    ('dirs', 'view', '--sort'): lambda lc: lc.dirs.view(sort=True),
+    ('dirs', 'check'): lambda lc: lc.dirs.check(),
+    ('utils', 'total'): lambda lc: lc.utils.total(),
+    ('history',): lambda lc: lc.history(),
+}
+
+
+def gather_steps(argv):
+    """
+    Pass every --step of run on to Fire as a single list, it would keep only the last one.
+    :param argv: Command line arguments without the program name
+    :return: list
+    """
+    if argv[:1] != ['run']:
+        return list(argv)
+    import ast
+    steps, rest, flags = [], [], 0
+    position = 1
+    while position < len(argv):
+        argument = argv[position]
+        if argument == '--':
+            # The rest are the flags of Fire itself
+            break
+        position += 1
+        if argument == '--step' or argument.startswith('--step='):
+            if '=' in argument:
+                value = argument.partition('=')[2]
+            elif position < len(argv) and not argv[position].startswith('-'):
+                value = argv[position]
+                position += 1
+            else:
+                # A bare --step, left to Fire
+                return list(argv)
+            flags += 1
+            try:
+                parsed = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                parsed = value
+            steps.extend(parsed if isinstance(parsed, (list, tuple)) else [value])
+        else:
+            rest.append(argument)
+    if flags < 2:
+        return list(argv)
+    return [argv[0]] + rest + ['--step=%r' % [str(step) for step in steps]] + list(argv[position:])
+
+
+def fast_command(argv):
+    """
+    Find the fast command matching the arguments.
+    :param argv: Command line arguments without the program name
+    :return: A callable taking the LordCommander instance or None
+    """
+    argv = tuple(argv)
+    if argv in FAST_COMMANDS:
+        return FAST_COMMANDS[argv]
+    if len(argv) == 3 and argv[:2] == ('utils', 'search') and not argv[2].startswith('-'):
+        return lambda lc: lc.utils.search(argv[2])
+    return None
+
+
+def execute(argv, lcdb, owns_store=True):
+    """
+    Run a command line in this process.
+    :param argv: Command line arguments without the program name
+    :param lcdb: An opened store or a callable opening it
+    :param owns_store: Close the store afterwards, else only sync it (optional)
+    """
+    commander = LordCommander(lcdb, owns_store)
+    try:
+        command = fast_command(argv)
+        if command is not None:
+            command(commander)
+        else:
+            from fire import Fire
+            Fire(commander, command=gather_steps(argv), name='lc')
+    finally:
+        commander._close()
 
 
 def main(db=None):
-    if db is None:
-        lcdb = read_data()
-    Fire(LordCommander(lcdb))
+    argv = sys.argv[1:]
+    profiler = None
+    if any(argument == '--profile' or argument.startswith('--profile=') for argument in argv):
+        from .profiler import profile_argument
+        argv, profiler = profile_argument(argv)
+        profiler.install()
+    if profiler is None and db is None and argv[:1] != ['daemon'] \
+            and not os.environ.get('LORDCOMMANDER_NO_DAEMON'):
+        # Let a running daemon do the work, fall back to this process otherwise
+        from .daemon import forward
+        status = forward(create_data_dir(), argv)
+        if status is not None:
+            sys.exit(status)
+    try:
+        # The store is opened only when a command needs it
+        execute(argv, read_data if db is None else db)
+    finally:
+        if profiler is not None:
+            profiler.finish()
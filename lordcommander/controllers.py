@@ -15,12 +15,13 @@ License: GNU General Public License 3
 """
 
 import os
+import time
 from pathlib import Path
 
-from colr import color
-
+from lordcommander.index import InstanceIndex
 from lordcommander.lcex import *
 from lordcommander.output import Output
+from lordcommander.preflight import MISSING, NOT_A_DIRECTORY, DirectoryCache
 
 
 class DirectoryController:
@@ -28,9 +29,12 @@ class DirectoryController:
     Add, view, or delete directories/instances.
     """
     
-    def __init__(self, instances):
-        # instances is a list of module where all directory names are listed.
-        self._instances = instances
+    def __init__(self, instances, root=None):
+        # instances is a list of module where all directory names are listed,
+        # it is wrapped by an index to avoid scanning the list on every lookup.
+        self._instances = InstanceIndex.of(instances) if instances is not None else None
+        # root is the directory of the project holding the instances
+        self._root = root
     
     def add(self, *args):
         """
@@ -50,8 +54,7 @@ class DirectoryController:
                 (filter(lambda dir: isinstance(dir, str), args)))
             
             # Append new directories to the list, no redundant value will exist
-            self._instances.extend(
-                [ins for ins in directories if ins not in self._instances])
+            self._instances.extend(directories)
         
         except ArgumentNotProvidedException as error:
             Output.danger(error)
@@ -72,11 +75,34 @@ class DirectoryController:
                     "May be no active project has been set. Please check.")
             
             Output.info('Listing directories...')
-            directories = self._instances.copy()
-            for directory in sorted(directories) if sort else directories:
-                print("- {} ({})".format(directory, directories.index(directory)))
+            print("\n".join("- {} ({})".format(directory, index)
+                            for index, directory in self._instances.items(sort)))
             print("\n")
-            Output.normal("Total %d directories listed." % len(directories))
+            Output.normal("Total %d directories listed." % len(self._instances))
+        except ActiveProjectNotSetException as error:
+            Output.danger(error)
+    
+    def check(self):
+        """
+        Report directories/instances of the active project which are missing or not a directory.
+        """
+        try:
+            if self._instances is None or self._root is None:
+                raise ActiveProjectNotSetException(
+                    "May be no active project has been set. Please check.")
+            
+            Output.info('Checking directories...')
+            directories = DirectoryCache(self._root)
+            states = ((index, directory, directories.state(directory))
+                      for index, directory in self._instances.items())
+            stale = [(index, directory, state) for index, directory, state in states
+                     if state in (MISSING, NOT_A_DIRECTORY)]
+            for index, directory, state in stale:
+                print("- {} ({}): {}".format(directory, index, Output.colorize(state, Output.DANGER)))
+            if stale:
+                Output.danger("%d of %d directories are stale." % (len(stale), len(self._instances)))
+            else:
+                Output.success("All %d directories are present." % len(self._instances))
         except ActiveProjectNotSetException as error:
             Output.danger(error)
     
@@ -117,9 +143,10 @@ class DirectoryController:
                     Output.danger(
                         f"{key} is not found in the list! Skipping...")
                     continue
-                
                 Output.warning(f"Removing {key}...")
-                self._instances.remove(key)
+            
+            # Remove all of them in a single pass over the list
+            if self._instances.remove(keys):
                 Output.success('Success!')
             self.view()
         
@@ -136,18 +163,82 @@ class CommandController:
     Stirs the command executor.
     """
     
+    def __init__(self, executor=None, recorder=None, events=None, metrics=None):
+        if executor is None:
+            from lordcommander.executor import Executor
+            executor = Executor()
+        self._executor = executor
+        # RunRecorder keeping the history of the run, if any
+        self._recorder = recorder
+        # EventStream taking the place of the messages, if any
+        self._events = events
+        # RunMetrics written for a metrics collector, if any
+        self._metrics = metrics
+    
+    def _start(self, index, instance):
+        if self._events is not None:
+            self._events.start(index, instance)
+    
+    def _record(self, index, instance, result=None, state=None):
+        if self._recorder is not None:
+            self._recorder.record(index, instance, result, state)
+        if self._events is not None:
+            self._events.finish(index, instance, result, state)
+    
     def _get_instances(self, project, li, ui, ex, inc):
         """First, apply li and ui to slice instances/directories,
         then filter out by excluding according to ex or
-        including according to inc"""
-        if inc == ():
-            return [ins for ins in project['instances'][li:ui]
-                    if project['instances'].index(ins) not in ex]
-        else:
-            return [ins for ins in project['instances'][li:ui]
-                    if project['instances'].index(ins) in inc]
+        including according to inc. Returns (index, name) pairs"""
+        return InstanceIndex.of(project['instances']).select(li, ui, ex, inc)
+    
+    def _resolve_jobs(self, jobs):
+        """Turn the jobs argument into a positive worker count,
+        'auto' stands for the number of available CPUs"""
+        if jobs == 'auto':
+            return os.cpu_count() or 1
+        if isinstance(jobs, bool) or not isinstance(jobs, int) or jobs < 1:
+            raise ValueError("Number of jobs should be a positive integer or 'auto'.")
+        return jobs
+    
+    def _check_timeout(self, timeout):
+        """A timeout is either None or a positive number of seconds"""
+        if timeout is None:
+            return None
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError("Timeout should be a positive number of seconds.")
+        return timeout
+    
+    def _check_rollout(self, canary, wave, max_failures):
+        """Whether the run goes in waves, the numbers are checked along the way"""
+        for value, message, minimum in ((canary, "Canary", 0), (wave, "Wave", 1),
+                                        (max_failures, "Maximum number of failures", 1)):
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+                raise ValueError("%s should be a %s integer." % (
+                    message, 'positive' if minimum else 'non-negative'))
+        return bool(canary) or wave is not None or max_failures is not None
+    
+    def _tally(self, result):
+        """Count the outcome of an instance, None if it could not be started"""
+        with self._tally_lock:
+            if result is not None and result.timed_out:
+                self._counts['timed_out'] += 1
+            elif result is not None and result.succeeded:
+                self._counts['succeeded'] += 1
+            else:
+                self._counts['failed'] += 1
+            if self._metrics is not None:
+                self._metrics.observe(result, self._counts)
     
-    def run(self, project, cmd, li=0, ui=None, ex=(), inc=()):
+    def _concurrency(self, peak):
+        """Account the most instances that have been running at once"""
+        if self._metrics is not None:
+            self._metrics.concurrency(peak)
+    
+    def run(self, project, cmd, li=0, ui=None, ex=(), inc=(), jobs=1, stream=False,
+            timeout=None, total_timeout=None, adaptive=False, durations=None,
+            canary=0, wave=None, max_failures=None, aggregate=False, spool=None):
         """
         Run the command.
         :param project: The active project dictionary
@@ -156,18 +247,54 @@ class CommandController:
         :param ui: Upper index (optional)
         :param ex: Tuple of indices to exclude during execution (optional)
         :param inc: Tuple of indices to include only during execution (optional)
+        :param jobs: Number of instances to run concurrently or 'auto' (optional)
+        :param stream: Stream the output line by line prefixed with the instance (optional)
+        :param timeout: Seconds after which the command is killed in an instance (optional)
+        :param total_timeout: Seconds after which the whole run is stopped (optional)
+        :param adaptive: Run fewer than jobs at once while the machine is busy (optional)
+        :param durations: Dictionary of past durations by instance name, the longest
+                          are started first when running concurrently (optional)
+        :param canary: Number of instances to run first, the rest only run if all of them succeed (optional)
+        :param wave: Number of instances to run at once after the canary (optional)
+        :param max_failures: Number of failures after which no more instances are started (optional)
+        :param aggregate: Print identical output of the instances only once, at the end (optional)
+        :param spool: LogSpool writing the output of every instance to its own files (optional)
         """
+        from threading import Lock
+        self._counts = {'succeeded': 0, 'failed': 0, 'timed_out': 0}
+        self._tally_lock = Lock()
+        completed = False
+        started = time.monotonic()
+        if self._metrics is not None:
+            self._metrics.start()
         try:
-            succeeded = 0
-            failed = 0
+            jobs = self._resolve_jobs(jobs)
+            timeout = self._check_timeout(timeout)
+            total_timeout = self._check_timeout(total_timeout)
+            deadline = time.monotonic() + total_timeout if total_timeout is not None else None
+            rollout = self._check_rollout(canary, wave, max_failures)
+            if aggregate and (stream or rollout):
+                raise ValueError("You can not aggregate the output of a streamed or rolled out run.")
+            if spool is not None and (stream or aggregate):
+                raise ValueError("You can not log the output of a streamed or aggregated run to files.")
+            if self._events is not None and (stream or aggregate):
+                raise ValueError("You can not write the events of a streamed or aggregated run.")
             instance_root = Path(project['root'])
             instances = self._get_instances(project, li, ui, ex, inc)
             if len(instances) <= 0:
                 Output.danger("No instances has been found in the list.")
             
-            for instance in instances:
+            # Look at the project root once instead of every instance
+            checking = time.perf_counter()
+            directories = DirectoryCache(instance_root)
+            preflight = time.perf_counter() - checking
+            runnable = []
+            for index, instance in instances:
+                checking = time.perf_counter()
+                state = directories.state(instance)
+                preflight += time.perf_counter() - checking
                 # If a directory is missing, tell the user
-                if not os.path.exists(instance_root.joinpath(instance)):
+                if state == MISSING:
                     print("\n")
                     Output.write([
                         {'text': 'Directory', 'code': Output.DANGER},
@@ -175,57 +302,373 @@ class CommandController:
                         {'text': 'is not found! Skipping...',
                          'code': Output.DANGER}
                     ])
-                    failed += 1
+                    self._record(index, instance, state=state)
+                    self._tally(None)
                     continue
                 
                 # Omit if not a directory
-                if not os.path.isdir(instance_root.joinpath(instance)):
+                if state == NOT_A_DIRECTORY:
                     print("\n")
                     Output.write([
                         {'text': f"'{instance}'", 'code': Output.WARNING},
                         {'text': 'is not a instance. Skipping...',
                          'code': Output.INFO}
                     ])
-                    failed += 1
+                    self._record(index, instance, state=state)
+                    self._tally(None)
                     continue
                 
-                self.execute(cmd, instance_root.joinpath(instance))
-                succeeded += 1
+                instance_path = instance_root.joinpath(instance)
+                if jobs == 1 and not stream and not rollout and not aggregate and spool is None:
+                    self._start(index, instance)
+                    self._concurrency(1)
+                    result = self.execute(cmd, instance_path, timeout, deadline)
+                    self._record(index, instance, result)
+                    self._tally(result)
+                else:
+                    runnable.append((index, instance, instance_path))
+            if self._metrics is not None:
+                self._metrics.preflight = preflight
+            
+            finished = True
+            if runnable and rollout:
+                finished = self.execute_waves(cmd, runnable, jobs, stream, timeout, deadline,
+                                              canary, wave, max_failures, spool)
+            elif runnable:
+                from lordcommander.scheduler import AdaptiveLimit, longest_first
+                runnable = longest_first(runnable, durations or {})
+                limit = AdaptiveLimit(jobs) if adaptive else jobs
+                if stream:
+                    self.execute_streaming(cmd, runnable, limit, timeout, deadline)
+                elif aggregate:
+                    self.execute_aggregated(cmd, runnable, limit, timeout, deadline)
+                else:
+                    self.execute_parallel(cmd, runnable, limit, timeout, deadline, collector=spool)
+            if spool is not None:
+                spool.summary()
+            # A stopped rollout is left for 'lc run --resume'
+            completed = finished
         
         except TypeError:
             Output.danger("Please provide valid integers!")
+        except ValueError as error:
+            Output.danger(error)
         finally:
-            # Show the statistics
+            counts = self._counts
+            if self._metrics is not None:
+                try:
+                    self._metrics.finish(completed)
+                except OSError as error:
+                    Output.danger("Metrics can't be written to %s: %s" % (self._metrics.path, error.strerror))
+            if self._events is not None:
+                self._events.summary(cmd, counts, completed, time.monotonic() - started)
+            else:
+                # Show the statistics
+                summary = [
+                    {'text': f"\nSuccessful run:", 'code': ''},
+                    {'text': counts['succeeded'], 'code': Output.SUCCESS},
+                    {'text': f"\nFailed run:", 'code': ''},
+                    {'text': counts['failed'], 'code': Output.DANGER}
+                ]
+                if timeout is not None or total_timeout is not None:
+                    summary += [
+                        {'text': f"\nTimed out run:", 'code': ''},
+                        {'text': counts['timed_out'], 'code': Output.WARNING}
+                    ]
+                Output.write(summary)
+            if self._recorder is not None:
+                self._recorder.finish(counts['succeeded'], counts['failed'], completed,
+                                      counts['timed_out'])
+    
+    def _announce(self, cmd, instance_path):
+        """Tell the user where the command is about to run"""
+        if self._events is not None:
+            return
+        print('\n')
+        Output.write([
+            {'text': 'Changed directory to',
+             'code': Output.INFO},
+            {'text': f"'{instance_path}'",
+             'code': Output.WARNING},
+            {'text': "and running", 'code': Output.INFO},
+            {'text': f"'{cmd}'", 'code': Output.WARNING}
+        ])
+    
+    def _report(self, result):
+        """Show how the command ended in an instance"""
+        if self._events is not None:
+            return
+        if result.timed_out:
             Output.write([
-                {'text': f"\nSuccessful run:", 'code': ''},
-                {'text': succeeded, 'code': Output.SUCCESS},
-                {'text': f"\nFailed run:", 'code': ''},
-                {'text': failed, 'code': Output.DANGER}
+                {'text': 'Timed out', 'code': Output.DANGER},
+                {'text': "after %.2fs" % result.duration, 'code': Output.MUTED}
             ])
+            self._report_steps(result)
+            return
+        parts = [
+            {'text': 'Exited with', 'code': Output.MUTED},
+            {'text': result.returncode,
+             'code': Output.SUCCESS if result.succeeded else Output.DANGER},
+            {'text': "in %.2fs" % result.duration, 'code': Output.MUTED}
+        ]
+        if result.max_rss is not None:
+            parts.append({'text': "(peak memory %s KB)" % result.max_rss, 'code': Output.MUTED})
+        Output.write(parts)
+        self._report_steps(result)
+    
+    def _report_steps(self, result):
+        """Show how every step of a script ended in an instance"""
+        for number, (step, step_result) in enumerate(result.steps or (), 1):
+            if step_result is None:
+                status = Output.colorize("skipped", Output.MUTED)
+            elif step_result.timed_out:
+                status = Output.colorize("timed out after %.2fs" % step_result.duration, Output.DANGER)
+            else:
+                status = Output.colorize("exited with %s in %.2fs" % (step_result.returncode, step_result.duration),
+                                         Output.SUCCESS if step_result.succeeded else Output.DANGER)
+            print("  %d. %s: %s" % (number, Output.colorize(step, Output.WARNING), status))
     
-    def execute(self, cmd, instance_path):
+    def execute(self, cmd, instance_path, timeout=None, deadline=None):
         """
         Execute the command to the specified directory.
         :param cmd: The command to run
         :param instance_path: Path where the command should execute
+        :param timeout: Seconds after which the command is killed (optional)
+        :param deadline: time.monotonic() after which the command is killed (optional)
+        :return: ExecutionResult or None if the command could not be started
         """
         try:
-            print('\n')
-            Output.write([
-                {'text': 'Changed directory to',
-                 'code': Output.INFO},
-                {'text': f"'{instance_path}'",
-                 'code': Output.WARNING},
-                {'text': "and running", 'code': Output.INFO},
-                {'text': f"'{cmd}'", 'code': Output.WARNING}
-            ])
-            # Switch to the desired directory
-            os.chdir(instance_path)
+            self._announce(cmd, instance_path)
             # Do the mischief
-            os.system(cmd)
+            # Nothing runs alongside, the command may use the terminal
+            result = self._executor.run(cmd, instance_path, timeout, deadline, foreground=True)
+            self._report(result)
+            return result
         except OSError as error:
             # If something goes wrong...
             Output.danger(error)
+    
+    def execute_parallel(self, cmd, tasks, jobs, timeout=None, deadline=None, stop=None, collector=None):
+        """
+        Execute the command to several directories at once using a bounded pool.
+        Every child gets its own working directory, so the process-wide one is
+        never changed. On Ctrl-C the commands running are terminated and the
+        rest are not started.
+        :param cmd: The command to run
+        :param tasks: List of (index, name, path) tuples of the instances
+        :param jobs: Maximum number of commands running at the same time, or
+                     an AdaptiveLimit giving it
+        :param timeout: Seconds after which a command is killed (optional)
+        :param deadline: time.monotonic() after which every command is killed (optional)
+        :param stop: Callable telling when to start no more commands (optional)
+        :param collector: Aggregator or LogSpool taking the output instead of the terminal (optional)
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from threading import Lock
+        from lordcommander.scheduler import Throttle
+        
+        lock = Lock()
+        throttle = Throttle(jobs)
+        
+        def work(task):
+            index, instance, instance_path = task
+            sink = None
+            try:
+                with throttle:
+                    if self._executor.cancelled or (stop is not None and stop()):
+                        return
+                    self._start(index, instance)
+                    self._concurrency(throttle.peak)
+                    try:
+                        if collector is not None:
+                            sink = collector.open(index, instance)
+                        else:
+                            with lock:
+                                self._announce(cmd, instance_path)
+                        result = self._executor.run(cmd, instance_path, timeout, deadline, sink)
+                    except OSError as error:
+                        with lock:
+                            Output.danger(error)
+                        self._record(index, instance, state=str(error))
+                        self._tally(None)
+                        return
+                if result is None or self._executor.cancelled:
+                    # Cancelled, left for 'lc run --resume'
+                    return
+                if collector is not None:
+                    # The collector closes it from now on
+                    sink, output = None, sink
+                    collector.add(index, instance, result, output)
+                elif self._events is None:
+                    with lock:
+                        Output.muted(f"'{instance_path}'", end=' ')
+                        self._report(result)
+                self._record(index, instance, result)
+                self._tally(result)
+            finally:
+                if sink is not None:
+                    # Failed, interrupted or cancelled before the collector got it
+                    sink.close()
+        
+        with ThreadPoolExecutor(max_workers=getattr(jobs, 'maximum', jobs)) as pool:
+            try:
+                list(pool.map(work, tasks))
+            except KeyboardInterrupt:
+                self._executor.cancel()
+                raise
+    
+    def execute_aggregated(self, cmd, tasks, jobs, timeout=None, deadline=None):
+        """
+        Execute the command to the directories capturing their output, then print
+        every distinct output once along with the instances that produced it.
+        :param cmd: The command to run
+        :param tasks: List of (index, name, path) tuples of the instances
+        :param jobs: Maximum number of commands running at the same time, or
+                     an AdaptiveLimit giving it
+        :param timeout: Seconds after which a command is killed (optional)
+        :param deadline: time.monotonic() after which every command is killed (optional)
+        """
+        from lordcommander.aggregate import Aggregator
+        
+        Output.info("Running '%s' throughout %d directories..." % (cmd, len(tasks)))
+        aggregator = Aggregator()
+        try:
+            self.execute_parallel(cmd, tasks, jobs, timeout, deadline, collector=aggregator)
+        finally:
+            print("\n")
+            groups = len(aggregator)
+            try:
+                aggregator.show()
+            finally:
+                aggregator.close()
+            Output.normal("\n%d distinct outputs of %d directories." % (groups, len(tasks)))
+    
+    def execute_waves(self, cmd, tasks, jobs, stream, timeout, deadline, canary=0, wave=None, max_failures=None,
+                      collector=None):
+        """
+        Execute the command in waves: a canary batch first, then the rest in batches
+        running at the same time. No more instances are started once the canary has
+        failed or the failure budget is used up.
+        :param cmd: The command to run
+        :param tasks: List of (index, name, path) tuples of the instances in list order
+        :param jobs: Maximum number of commands running at the same time
+        :param stream: Stream the output line by line prefixed with the instance
+        :param timeout: Seconds after which a command is killed
+        :param deadline: time.monotonic() after which every command is killed
+        :param canary: Number of instances to run first (optional)
+        :param wave: Number of instances in every wave after the canary, jobs by default (optional)
+        :param max_failures: Number of failures after which no more instances are started (optional)
+        :param collector: LogSpool taking the output instead of the terminal (optional)
+        :return: Whether every instance has been started
+        """
+        canary = min(canary or 0, len(tasks))
+        rest = tasks[canary:]
+        size = wave or max(jobs, 1)
+        waves = [('Canary', tasks[:canary])] if canary else []
+        batches = [rest[start:start + size] for start in range(0, len(rest), size)]
+        waves += [("Wave %d/%d" % (number, len(batches)), batch) for number, batch in enumerate(batches, 1)]
+        
+        def failures():
+            return self._counts['failed'] + self._counts['timed_out'] - failed_before
+        
+        def exhausted():
+            return max_failures is not None and failures() >= max_failures
+        
+        failed_before = self._counts['failed'] + self._counts['timed_out']
+        started = 0
+        for position, (name, batch) in enumerate(waves):
+            before = dict(self._counts)
+            began = time.monotonic()
+            limit = max(min(jobs, len(batch)), 1)
+            if stream:
+                self.execute_streaming(cmd, batch, limit, timeout, deadline)
+            else:
+                self.execute_parallel(cmd, batch, limit, timeout, deadline, stop=exhausted, collector=collector)
+            done = sum(self._counts.values()) - sum(before.values())
+            started += done
+            failed = self._counts['failed'] + self._counts['timed_out'] - before['failed'] - before['timed_out']
+            print("\n")
+            Output.write([
+                {'text': name, 'code': Output.INFO},
+                {'text': "ran %d directories in %.2fs," % (done, time.monotonic() - began), 'code': ''},
+                {'text': "%d failed" % failed, 'code': Output.DANGER if failed else Output.SUCCESS}
+            ])
+            left = len(tasks) - started
+            if not left:
+                return True
+            if name == 'Canary' and failed:
+                Output.danger("Canary has failed, %d directories are left unstarted." % left)
+                return False
+            if exhausted():
+                Output.danger("Failure budget of %d is used up, %d directories are left unstarted."
+                              % (max_failures, left))
+                return False
+        return True
+    
+    def execute_streaming(self, cmd, tasks, jobs, timeout=None, deadline=None):
+        """
+        Execute the command to several directories from a single event loop,
+        forwarding every line of output prefixed with the instance it came from.
+        :param cmd: The command to run
+        :param tasks: List of (index, name, path) tuples of the instances
+        :param jobs: Maximum number of commands running at the same time, or
+                     an AdaptiveLimit giving it
+        :param timeout: Seconds after which a command is killed (optional)
+        :param deadline: time.monotonic() after which every command is killed (optional)
+        """
+        from lordcommander.engine import AsyncEngine
+        
+        Output.info("Running '%s' throughout %d directories..." % (cmd, len(tasks)))
+        engine = AsyncEngine()
+        results = engine.run(cmd, tasks, jobs, timeout, deadline)
+        self._concurrency(engine.peak)
+        for (index, instance, _), result in zip(tasks, results):
+            self._record(index, instance, result)
+            self._tally(result)
+    
+    def preview(self, project, cmd, li=0, ui=None, ex=(), inc=(), jobs=1, durations=None):
+        """
+        Show the order the instances would run in and predict how long the run
+        would take from past durations, without running anything.
+        :param project: The active project dictionary
+        :param cmd: The command to run
+        :param li: Lower index (optional)
+        :param ui: Upper index (optional)
+        :param ex: Tuple of indices to exclude during execution (optional)
+        :param inc: Tuple of indices to include only during execution (optional)
+        :param jobs: Number of instances to run concurrently or 'auto' (optional)
+        :param durations: Dictionary of past durations by instance name (optional)
+        """
+        from lordcommander.scheduler import expected, longest_first, predict
+        try:
+            jobs = self._resolve_jobs(jobs)
+            durations = durations or {}
+            directories = DirectoryCache(project['root'])
+            runnable = []
+            for index, instance in self._get_instances(project, li, ui, ex, inc):
+                state = directories.state(instance)
+                if state in (MISSING, NOT_A_DIRECTORY):
+                    print("- {} ({}): {}".format(instance, index, Output.colorize(state, Output.DANGER)))
+                else:
+                    runnable.append((index, instance, None))
+            if jobs > 1:
+                runnable = longest_first(runnable, durations)
+            
+            Output.info("Planning '%s' throughout %d directories..." % (cmd, len(runnable)))
+            seconds = expected([name for _, name, _ in runnable], durations)
+            for index, instance, _ in runnable:
+                print("- {} ({}): {}".format(instance, index, Output.colorize(
+                    "~%.2fs" % durations[instance] if instance in durations else 'never run', Output.MUTED)))
+            print("\n")
+            if not runnable or seconds[0] is None:
+                Output.warning("'%s' has never run here before, the run time can't be predicted." % cmd)
+                return
+            Output.normal("Predicted run time: %.2fs with %d jobs (%.2fs one after another)." % (
+                predict(seconds, jobs), jobs, sum(seconds)))
+        except TypeError:
+            Output.danger("Please provide valid integers!")
+        except ValueError as error:
+            Output.danger(error)
 
 
 class ProjectController:
@@ -301,7 +744,7 @@ class ProjectController:
             for project in projects:
                 root = self._lcdb['projects'][project]['root']
                 Output.write("[%s] %s: %s" %
-                             ('✓' if project == self._lcdb['active'] else ' ', project, color(root, Output.MUTED)))
+                             ('✓' if project == self._lcdb['active'] else ' ', project, Output.colorize(root, Output.MUTED)))
             Output.normal("\nTotal %d projects listed." % len(projects))
         
         except ProjectNotFoundException as error:
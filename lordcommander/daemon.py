@@ -0,0 +1,403 @@
+"""
+---------------------------------------------------------------------
+daemon.py
+---------------------------------------------------------------------
+This module holds the optional LordCommander daemon. Once started
+with `lc daemon start`, it keeps the interpreter, every module and
+the open store warm and listens on a Unix domain socket inside the
+data directory. The `lc` command then only forwards its arguments,
+working directory, environment and standard streams (as file
+descriptors) to the daemon and waits for the exit status.
+
+Frequently used read-only commands are answered by the daemon
+itself from the cached store, which is dropped as soon as the
+store files change on disk. Any other command is run in a child
+forked from the warm daemon, in its own session, writing straight
+to the terminal of the client. Without a daemon everything runs
+in-process as before.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import os
+import struct
+
+from lordcommander.output import Output, wants_color
+
+SOCKET_NAME = 'lcd.sock'
+PID_NAME = 'lcd.pid'
+LOG_NAME = 'lcd.log'
+
+# Length of the request, then the pid of the worker and its exit status
+HEADER = struct.Struct('!I')
+STATUS = struct.Struct('!i')
+
+
+def socket_path(data_dir):
+    return os.path.join(data_dir, SOCKET_NAME)
+
+
+def peer_uid(connection):
+    """User ID of the process on the other end of a Unix socket, None where it can't be told"""
+    import socket
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = struct.Struct('3i')
+    _, uid, _ = credentials.unpack(
+        connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size))
+    return uid
+
+
+def _read_exactly(connection, size):
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise EOFError("Connection to the daemon has been closed.")
+        data += chunk
+    return data
+
+
+def _encode(request):
+    """NUL separated fields, none of them can hold a NUL byte"""
+    fields = [request['cwd'], str(len(request['argv']))] + request['argv']
+    fields += ['%s=%s' % item for item in request['env'].items()]
+    return '\0'.join(fields).encode(errors='surrogateescape')
+
+
+def _decode(payload):
+    fields = payload.decode(errors='surrogateescape').split('\0')
+    count = int(fields[1])
+    return {
+        'cwd': fields[0],
+        'argv': fields[2:2 + count],
+        'env': dict(item.split('=', 1) for item in fields[2 + count:])
+    }
+
+
+def _send_request(connection, request, fds):
+    """Send the request along with the standard stream file descriptors"""
+    import array
+    import socket
+    payload = _encode(request)
+    connection.sendmsg([HEADER.pack(len(payload))],
+                       [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    connection.sendall(payload)
+
+
+def _receive_request(connection):
+    """Receive a request and the file descriptors passed along"""
+    import array
+    import socket
+    fds = array.array('i')
+    header, ancillary, _, _ = connection.recvmsg(
+        HEADER.size, socket.CMSG_LEN(3 * fds.itemsize))
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    header += _read_exactly(connection, HEADER.size - len(header))
+    (length,) = HEADER.unpack(header)
+    return _decode(_read_exactly(connection, length)), list(fds)
+
+
+def forward(data_dir, argv):
+    """
+    Run the command line through the daemon if one is running.
+    :param data_dir: The data directory of LordCommander
+    :param argv: Command line arguments without the program name
+    :return: Exit status of the command or None if there is no daemon
+    """
+    path = socket_path(data_dir)
+    if not os.path.exists(path):
+        return None
+
+    import signal
+    import socket
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        # Stale socket of a daemon gone away
+        connection.close()
+        return None
+
+    with connection:
+        request = {'argv': list(argv), 'cwd': os.getcwd(), 'env': dict(os.environ)}
+        _send_request(connection, request, [0, 1, 2])
+        try:
+            (worker,) = STATUS.unpack(_read_exactly(connection, STATUS.size))
+            while True:
+                try:
+                    (status,) = STATUS.unpack(_read_exactly(connection, STATUS.size))
+                    return status
+                except KeyboardInterrupt:
+                    # The worker is not in our process group, pass Ctrl-C on
+                    if worker > 0:
+                        os.killpg(worker, signal.SIGINT)
+        except EOFError as error:
+            Output.danger(error)
+            return 1
+
+
+class Daemon:
+    """
+    Serves lc requests on a Unix domain socket.
+    """
+
+    def __init__(self, data_dir, backend):
+        self._data_dir = data_dir
+        self._backend = backend
+        self._store = None
+        self._signature = None
+
+    def _store_signature(self):
+        """Identity of the store files, any write on disk changes it"""
+        signature = []
+        for name in sorted(os.listdir(self._data_dir)):
+            # Shared memory index of SQLite changes on reads too
+            if name.startswith('lcdb') and not name.endswith('-shm'):
+                stat = os.stat(os.path.join(self._data_dir, name))
+                signature.append((name, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def _cached_store(self):
+        """The open store, reopened whenever it has changed on disk"""
+        from lordcommander.storage import open_store
+        signature = self._store_signature()
+        if self._store is not None and signature != self._signature:
+            self._store.close()
+            self._store = None
+        if self._store is None:
+            self._store = open_store(self._data_dir, self._backend)
+            self._signature = self._store_signature()
+        return self._store
+
+    def _release_store(self):
+        # A shelve is locked while open, so it can't be kept around
+        from lordcommander.storage import SQLITE
+        if self._store is not None and self._backend != SQLITE:
+            self._store.close()
+            self._store = None
+
+    def _log(self, message):
+        with open(os.path.join(self._data_dir, LOG_NAME), 'a') as log:
+            log.write(message + '\n')
+
+    def serve(self):
+        """Listen for requests until terminated."""
+        import signal
+        import socket
+
+        # Warm up everything a command may need
+        import fire
+        import lordcommander.controllers
+        import lordcommander.engine
+        import lordcommander.executor
+        import lordcommander.utils
+
+        path = socket_path(self._data_dir)
+        pid_file = os.path.join(self._data_dir, PID_NAME)
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Anyone able to connect runs commands as us, so only we may
+        umask = os.umask(0o177)
+        try:
+            server.bind(path)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        server.listen(64)
+        with open(pid_file, 'w') as pid:
+            pid.write(str(os.getpid()))
+
+        def terminate(signum, frame):
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, terminate)
+        # Let the kernel reap the workers
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        self._log("Daemon %d listening on %s" % (os.getpid(), path))
+        try:
+            while True:
+                connection, _ = server.accept()
+                try:
+                    uid = peer_uid(connection)
+                    if uid is not None and uid != os.getuid():
+                        self._log("Refused a connection of user %d" % uid)
+                        continue
+                    self._handle(connection)
+                except Exception as error:
+                    self._log("Request failed: %r" % error)
+                finally:
+                    connection.close()
+        finally:
+            server.close()
+            for name in (path, pid_file):
+                if os.path.exists(name):
+                    os.unlink(name)
+            if self._store is not None:
+                self._store.close()
+            self._log("Daemon %d stopped" % os.getpid())
+
+    def _handle(self, connection):
+        from lordcommander.commander import fast_command
+        request, fds = _receive_request(connection)
+        try:
+            argv = request['argv']
+            env = request['env']
+            same_store = env.get('LORDCOMMANDER_STORAGE', self._backend) == self._backend
+            if fast_command(argv) is not None and same_store and len(fds) == 3:
+                connection.sendall(STATUS.pack(0))
+                status = self._run_inline(argv, env, fds[1])
+                connection.sendall(STATUS.pack(status))
+                self._log("inline %r -> %d" % (argv, status))
+            else:
+                worker = os.fork()
+                if worker == 0:
+                    self._run_worker(connection, request, fds)
+                self._log("worker %d %r" % (worker, argv))
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def _run_inline(self, argv, env, stdout):
+        """Answer a read-only command from the cached store"""
+        import sys
+        from contextlib import redirect_stdout
+        from lordcommander.commander import execute
+
+        with open(stdout, 'w', closefd=False) as out, redirect_stdout(out):
+            Output.COLORED = wants_color(out, env)
+            try:
+                execute(argv, self._cached_store(), owns_store=False)
+                return 0
+            except Exception as error:
+                Output.danger(error)
+                return 1
+            finally:
+                out.flush()
+                self._release_store()
+                Output.COLORED = wants_color()
+                sys.stdout.flush()
+
+    def _run_worker(self, connection, request, fds):
+        """Run the command in a forked child as if it was started by the client"""
+        import signal
+        import sys
+        import traceback
+        status = 1
+        try:
+            # A session of its own so Ctrl-C of the client reaches the whole tree
+            os.setsid()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            connection.sendall(STATUS.pack(os.getpid()))
+            for target, fd in enumerate(fds[:3]):
+                os.dup2(fd, target)
+            sys.stdin = open(0, 'r', closefd=False)
+            sys.stdout = open(1, 'w', closefd=False)
+            sys.stderr = open(2, 'w', closefd=False)
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            Output.COLORED = wants_color()
+
+            from lordcommander.commander import execute, read_data
+            sys.argv = ['lc'] + request['argv']
+            try:
+                execute(request['argv'], read_data)
+                status = 0
+            except SystemExit as exit:
+                status = exit.code if isinstance(exit.code, int) else (0 if exit.code is None else 1)
+            except KeyboardInterrupt:
+                status = 130
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                connection.sendall(STATUS.pack(status))
+            finally:
+                os._exit(status)
+
+
+class DaemonController:
+    """
+    Start, stop, or check the LordCommander daemon.
+    """
+
+    def __init__(self, data_dir):
+        self._data_dir = data_dir
+
+    def _pid(self):
+        try:
+            with open(os.path.join(self._data_dir, PID_NAME)) as pid:
+                pid = int(pid.read().strip())
+            os.kill(pid, 0)
+            return pid
+        except (OSError, ValueError):
+            return None
+
+    def start(self, foreground=False):
+        """
+        Start the daemon.
+        :param foreground: Stay attached to the terminal, false by default (optional)
+        """
+        from lordcommander.storage import SQLITE
+        pid = self._pid()
+        if pid is not None:
+            Output.warning("Daemon is already running (pid %d)." % pid)
+            return
+
+        daemon = Daemon(self._data_dir, os.environ.get('LORDCOMMANDER_STORAGE', SQLITE))
+        if foreground:
+            Output.info("Daemon is listening on %s" % socket_path(self._data_dir))
+            daemon.serve()
+            return
+
+        if os.fork() == 0:
+            # Detach from the terminal twice over, then serve
+            os.setsid()
+            if os.fork() != 0:
+                os._exit(0)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            try:
+                daemon.serve()
+            finally:
+                os._exit(0)
+
+        import time
+        for _ in range(100):
+            pid = self._pid()
+            if pid is not None and os.path.exists(socket_path(self._data_dir)):
+                Output.success("Daemon started (pid %d)." % pid)
+                return
+            time.sleep(0.05)
+        Output.danger("Daemon could not be started, see %s" % os.path.join(self._data_dir, LOG_NAME))
+
+    def stop(self):
+        """
+        Stop the daemon.
+        """
+        import signal
+        pid = self._pid()
+        if pid is None:
+            Output.danger("Daemon is not running.")
+            return
+        os.kill(pid, signal.SIGTERM)
+        Output.success("Daemon (pid %d) is stopped." % pid)
+
+    def status(self):
+        """
+        Show whether the daemon is running.
+        """
+        pid = self._pid()
+        if pid is None:
+            Output.muted("Daemon is not running.")
+        else:
+            Output.success("Daemon is running (pid %d) on %s" % (pid, socket_path(self._data_dir)))
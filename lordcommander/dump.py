@@ -0,0 +1,220 @@
+"""
+---------------------------------------------------------------------
+dump.py
+---------------------------------------------------------------------
+This module reads and writes dumps of the store. Besides the JSON
+file of earlier versions, lcdb_dump.json, a dump can be written as
+JSON lines, lcdb_dump.ndjson, with a record per line:
+
+{"type":"lcdb","version":1,"active":"web"}
+{"type":"project","name":"web","root":"/srv/web"}
+{"type":"instance","project":"web","name":"app1"}
+
+Such a dump is written and read a record at a time, so neither the
+store nor the file is ever held in memory as a whole, only the
+instances of a single project while it is restored. Every record is
+checked as it is read, a broken line is reported by its number.
+
+Both kinds of dumps can be compressed with gzip, or with zstd where
+Python has it (3.14 and later), gzip is used otherwise. Compressed
+dumps are recognized by their content when they are restored.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import json
+
+VERSION = 1
+JSON, NDJSON = 'json', 'ndjson'
+FORMATS = (JSON, NDJSON)
+GZIP, ZSTD = 'gzip', 'zstd'
+COMPRESSIONS = {GZIP: '.gz', ZSTD: '.zst'}
+MAGIC = {GZIP: b'\x1f\x8b', ZSTD: b'\x28\xb5\x2f\xfd'}
+
+
+def zstd_module():
+    """The zstd module of the standard library, None before Python 3.14"""
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        return None
+
+
+def file_name(format=JSON, compress=None):
+    """
+    Name of the dump file.
+    :param format: Either 'json' or 'ndjson' (optional)
+    :param compress: Either 'gzip' or 'zstd' (optional)
+    :return: str
+    """
+    return 'lcdb_dump.%s%s' % (format, COMPRESSIONS[compress] if compress else '')
+
+
+def check(format, compress):
+    """
+    Check the format and the compression of a dump.
+    :return: The compression to use, gzip takes the place of zstd where it is not available
+    """
+    if format not in FORMATS:
+        raise ValueError("Format should be one of: %s." % ', '.join(FORMATS))
+    if compress is not None and compress not in COMPRESSIONS:
+        raise ValueError("Compression should be one of: %s." % ', '.join(COMPRESSIONS))
+    if compress == ZSTD and zstd_module() is None:
+        return GZIP
+    return compress
+
+
+def open_dump(path, mode='r', compress=None):
+    """
+    Open a dump as text, compressed or not.
+    :param path: Path of the file
+    :param mode: 'r' to read, the compression is then found out from the content, or 'w' to write
+    :param compress: Compression to write with, either 'gzip' or 'zstd' (optional)
+    :return: A text stream
+    """
+    if mode == 'r':
+        with open(path, 'rb') as dump:
+            head = dump.read(4)
+        compress = next((name for name, magic in MAGIC.items() if head.startswith(magic)), None)
+    if compress == GZIP:
+        import gzip
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compress == ZSTD:
+        zstd = zstd_module()
+        if zstd is None:
+            raise ValueError("%s is compressed with zstd, which needs Python 3.14 or later." % path)
+        return zstd.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def records(lcdb, names):
+    """
+    Records of the store, a line of an NDJSON dump each.
+    :param lcdb: The store
+    :param names: Names of the projects to dump
+    """
+    projects = lcdb['projects']
+    yield {'type': 'lcdb', 'version': VERSION, 'active': lcdb['active']}
+    iterate = getattr(projects, 'iter_instances', None)
+    for name in names:
+        yield {'type': 'project', 'name': name, 'root': projects[name]['root']}
+        for instance in (iterate(name) if iterate is not None else projects[name]['instances']):
+            yield {'type': 'instance', 'project': name, 'name': instance}
+
+
+def write(lcdb, path, format=JSON, compress=None, project=None):
+    """
+    Write a dump of the store.
+    :param lcdb: The store
+    :param path: Path of the file
+    :param format: Either 'json' or 'ndjson' (optional)
+    :param compress: Either 'gzip' or 'zstd' (optional)
+    :param project: Name of the only project to dump (optional)
+    """
+    projects = lcdb['projects']
+    names = [project] if project is not None else list(projects)
+    with open_dump(path, 'w', compress) as dump:
+        if format == NDJSON:
+            for record in records(lcdb, names):
+                dump.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            return
+        data = {
+            'active': lcdb['active'],
+            'projects': {name: {'root': projects[name]['root'],
+                                'instances': list(projects[name]['instances'])}
+                         for name in names}
+        }
+        json.dump(data, dump, indent=4)
+
+
+def header(path):
+    """
+    The first record of an NDJSON dump, holding the version and the active project.
+    :return: dict or None if it is a JSON file of earlier versions
+    """
+    with open_dump(path) as dump:
+        first = dump.readline()
+    try:
+        record = json.loads(first)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or record.get('type') != 'lcdb':
+        return None
+    if not isinstance(record.get('version'), int) or record['version'] > VERSION:
+        raise ValueError("Version %s of the dump is not supported." % record.get('version'))
+    return record
+
+
+def _text(record, key, number):
+    value = record.get(key)
+    if not isinstance(value, str) or not value:
+        raise ValueError("Line %d: '%s' should be a non-empty string." % (number, key))
+    return value
+
+
+def read(path, only=None):
+    """
+    Read the projects of an NDJSON dump one by one, checking every record.
+    :param path: Path of the file
+    :param only: Name of the only project to read, the others are still checked (optional)
+    :return: Generator of (name, root, instances)
+    """
+    with open_dump(path) as dump:
+        current, root, instances = None, None, None
+        seen = set()
+        for number, line in enumerate(dump, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError("Line %d is not valid JSON." % number)
+            kind = record.get('type') if isinstance(record, dict) else None
+            if kind == 'lcdb' and number == 1:
+                # Checked by header()
+                continue
+            if kind == 'project':
+                name = _text(record, 'name', number)
+                if name in seen:
+                    raise ValueError("Line %d: project '%s' appears twice." % (number, name))
+                seen.add(name)
+                if current is not None and instances is not None:
+                    yield current, root, instances
+                current, root = name, _text(record, 'root', number)
+                instances = [] if only is None or name == only else None
+            elif kind == 'instance':
+                if current is None or record.get('project') != current:
+                    raise ValueError("Line %d: instance is not of the project above it." % number)
+                instance = _text(record, 'name', number)
+                if instances is not None:
+                    instances.append(instance)
+            else:
+                raise ValueError("Line %d: unknown record type '%s'." % (number, kind))
+        if current is not None and instances is not None:
+            yield current, root, instances
+
+
+def legacy(data, only=None):
+    """
+    Check the projects of a JSON dump of earlier versions.
+    :param data: The whole dump as read from the file
+    :param only: Name of the only project to take, the others are still checked (optional)
+    :return: List of (name, root, instances)
+    """
+    if not isinstance(data['projects'], dict):
+        raise ValueError("Failed! Not a valid LordCommander supported file.")
+    projects = []
+    for name, value in data['projects'].items():
+        if not isinstance(value, dict):
+            raise ValueError("Project %s is not valid." % name)
+        root, instances = value.get('root'), value.get('instances')
+        if not isinstance(root, str) or not root:
+            raise ValueError("Project %s: 'root' should be a non-empty string." % name)
+        if not isinstance(instances, list) or not all(isinstance(instance, str) and instance
+                                                      for instance in instances):
+            raise ValueError("Project %s: 'instances' should be a list of names." % name)
+        if only is None or name == only:
+            projects.append((name, root, instances))
+    return projects
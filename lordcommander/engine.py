@@ -0,0 +1,162 @@
+"""
+---------------------------------------------------------------------
+engine.py
+---------------------------------------------------------------------
+This module holds the asyncio based run engine. All of the children
+are driven from a single event loop, their stdout and stderr are
+read line by line and forwarded to the terminal as soon as a line
+arrives, prefixed with the index and the name of the instance. So
+the output of concurrently running instances never gets mixed up
+within a line and nothing is kept in memory longer than a line.
+Like the Executor, every child gets a process group of its own,
+which is terminated as a whole when it runs out of time or the
+run is interrupted.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import asyncio
+import contextlib
+import signal
+import sys
+import time
+
+from lordcommander.executor import KILL_GRACE, ExecutionResult, OutputDigest, signal_group, time_left
+from lordcommander.output import Output
+from lordcommander.scheduler import AsyncThrottle
+
+
+class AsyncEngine:
+    """
+    Runs a command throughout several instances concurrently and streams their output.
+    """
+    
+    # Longest chunk of a line kept in memory before it is forwarded anyway
+    LINE_LIMIT = 64 * 1024
+    
+    def __init__(self, stdout=None, stderr=None):
+        self._stdout = stdout if stdout is not None else sys.stdout
+        self._stderr = stderr if stderr is not None else sys.stderr
+        # Most commands running at once in the last run
+        self.peak = 0
+    
+    def run(self, cmd, tasks, jobs, timeout=None, deadline=None):
+        """
+        Run the command for every task and wait until all of them are finished.
+        :param cmd: The command to run
+        :param tasks: List of (index, name, path) tuples of the instances
+        :param jobs: Maximum number of commands running at the same time, or a
+                     callable like AdaptiveLimit giving it
+        :param timeout: Seconds after which a command is killed (optional)
+        :param deadline: time.monotonic() after which every command is killed (optional)
+        :return: List of ExecutionResult in the order of the tasks
+        """
+        return asyncio.run(self._run_all(cmd, tasks, jobs, timeout, deadline))
+    
+    async def _run_all(self, cmd, tasks, jobs, timeout, deadline):
+        semaphore = AsyncThrottle(jobs)
+        try:
+            return await asyncio.gather(
+                *(self._run_one(cmd, task, semaphore, timeout, deadline) for task in tasks))
+        finally:
+            self.peak = semaphore.peak
+    
+    async def _run_one(self, cmd, task, semaphore, timeout=None, deadline=None):
+        index, name, path = task
+        prefix = f"[{index}] {name} |"
+        async with semaphore:
+            started = time.monotonic()
+            limit = time_left(timeout, deadline)
+            if limit is not None and limit <= 0:
+                self._emit(self._stdout, Output.colorize(prefix, Output.INFO),
+                           Output.colorize("timed out before it could start", Output.DANGER))
+                return ExecutionResult(path, None, 0.0, timed_out=True)
+            try:
+                process = await self._spawn(cmd, path)
+            except OSError as error:
+                self._emit(self._stderr, Output.colorize(prefix, Output.DANGER), str(error))
+                return ExecutionResult(path, None, time.monotonic() - started)
+            
+            output = OutputDigest()
+            pumps = asyncio.gather(
+                self._pump(process.stdout, self._stdout, Output.colorize(prefix, Output.INFO),
+                           output, 'stdout'),
+                self._pump(process.stderr, self._stderr, Output.colorize(prefix, Output.WARNING),
+                           output, 'stderr'))
+            # The output may end long before the child does, the limit holds for both
+            finished = asyncio.gather(pumps, process.wait())
+            try:
+                timed_out = await self._drain(process, finished, limit)
+            except asyncio.CancelledError:
+                # Interrupted, don't leave the command behind
+                signal_group(process.pid, signal.SIGKILL)
+                finished.cancel()
+                # Retrieve the cancellation, else asyncio complains about it
+                with contextlib.suppress(asyncio.CancelledError):
+                    await finished
+                raise
+            returncode = await process.wait()
+            result = ExecutionResult(path, returncode, time.monotonic() - started, output=output,
+                                     timed_out=timed_out)
+        
+        if timed_out:
+            status = "timed out after %.2fs" % result.duration
+        else:
+            status = "exited with %s in %.2fs" % (returncode, result.duration)
+        self._emit(self._stdout, Output.colorize(prefix, Output.INFO), Output.colorize(
+            status, Output.SUCCESS if result.succeeded else Output.DANGER))
+        return result
+    
+    async def _spawn(self, cmd, path):
+        """Start the command through the shell, or straight if it's a DirectCommand"""
+        options = dict(cwd=str(path), stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                       stderr=asyncio.subprocess.PIPE, limit=self.LINE_LIMIT, start_new_session=True)
+        argv = getattr(cmd, 'argv', None)
+        if argv is not None:
+            return await asyncio.create_subprocess_exec(*argv, **options)
+        return await asyncio.create_subprocess_shell(cmd, **options)
+    
+    @staticmethod
+    async def _drain(process, finished, limit):
+        """Wait for the child to exit and its output to end, terminate its group if it takes
+        too long. Returns whether it has timed out"""
+        try:
+            await asyncio.wait_for(asyncio.shield(finished), limit)
+            return False
+        except asyncio.TimeoutError:
+            pass
+        signal_group(process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(finished), KILL_GRACE)
+        except asyncio.TimeoutError:
+            # Still not gone, or its pipes are held by a process that has left the group
+            finished.cancel()
+            try:
+                await finished
+            except asyncio.CancelledError:
+                pass
+        signal_group(process.pid, signal.SIGKILL)
+        return True
+    
+    async def _pump(self, stream, sink, prefix, output, name):
+        """Forward lines from a child stream to the sink as they arrive"""
+        while True:
+            try:
+                line = await stream.readuntil(b'\n')
+            except asyncio.IncompleteReadError as error:
+                # The stream is closed, flush what is left without a newline
+                if error.partial:
+                    output.update(name, error.partial)
+                    self._emit(sink, prefix, error.partial.decode(errors='replace'))
+                return
+            except asyncio.LimitOverrunError as error:
+                # An overly long line, forward the part we have so far
+                line = await stream.readexactly(error.consumed)
+            output.update(name, line)
+            self._emit(sink, prefix, line.decode(errors='replace').rstrip('\n'))
+    
+    @staticmethod
+    def _emit(sink, prefix, text):
+        sink.write(f"{prefix} {text}\n")
+        sink.flush()
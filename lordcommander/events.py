@@ -0,0 +1,95 @@
+"""
+---------------------------------------------------------------------
+events.py
+---------------------------------------------------------------------
+This module writes a run as JSON lines, one event per line, for
+other programs to consume instead of the colored messages meant for
+people. Every instance gets a start and a finish event, the run
+ends with a summary event, or an error event if it could not start:
+
+{"event":"start","index":0,"instance":"app1","time":1700000000.0}
+{"event":"finish","index":0,"instance":"app1","code":0,"duration":0.12,"time":...}
+{"event":"summary","command":"git pull","succeeded":1,"failed":0,"timed_out":0,...}
+{"event":"error","message":"'|' needs a shell, it can't be run with --exec_.","time":...}
+
+Events are written in the order they happen, the stream is only
+flushed after the summary, or when an event is written from a
+terminal.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import json
+import threading
+import time
+
+
+class EventStream:
+    """
+    Writes events as JSON lines to a text stream, safe to use from several threads.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+        try:
+            self._interactive = stream.isatty()
+        except (AttributeError, ValueError):
+            self._interactive = False
+
+    def emit(self, event, **fields):
+        """
+        Write an event.
+        :param event: Name of the event, like 'start', 'finish' or 'summary'
+        :param fields: Fields of the event, all of them serializable to JSON
+        """
+        line = json.dumps(dict(event=event, **fields, time=round(time.time(), 4)),
+                          separators=(',', ':'), ensure_ascii=False) + '\n'
+        with self._lock:
+            self._stream.write(line)
+            if self._interactive:
+                self._stream.flush()
+
+    def start(self, index, name):
+        self.emit('start', index=index, instance=name)
+
+    def finish(self, index, name, result=None, state=None):
+        """
+        Write how an instance ended.
+        :param index: Index of the instance
+        :param name: Name of the instance
+        :param result: ExecutionResult, None if the command never ran (optional)
+        :param state: Why the command did not run (optional)
+        """
+        if result is None:
+            self.emit('finish', index=index, instance=name, code=None, state=state or 'not started')
+            return
+        fields = {'code': result.returncode, 'duration': round(result.duration, 4)}
+        if result.timed_out:
+            fields['timed_out'] = True
+        if result.steps is not None:
+            from lordcommander.script import step_records
+            fields['steps'] = step_records(result.steps)
+        self.emit('finish', index=index, instance=name, **fields)
+
+    def error(self, error):
+        """
+        Write why the run could not go ahead and flush the stream.
+        :param error: The exception, or a message
+        """
+        self.emit('error', message=str(error))
+        with self._lock:
+            self._stream.flush()
+
+    def summary(self, command, counts, complete, duration):
+        """
+        Write the totals of the run and flush the stream.
+        :param command: The command run
+        :param counts: Dictionary of the succeeded, failed and timed out instances
+        :param complete: False if the run has been interrupted
+        :param duration: Seconds the run has taken
+        """
+        self.emit('summary', command=str(command), complete=complete, duration=round(duration, 4), **counts)
+        with self._lock:
+            self._stream.flush()
@@ -0,0 +1,390 @@
+"""
+---------------------------------------------------------------------
+executor.py
+---------------------------------------------------------------------
+This module spawns the commands for the instances. Each command is
+started as a child process with its own working directory, so the
+working directory of LordCommander itself is never changed and
+several commands can safely run side by side. The exit status,
+wall time and peak memory of every child are collected and handed
+back to the caller as an ExecutionResult. A forked child inherits
+the peak memory of LordCommander, so its own is only known when it
+goes beyond that. A child writes straight to
+the terminal LordCommander runs in, unless its output is captured
+or our stdout is redirected. Then the output passes through
+LordCommander, so its size and a digest can be recorded without
+keeping it in memory.
+
+A DirectCommand skips the shell altogether. It is split into its
+arguments and its program is looked up in PATH only once, then it
+is started straight in every instance, which saves starting a shell
+for each of them.
+
+A child that has a time limit, or runs alongside others, is started
+in a session, hence a process group, of its own. When it runs out
+of time, or LordCommander is interrupted, the whole group is sent
+SIGTERM and, if it is still around after a grace period, SIGKILL.
+So nothing started by a command is left behind. A plain serial run
+keeps the child in the foreground instead, where it can prompt on
+the terminal, e.g. for a password.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import hashlib
+import os
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# Seconds a command gets to exit after SIGTERM before it is killed
+KILL_GRACE = 2.0
+
+# Seconds between two looks at whether a child has exited while its pipes are still open
+EXIT_CHECK = 0.1
+
+
+class OutputDigest:
+    """Size and digest of the stdout and stderr of a child, updated chunk by chunk."""
+    
+    def __init__(self):
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self._stdout = hashlib.blake2b(digest_size=16)
+        self._stderr = hashlib.blake2b(digest_size=16)
+    
+    def update(self, stream, chunk):
+        """
+        Account a chunk of output.
+        :param stream: Either 'stdout' or 'stderr'
+        :param chunk: bytes
+        """
+        if stream == 'stdout':
+            self.stdout_bytes += len(chunk)
+            self._stdout.update(chunk)
+        else:
+            self.stderr_bytes += len(chunk)
+            self._stderr.update(chunk)
+    
+    def hexdigest(self):
+        """Digest of both streams, the order they were interleaved in does not matter"""
+        return hashlib.blake2b(self._stdout.digest() + self._stderr.digest(),
+                               digest_size=16).hexdigest()
+
+
+def forward(stream, chunk):
+    """
+    Write a chunk of raw output to a text stream like sys.stdout.
+    :param stream: The text stream
+    :param chunk: bytes
+    """
+    stream.flush()
+    buffer = getattr(stream, 'buffer', None)
+    if buffer is not None:
+        buffer.write(chunk)
+        buffer.flush()
+    else:
+        stream.write(chunk.decode(errors='replace'))
+        stream.flush()
+
+
+class ExecutionResult:
+    """Outcome of a command executed in a single instance."""
+    
+    def __init__(self, instance_path, returncode, duration, max_rss=None, output=None, timed_out=False,
+                 steps=None):
+        # Exit status of the child, negative if killed by a signal
+        self.instance_path = instance_path
+        self.returncode = returncode
+        # Wall time in seconds
+        self.duration = duration
+        # Peak resident set size in kilobytes, None if unknown or not above our own
+        self.max_rss = max_rss
+        # OutputDigest of what the child has written, None if not seen
+        self.output = output
+        # Whether the child has been killed for running out of time
+        self.timed_out = timed_out
+        # Pairs of the command and ExecutionResult of every step of a script run, None otherwise
+        self.steps = steps
+    
+    @property
+    def succeeded(self):
+        return self.returncode == 0 and not self.timed_out
+    
+    def __repr__(self):
+        return "ExecutionResult(%r, returncode=%r, duration=%.3f, max_rss=%r, timed_out=%r)" % (
+            str(self.instance_path), self.returncode, self.duration, self.max_rss, self.timed_out)
+
+
+# Tokens that only mean something to a shell
+SHELL_TOKENS = {'|', '||', '&', '&&', ';', '<', '>', '>>', '2>', '2>&1', '$(', '`'}
+
+
+class DirectCommand(str):
+    """
+    A command run without a shell. It shows just as it was given, and
+    carries its arguments with the program already looked up in PATH.
+    """
+    
+    def __new__(cls, cmd):
+        argv = shlex.split(cmd)
+        if not argv:
+            raise ValueError("Nothing to run.")
+        for token in argv:
+            if token in SHELL_TOKENS or token.startswith(('$(', '`')):
+                raise ValueError("'%s' needs a shell, it can't be run with --exec_." % token)
+        # A program given with a path is looked up in every instance instead
+        if os.sep not in argv[0]:
+            program = shutil.which(argv[0])
+            if program is None:
+                raise ValueError("'%s' is not found in PATH." % argv[0])
+            argv[0] = program
+        command = super().__new__(cls, cmd)
+        command.argv = argv
+        return command
+
+
+def time_left(timeout=None, deadline=None):
+    """
+    Seconds a command may run for.
+    :param timeout: Seconds allowed for the command itself (optional)
+    :param deadline: time.monotonic() by which the whole run should end (optional)
+    :return: float or None if there is no limit
+    """
+    limits = []
+    if timeout is not None:
+        limits.append(timeout)
+    if deadline is not None:
+        limits.append(deadline - time.monotonic())
+    return max(min(limits), 0.0) if limits else None
+
+
+def inherits(stream, fd):
+    """Whether a child writing straight to the file descriptor ends up where the stream goes"""
+    try:
+        return stream.fileno() == fd
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def kilobytes(max_rss):
+    """Peak memory of getrusage() in kilobytes, macOS reports it in bytes"""
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+def own_max_rss():
+    """Peak memory of LordCommander itself in kilobytes"""
+    import resource
+    return kilobytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def signal_group(pid, signum):
+    """Send a signal to the process group led by the pid, if it's still there"""
+    try:
+        os.killpg(pid, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class Executor:
+    """
+    Runs a shell command inside an instance directory.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Children running right now, by pid
+        self._running = {}
+        self.cancelled = False
+    
+    def run(self, cmd, instance_path, timeout=None, deadline=None, sink=None, foreground=False):
+        """
+        Run the command in the specified directory and wait for it.
+        :param cmd: The command to run, either for the shell or a DirectCommand
+        :param instance_path: Path where the command should execute
+        :param timeout: Seconds after which the command is killed (optional)
+        :param deadline: time.monotonic() after which the command is killed (optional)
+        :param sink: Callable taking the stream name and a chunk of output, the
+                     output goes to our stdout and stderr by default (optional)
+        :param foreground: Keep the child in our process group unless it has a time limit,
+                           nothing else runs alongside it then (optional)
+        :return: ExecutionResult or None if the run has been cancelled
+        """
+        started = time.monotonic()
+        limit = time_left(timeout, deadline)
+        if limit is not None and limit <= 0:
+            return ExecutionResult(instance_path, None, 0.0, timed_out=True)
+        # Unless its output is wanted or redirected, the child writes straight to our
+        # terminal, so it keeps its colors, progress bars and columns
+        piped = sink is not None or not (inherits(sys.stdout, 1) and inherits(sys.stderr, 2))
+        if not piped:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        with self._lock:
+            if self.cancelled:
+                return None
+            argv = getattr(cmd, 'argv', None)
+            # Only a group of its own can be killed as a whole
+            detached = not foreground or limit is not None
+            process = subprocess.Popen(cmd if argv is None else argv, shell=argv is None,
+                                       cwd=str(instance_path), start_new_session=detached,
+                                       stdout=subprocess.PIPE if piped else None,
+                                       stderr=subprocess.PIPE if piped else None)
+            process.detached = detached
+            self._running[process.pid] = process
+        ends = None if limit is None else started + limit
+        try:
+            output, timed_out = self._forward(process, ends, sink) if piped else (None, False)
+            # The output may end long before the child does, it gets what is left of its time
+            returncode, max_rss, expired = self._wait(process, None if timed_out else ends)
+        except BaseException:
+            # Interrupted, don't leave the command behind
+            self._terminate([process])
+            self._wait(process)
+            raise
+        finally:
+            with self._lock:
+                self._running.pop(process.pid, None)
+        return ExecutionResult(instance_path, returncode, time.monotonic() - started, max_rss, output,
+                               timed_out or expired)
+    
+    def cancel(self):
+        """Start no more commands and terminate the ones running, safe to call from any thread"""
+        with self._lock:
+            self.cancelled = True
+            running = list(self._running.values())
+        self._terminate(running)
+    
+    @staticmethod
+    def _exited(process):
+        """Whether the child has exited, without reaping it"""
+        try:
+            return os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+        except ChildProcessError:
+            return True
+    
+    @staticmethod
+    def _signal(process, signum):
+        """Send a signal to the process group of the child, or to the child alone in the foreground"""
+        if process.detached:
+            signal_group(process.pid, signum)
+            return
+        try:
+            os.kill(process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    @classmethod
+    def _terminate(cls, processes):
+        """SIGTERM the process groups, then SIGKILL those still alive after the grace period"""
+        for process in processes:
+            cls._signal(process, signal.SIGTERM)
+        ends = time.monotonic() + KILL_GRACE
+        alive = list(processes)
+        while alive and time.monotonic() < ends:
+            time.sleep(0.02)
+            alive = [process for process in alive if not cls._exited(process)]
+        for process in processes:
+            # Anything else started by the command goes too, where it has a group of its own
+            if process.detached or not cls._exited(process):
+                cls._signal(process, signal.SIGKILL)
+    
+    @classmethod
+    def _forward(cls, process, deadline=None, sink=None):
+        """Pass the output of the child on to our stdout and stderr as it comes,
+        until it is done, or has exited leaving its pipes to something running in
+        the background, or the deadline has passed"""
+        output = OutputDigest()
+        timed_out = False
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ, 'stdout')
+            selector.register(process.stderr, selectors.EVENT_READ, 'stderr')
+            while selector.get_map():
+                if deadline is not None and time.monotonic() >= deadline:
+                    if timed_out:
+                        # Still not gone, or its pipes are held by a process that has left the group
+                        signal_group(process.pid, signal.SIGKILL)
+                        break
+                    timed_out = True
+                    signal_group(process.pid, signal.SIGTERM)
+                    deadline = time.monotonic() + KILL_GRACE
+                left = None if deadline is None else max(deadline - time.monotonic(), 0)
+                ready = selector.select(EXIT_CHECK if left is None else min(left, EXIT_CHECK))
+                if not ready and not timed_out and cls._exited(process):
+                    break
+                for key, _ in ready:
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                        continue
+                    output.update(key.data, chunk)
+                    if sink is not None:
+                        sink(key.data, chunk)
+                    else:
+                        # Looked up every time, so redirections are honored
+                        forward(getattr(sys, key.data), chunk)
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+        if timed_out:
+            # The leader is not reaped yet, so the group can still be reached
+            signal_group(process.pid, signal.SIGKILL)
+        return output, timed_out
+    
+    @classmethod
+    def _exited_by(cls, process, deadline):
+        """Whether the child exits before the deadline, without reaping it"""
+        pause = 0.001
+        while not cls._exited(process):
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            time.sleep(min(pause, left))
+            pause = min(pause * 2, 0.05)
+        return True
+    
+    @classmethod
+    def _wait(cls, process, deadline=None):
+        """Reap the child, terminating its group first if it has not exited by the deadline.
+        Returns the return code, the peak memory and whether it has run out of time"""
+        timed_out = deadline is not None and not cls._exited_by(process, deadline)
+        if timed_out:
+            signal_group(process.pid, signal.SIGTERM)
+            if not cls._exited_by(process, time.monotonic() + KILL_GRACE):
+                signal_group(process.pid, signal.SIGKILL)
+        return cls._reap(process) + (timed_out,)
+    
+    @staticmethod
+    def _reap(process):
+        """Reap the child with wait4 to get its resource usage along with the status"""
+        if not hasattr(os, 'wait4'):
+            return process.wait(), None
+        
+        while True:
+            try:
+                _, status, usage = os.wait4(process.pid, 0)
+                break
+            except InterruptedError:
+                continue
+        returncode = Executor._decode_status(status)
+        # Let Popen know the child is gone so it won't try to reap it again
+        process.returncode = returncode
+        max_rss = kilobytes(usage.ru_maxrss)
+        # A child starts out with the peak of LordCommander itself, as it is forked off
+        # it, so only a higher one is its own
+        if max_rss <= own_max_rss():
+            max_rss = None
+        return returncode, max_rss
+    
+    @staticmethod
+    def _decode_status(status):
+        """Convert a raw wait status to a subprocess style return code"""
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
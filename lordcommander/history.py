@@ -0,0 +1,370 @@
+"""
+---------------------------------------------------------------------
+history.py
+---------------------------------------------------------------------
+This module keeps the history of runs. Every run is appended to
+history.jsonl inside the data directory: a line when it starts
+with the command and the selection, a compact line per instance
+with its exit code, duration, output size and output digest, and
+a line with the totals when it ends. Instance lines are collected
+and written in batches, so recording costs next to nothing even
+with thousands of instances. `lc history` reads them back.
+
+Once history.jsonl has grown past a limit it is moved aside to
+history.jsonl.1, replacing the older one, so reading the history
+never costs more than two such files. The last duration of every
+instance, which orders concurrent runs, is also kept apart in
+durations.json by project and command, so it is found without
+going through the history at all.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from lordcommander.output import Output
+
+HISTORY_NAME = 'history.jsonl'
+INDEX_NAME = 'durations.json'
+
+# Bytes of history.jsonl after which it is moved aside for a new one
+ROTATE_BYTES = 32 * 1024 * 1024
+# Commands of a project whose durations are kept, the least recently run are dropped
+INDEX_COMMANDS = 64
+
+# Instance lines kept in memory before they are written
+BATCH_SIZE = 512
+# Seconds after which pending lines are written anyway
+BATCH_INTERVAL = 2.0
+
+
+def _dumps(record):
+    return json.dumps(record, separators=(',', ':'), ensure_ascii=False)
+
+
+class DurationIndex:
+    """
+    The last duration of every instance by project and command.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        :return: Dictionary of projects, each a dictionary of commands from the least to
+                 the most recently run, each a dictionary of seconds by instance name
+        """
+        try:
+            with open(self.path, encoding='utf-8') as index:
+                data = json.load(index)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def get(self, project, command=None):
+        """
+        Get the last duration of each instance.
+        :param project: Name of the project
+        :param command: Only of this command, of any command by default (optional)
+        :return: Dictionary of seconds by instance name
+        """
+        commands = self.load().get(project, {})
+        if command is not None:
+            return dict(commands.get(str(command), {}))
+        durations = {}
+        for recorded in commands.values():
+            durations.update(recorded)
+        return durations
+
+    def update(self, changes):
+        """
+        Merge new durations into the index.
+        :param changes: List of (project, command, dictionary of seconds by instance name)
+        """
+        with open(self.path + '.lock', 'a') as lock:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            data = self.load()
+            for project, command, durations in changes:
+                commands = data.setdefault(project, {})
+                # Moved to the end, as the most recently run
+                recorded = commands.pop(str(command), {})
+                recorded.update(durations)
+                commands[str(command)] = recorded
+                while len(commands) > INDEX_COMMANDS:
+                    del commands[next(iter(commands))]
+            temporary = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temporary, 'w', encoding='utf-8') as index:
+                json.dump(data, index, separators=(',', ':'), ensure_ascii=False)
+            os.replace(temporary, self.path)
+
+
+class RunRecorder:
+    """
+    Records a single run, safe to use from several threads.
+    """
+
+    def __init__(self, path, run_id, index=None):
+        self.run_id = run_id
+        self._path = path
+        self._index = index
+        self._lock = threading.Lock()
+        self._pending = []
+        self._flushed = time.monotonic()
+        self._started = time.monotonic()
+        self._run = None
+        self._durations = {}
+
+    def _append(self, record, force=False):
+        with self._lock:
+            self._pending.append(_dumps(record))
+            if force or len(self._pending) >= BATCH_SIZE or \
+                    time.monotonic() - self._flushed >= BATCH_INTERVAL:
+                self._flush()
+
+    def _flush(self):
+        """Write pending lines with a single append"""
+        if not self._pending:
+            return
+        data = ('\n'.join(self._pending) + '\n').encode()
+        self._pending = []
+        self._flushed = time.monotonic()
+        fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def start(self, project, command, selection):
+        self._run = (project, command)
+        self._append({'type': 'run', 'run': self.run_id, 'project': project, 'command': command,
+                      'selection': selection, 'started': time.time()}, force=True)
+
+    def record(self, index, name, result=None, state=None):
+        """
+        Record the outcome of an instance.
+        :param index: Index of the instance
+        :param name: Name of the instance
+        :param result: ExecutionResult, None if the command never ran (optional)
+        :param state: Why the command did not run (optional)
+        """
+        record = {'type': 'instance', 'run': self.run_id, 'index': index, 'name': name}
+        if result is None:
+            record.update(code=None, state=state or 'not started')
+        else:
+            record.update(code=result.returncode, duration=round(result.duration, 4))
+            with self._lock:
+                self._durations[name] = record['duration']
+            if result.timed_out:
+                record['timed_out'] = True
+            if result.output is not None:
+                record.update(out=result.output.stdout_bytes, err=result.output.stderr_bytes,
+                              digest=result.output.hexdigest())
+            if result.steps is not None:
+                from lordcommander.script import step_records
+                record['steps'] = step_records(result.steps)
+        self._append(record)
+
+    def finish(self, succeeded, failed, complete=True, timed_out=0):
+        """
+        Record the totals of the run.
+        :param complete: False if the run has been interrupted (optional)
+        :param timed_out: Number of instances killed for running out of time (optional)
+        """
+        self._append({'type': 'end', 'run': self.run_id, 'succeeded': succeeded, 'failed': failed,
+                      'timed_out': timed_out, 'complete': complete,
+                      'duration': round(time.monotonic() - self._started, 4)}, force=True)
+        if self._index is not None and self._run is not None and self._durations:
+            project, command = self._run
+            try:
+                self._index.update([(project, command, self._durations)])
+            except OSError:
+                # Rebuilt from the history when it is missing
+                pass
+
+
+class RunHistory:
+    """
+    The history file of LordCommander.
+    """
+
+    def __init__(self, data_dir):
+        self._path = os.path.join(data_dir, HISTORY_NAME)
+        self._index = DurationIndex(os.path.join(data_dir, INDEX_NAME))
+
+    def begin(self, project, command, selection):
+        """
+        Start recording a run.
+        :param project: Name of the project
+        :param command: The command to run
+        :param selection: Dictionary of the arguments selecting the instances
+        :return: RunRecorder
+        """
+        run_id = "%s-%s" % (time.strftime('%Y%m%d%H%M%S'), os.urandom(3).hex())
+        try:
+            if os.path.getsize(self._path) > ROTATE_BYTES:
+                os.replace(self._path, self._path + '.1')
+        except OSError:
+            pass
+        if not self._index.exists():
+            self._rebuild_index()
+        recorder = RunRecorder(self._path, run_id, self._index)
+        recorder.start(project, command, selection)
+        return recorder
+
+    def _records(self, kinds, run_ids=None):
+        """Parse only the lines of the given types, and of the given runs if any, the oldest first"""
+        prefixes = tuple('{"type":"%s"' % kind for kind in kinds)
+        markers = {'"run":%s' % json.dumps(run_id) for run_id in run_ids} if run_ids is not None else None
+        for path in (self._path + '.1', self._path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as lines:
+                for line in lines:
+                    if not line.startswith(prefixes):
+                        continue
+                    if markers is not None:
+                        start = line.find('"run":')
+                        if line[start:line.find(',', start)] not in markers:
+                            continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash, skip it
+                        continue
+
+    def _rebuild_index(self):
+        """Build the index of durations from the history, once, for histories kept before it"""
+        runs = {run['run']: run for run in self.runs()}
+        if not runs:
+            return
+        changes = []
+        for record in self._records(('instance',)):
+            run = runs.get(record['run'])
+            if run is None or record.get('duration') is None:
+                continue
+            changes.append((run['project'], run['command'], {record['name']: record['duration']}))
+        try:
+            self._index.update(changes)
+        except OSError:
+            pass
+
+    def runs(self, limit=None):
+        """
+        Get the runs, the most recent last, each merged with its totals.
+        :param limit: Number of most recent runs (optional)
+        :return: list
+        """
+        runs = {}
+        for record in self._records(('run', 'end')):
+            runs.setdefault(record['run'], {}).update(record)
+        runs = [run for run in runs.values() if 'command' in run]
+        return runs[-limit:] if limit else runs
+
+    def instances(self, run_id):
+        """
+        Get the instance records of a run.
+        :param run_id: ID of the run
+        :return: list
+        """
+        return list(self._records(('instance',), {run_id}))
+
+    def _runs_of(self, project, command):
+        return [run for run in self.runs() if run['project'] == project and run['command'] == command]
+
+    def failed(self, project, command):
+        """
+        Get the instances whose last exit code for the command was not zero.
+        :param project: Name of the project
+        :param command: The command
+        :return: Set of instance names
+        """
+        runs = self._runs_of(project, command)
+        last = {}
+        for record in self._records(('instance',), {run['run'] for run in runs}):
+            last[record['name']] = record['code']
+        return {name for name, code in last.items() if code != 0}
+
+    def durations(self, project, command=None):
+        """
+        Get the last duration recorded for each instance.
+        :param project: Name of the project
+        :param command: Only look at the runs of this command (optional)
+        :return: Dictionary of seconds by instance name
+        """
+        if not self._index.exists():
+            self._rebuild_index()
+        return self._index.get(project, command)
+
+    def unfinished(self, project, command):
+        """
+        Find the last run of the command if it has been interrupted.
+        :param project: Name of the project
+        :param command: The command
+        :return: Tuple of the selection of the original run, names of the instances
+                 done so far and the ID of the run, or None if the last run was complete
+        """
+        runs = self._runs_of(project, command)
+        if not runs or runs[-1].get('complete', False):
+            return None
+        # Follow the chain of resumed runs back to the original one
+        by_id = {run['run']: run for run in runs}
+        chain = [runs[-1]]
+        while chain[-1]['selection'].get('resumed_from') in by_id:
+            chain.append(by_id[chain[-1]['selection']['resumed_from']])
+        done = {record['name'] for record in self._records(('instance',), {run['run'] for run in chain})}
+        return chain[-1]['selection'], done, runs[-1]['run']
+
+    def view(self, run=None, limit=20):
+        """
+        Show recent runs, or the instances of a single run.
+        :param run: ID of the run (optional)
+        :param limit: Number of most recent runs to list (optional)
+        """
+        if run is not None:
+            return self._view_run(str(run))
+
+        runs = self.runs(limit)
+        if not runs:
+            Output.danger("No run has been recorded yet.")
+            return
+        for entry in runs:
+            totals = "%s/%s" % (entry.get('succeeded', '?'), entry.get('failed', '?'))
+            duration = "%.2fs" % entry['duration'] if 'duration' in entry else 'unfinished'
+            print("%s  %s  %-12s %-10s %s: %s" % (
+                entry['run'], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['started'])),
+                duration, totals, entry['project'], Output.colorize(entry['command'], Output.WARNING)))
+        Output.normal("\nTotal %d runs listed. Succeeded/failed shown beside the duration." % len(runs))
+
+    def _view_run(self, run_id):
+        instances = self.instances(run_id)
+        if not instances:
+            Output.danger("Run %s is not found in the history." % run_id)
+            return
+        for record in instances:
+            if record.get('timed_out'):
+                status = Output.colorize('timed out', Output.DANGER) + " %.2fs" % record['duration']
+            elif record['code'] is None:
+                status = Output.colorize(record['state'], Output.DANGER)
+            else:
+                status = Output.colorize(record['code'], Output.SUCCESS if record['code'] == 0 else Output.DANGER)
+                status += " %.2fs" % record['duration']
+                if 'digest' in record:
+                    status += Output.colorize(" %d/%d bytes %s" % (
+                        record['out'], record['err'], record['digest']), Output.MUTED)
+            print("- {} ({}): {}".format(record['name'], record['index'], status))
+        Output.normal("\nTotal %d instances listed." % len(instances))
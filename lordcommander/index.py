@@ -0,0 +1,116 @@
+"""
+---------------------------------------------------------------------
+index.py
+---------------------------------------------------------------------
+This module provides an index over the directories/instances of a
+project. The instances stay in the very same list that is stored
+in the shelve module, so the insertion order remains the source of
+truth, while a name to position map answers lookups in constant
+time instead of scanning the list over and over again.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+
+class InstanceIndex:
+    """
+    Ordered list of instances with constant time lookup by name.
+    """
+    
+    def __init__(self, instances):
+        # The list is shared, not copied, changes made here are persisted
+        self._instances = instances
+        self._positions = self._build(instances)
+    
+    @staticmethod
+    def _build(instances):
+        """Map every name to the position of its first occurrence"""
+        positions = {}
+        for position, name in enumerate(instances):
+            positions.setdefault(name, position)
+        return positions
+    
+    @classmethod
+    def of(cls, instances):
+        """Wrap a list of instances unless it is already indexed"""
+        return instances if isinstance(instances, cls) else cls(instances)
+    
+    @property
+    def instances(self):
+        return self._instances
+    
+    def __len__(self):
+        return len(self._instances)
+    
+    def __iter__(self):
+        return iter(self._instances)
+    
+    def __contains__(self, name):
+        return name in self._positions
+    
+    def position(self, name):
+        """
+        Get the index of an instance.
+        :param name: Name of the instance
+        :return: int or None if the instance is not in the list
+        """
+        return self._positions.get(name)
+    
+    def items(self, sort=False):
+        """
+        Get (index, name) pairs, in insertion order or sorted by name.
+        :param sort: Sort alphabetically, false by default (optional)
+        :return: list
+        """
+        if sort:
+            return [(self._positions[name], name) for name in sorted(self._instances)]
+        return [(self._positions[name], name) for name in self._instances]
+    
+    def select(self, li=0, ui=None, ex=(), inc=()):
+        """
+        Slice the instances by li and ui, then exclude the indices in ex
+        or keep only the indices in inc.
+        :return: List of (index, name) pairs
+        """
+        ex = set(ex)
+        inc = set(inc)
+        selected = []
+        for name in self._instances[li:ui]:
+            position = self._positions[name]
+            if inc and position not in inc or not inc and position in ex:
+                continue
+            selected.append((position, name))
+        return selected
+    
+    def extend(self, names):
+        """
+        Append new instances, names already in the list are skipped.
+        :param names: Iterable of instance names
+        :return: List of names actually added
+        """
+        added = []
+        for name in names:
+            if name in self._positions:
+                continue
+            self._positions[name] = len(self._instances)
+            self._instances.append(name)
+            added.append(name)
+        return added
+    
+    def remove(self, names):
+        """
+        Remove instances from the list in a single pass.
+        :param names: Iterable of instance names
+        :return: Set of names actually removed
+        """
+        removed = {name for name in names if name in self._positions}
+        if removed:
+            self._instances[:] = [name for name in self._instances if name not in removed]
+            self._positions = self._build(self._instances)
+        return removed
+    
+    def clear(self):
+        """Remove every instance."""
+        self._instances.clear()
+        self._positions.clear()
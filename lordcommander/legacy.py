@@ -0,0 +1,62 @@
+"""
+---------------------------------------------------------------------
+legacy.py
+---------------------------------------------------------------------
+This module holds the legacy storage backend, the writeback shelve
+that has been used until version 5.0. Since a shelve can't be
+shared between processes, it is guarded by an exclusive file lock
+while it is open. It lives apart from the storage module so that
+pickle and dbm are loaded only when the shelve is really used.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import shelve
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class LockedShelf(shelve.DbfilenameShelf):
+    """
+    A writeback shelve holding an exclusive lock on a side file while open.
+    """
+    
+    def __init__(self, filename, **kwargs):
+        self._lock = open(filename + '.lock', 'a')
+        if fcntl is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_EX)
+        try:
+            super().__init__(filename, **kwargs)
+        except Exception:
+            self._release()
+            raise
+    
+    def _release(self):
+        if self._lock is not None:
+            # Closing the file releases the lock
+            self._lock.close()
+            self._lock = None
+    
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._release()
+
+
+def open_shelve(path):
+    """
+    Open the legacy shelve module and create expected structure if necessary.
+    :param path: Path of the shelve file without extension
+    :return: shelve
+    """
+    # Setting writeback mode to True to persist changes.
+    lcdb = LockedShelf(path, writeback=True)
+    if not all(key in lcdb.keys() for key in ['active', 'projects']):
+        lcdb['active'] = ''
+        lcdb['projects'] = {}
+    return lcdb
@@ -0,0 +1,156 @@
+"""
+---------------------------------------------------------------------
+metrics.py
+---------------------------------------------------------------------
+This module writes the metrics of a run in the OpenMetrics text
+format, to be picked up by the textfile collector of node_exporter
+or anything else reading such files. The file holds the number of
+instances that succeeded, failed and timed out, a histogram of how
+long the instances took, the time spent on the pre-flight checks,
+the most instances running at once and how long the run took, all
+labeled by project and command.
+
+The file is written at the end of the run, and every few seconds
+during it if asked. It is written to a temporary file first which
+then takes the place of the old one, so a reader never sees half of
+it.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import os
+import threading
+import time
+
+# Upper bounds of the buckets of the duration histogram, in seconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def escape(value):
+    """Escape a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RunMetrics:
+    """
+    Metrics of a single run, safe to update from several threads.
+    """
+
+    def __init__(self, path, project, command, interval=None):
+        """
+        :param path: File the metrics are written to
+        :param project: Name of the project, a label of every metric
+        :param command: The command run, a label of every metric
+        :param interval: Seconds between two writes during the run (optional)
+        """
+        self.path = path
+        self._labels = 'project="%s",command="%s"' % (escape(project), escape(command))
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._counts = {'succeeded': 0, 'failed': 0, 'timed_out': 0}
+        self._buckets = [0] * len(BUCKETS)
+        self._sum = 0.0
+        self._observed = 0
+        self.preflight = 0.0
+        self.peak = 0
+        self.complete = False
+        self._started = time.monotonic()
+        self._started_at = time.time()
+        self._ended = None
+        self._writer = None
+        self._stop = threading.Event()
+
+    def observe(self, result, counts):
+        """
+        Account the outcome of an instance.
+        :param result: ExecutionResult, None if the command could not be started
+        :param counts: Dictionary of the succeeded, failed and timed out instances
+                       so far, as the controller has counted them
+        """
+        with self._lock:
+            self._counts = dict(counts)
+            if result is None:
+                return
+            for position, bound in enumerate(BUCKETS):
+                if result.duration <= bound:
+                    self._buckets[position] += 1
+            self._sum += result.duration
+            self._observed += 1
+
+    def concurrency(self, peak):
+        """Account the most instances that have been running at once"""
+        with self._lock:
+            self.peak = max(self.peak, peak)
+
+    def render(self):
+        """
+        The metrics in the OpenMetrics text format.
+        :return: str
+        """
+        labels = self._labels
+        with self._lock:
+            duration = (self._ended if self._ended is not None else time.monotonic()) - self._started
+            lines = ['# TYPE lc_run_instances counter',
+                     '# HELP lc_run_instances Instances the command has been run in, by outcome.']
+            lines += ['lc_run_instances_total{%s,outcome="%s"} %d' % (labels, outcome, count)
+                      for outcome, count in self._counts.items()]
+            lines += ['# TYPE lc_run_instance_duration_seconds histogram',
+                      '# HELP lc_run_instance_duration_seconds Time the command has taken in an instance.',
+                      '# UNIT lc_run_instance_duration_seconds seconds']
+            lines += ['lc_run_instance_duration_seconds_bucket{%s,le="%s"} %d' % (labels, float(bound), count)
+                      for bound, count in zip(BUCKETS, self._buckets)]
+            lines += ['lc_run_instance_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, self._observed),
+                      'lc_run_instance_duration_seconds_count{%s} %d' % (labels, self._observed),
+                      'lc_run_instance_duration_seconds_sum{%s} %.6f' % (labels, self._sum)]
+            for name, unit, description, value in (
+                    ('lc_run_preflight_seconds', 'seconds', 'Time spent checking the directories.',
+                     '%.6f' % self.preflight),
+                    ('lc_run_peak_concurrency', None, 'Most instances running at once.', '%d' % self.peak),
+                    ('lc_run_duration_seconds', 'seconds', 'Time the run has taken so far.', '%.6f' % duration),
+                    ('lc_run_start_timestamp_seconds', 'seconds', 'When the run has started.',
+                     '%.3f' % self._started_at),
+                    ('lc_run_complete', None, 'Whether every instance has been run.',
+                     '1' if self.complete else '0')):
+                lines += ['# TYPE %s gauge' % name, '# HELP %s %s' % (name, description)]
+                if unit is not None:
+                    lines.append('# UNIT %s %s' % (name, unit))
+                lines.append('%s{%s} %s' % (name, labels, value))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """Write the metrics to the file at once, through a temporary file next to it"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        temporary = os.path.join(directory, '.%s.%d.tmp' % (os.path.basename(self.path), os.getpid()))
+        with open(temporary, 'w') as metrics:
+            metrics.write(self.render())
+        os.replace(temporary, self.path)
+
+    def start(self):
+        """Write the metrics every interval until the run is finished, if an interval is given"""
+        if self._interval is None:
+            return
+
+        def keep_writing():
+            while not self._stop.wait(self._interval):
+                try:
+                    self.write()
+                except OSError:
+                    pass
+
+        self._writer = threading.Thread(target=keep_writing, name='lc-metrics', daemon=True)
+        self._writer.start()
+
+    def finish(self, complete):
+        """
+        Stop the periodic writes and write the metrics of the finished run.
+        :param complete: False if the run has been interrupted
+        """
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+        with self._lock:
+            self.complete = complete
+            self._ended = time.monotonic()
+        self.write()
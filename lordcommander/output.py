@@ -3,18 +3,43 @@
 output.py
 ---------------------------------------------------------------------
 This module provides a fancy way to show output, errors, warnings,
-or info on CLI.
+or info on CLI. Colors are only used on a terminal, so output piped
+to a file or another program is plain text.
 
 Version: 5.x
 License: GNU General Public License 3
 """
 
-from colr import color
+import os
+import sys
+
+
+def wants_color(stream=None, env=None):
+    """
+    Whether to color what is written to the stream. NO_COLOR turns colors
+    off and FORCE_COLOR turns them on, otherwise only a terminal gets them.
+    :param stream: The text stream, sys.stdout by default
+    :param env: The environment, os.environ by default
+    :return: bool
+    """
+    stream = stream if stream is not None else sys.stdout
+    env = env if env is not None else os.environ
+    if env.get('NO_COLOR'):
+        return False
+    if env.get('FORCE_COLOR'):
+        return True
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
 
 
 class Output:
     """Handles all output messages and formats them according to specified color code."""
 
+    # See wants_color() and https://no-color.org
+    COLORED = wants_color()
+
     # Message color codes
     SUCCESS = 'GREEN'
     INFO = '0060a0'
@@ -22,6 +47,36 @@ class Output:
     DANGER = 'RED'
     MUTED = '6a6a6a'
 
+    # Escape codes colr gives for the codes above, colr itself is loaded only for other codes
+    ESCAPES = {
+        SUCCESS: '\x1b[32m',
+        INFO: '\x1b[38;5;25m',
+        WARNING: '\x1b[33m',
+        DANGER: '\x1b[31m',
+        MUTED: '\x1b[38;5;59m',
+        '': ''
+    }
+    RESET = '\x1b[0m'
+
+    @staticmethod
+    def colorize(text, code=''):
+        """
+        Paint the text with the color code, colr is loaded only for unknown codes.
+        :param text: Anything printable
+        :param code: str
+        :return: str
+        """
+        text = f"{text}"
+        if not Output.COLORED:
+            return text
+        escape = Output.ESCAPES.get(code)
+        if escape is None:
+            from colr import color
+            return color(text, fore=code)
+        if not text or text.endswith(Output.RESET):
+            return escape + text
+        return escape + text + Output.RESET
+
     @staticmethod
     def write(message, code='', end='\n'):
         """
@@ -33,13 +88,12 @@ class Output:
         :return: None
         """
         if isinstance(message, list):
-            for segment in message:
-                Output.write(
-                    color(f"{segment['text']}", fore=segment['code']), end=' ')
-            print('\n')
+            # A single write for the whole line
+            print(''.join(Output.colorize(segment['text'], segment['code']) + ' ' for segment in message),
+                  end='\n\n')
             return
 
-        print(color(f"{message}", fore=code), end=end)
+        print(Output.colorize(message, code), end=end)
 
     @staticmethod
     def normal(message, end='\n'):
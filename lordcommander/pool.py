@@ -0,0 +1,267 @@
+"""
+---------------------------------------------------------------------
+pool.py
+---------------------------------------------------------------------
+This module holds a pool of long-lived shells to run short commands
+in. Starting a shell for every instance often takes longer than
+the command itself, e.g. `git status -s`. A worker of the pool is a
+single bash process that is sent one command after another, each
+one run in a subshell inside its instance directory, so no state
+like the working directory or variables leaks from one instance to
+the next. A subshell is a plain fork of the warm shell, without
+starting any program.
+
+After every command the worker writes a sentinel to both of its
+streams, carrying the exit code on stdout. The sentinel holds a
+random token, so it can't be mistaken for the output of a command.
+When a command runs out of time the whole worker is terminated and
+a fresh one takes its place. A cancelled worker is woken through a
+pipe of its own, and only the thread running the command closes its
+streams, so no thread is left waiting on a closed one.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import os
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from lordcommander.executor import (KILL_GRACE, ExecutionResult, OutputDigest, forward, signal_group,
+                                    time_left)
+
+
+class _Demux:
+    """Splits the output of a command from the sentinel following it on a stream"""
+
+    def __init__(self, marker):
+        self._marker = marker
+        self._buffer = b''
+        self.trailer = None
+
+    def feed(self, chunk):
+        """
+        Take a chunk read from the stream.
+        :return: The part of it that is output of the command
+        """
+        self._buffer += chunk
+        found = self._buffer.find(self._marker)
+        if found >= 0:
+            end = self._buffer.find(b'\n', found)
+            if end < 0:
+                # The rest of the sentinel is yet to come
+                output, self._buffer = self._buffer[:found], self._buffer[found:]
+                return output
+            output = self._buffer[:found]
+            self.trailer = self._buffer[found + len(self._marker):end]
+            self._buffer = b''
+            return output
+        # Hold back what may be the beginning of the sentinel
+        keep = len(self._marker) - 1
+        output, self._buffer = self._buffer[:-keep], self._buffer[-keep:]
+        return output
+
+
+class ShellWorker:
+    """
+    A shell running the commands sent to it one by one.
+    """
+
+    def __init__(self, shell):
+        self._token = os.urandom(8).hex()
+        self.process = subprocess.Popen(
+            [shell], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True, env=dict(os.environ, CDPATH=''))
+        self.alive = True
+        self.cancelled = False
+        # Written to by cancel(), wakes the thread reading the output
+        self._wake = os.pipe()
+        self._lock = threading.Lock()
+
+    def run(self, cmd, instance_path, limit=None, sink=None):
+        """
+        Run the command in the instance directory in a subshell.
+        :param cmd: The command to run
+        :param instance_path: Path where the command should execute
+        :param limit: Seconds after which the command is killed along with the worker (optional)
+        :param sink: Callable taking the stream name and a chunk of output (optional)
+        :return: Tuple of the exit code, OutputDigest and whether it has timed out, or None
+                 if the worker has been cancelled
+        """
+        script = ("( cd -- {path} && eval {cmd} ) </dev/null\n"
+                  "printf '\\0%s:%d\\n' {token} \"$?\"\n"
+                  "printf '\\0%s:\\n' {token} >&2\n").format(
+            path=shlex.quote(str(instance_path)), cmd=shlex.quote(cmd), token=self._token)
+        try:
+            self.process.stdin.write(script.encode(errors='surrogateescape'))
+            self.process.stdin.flush()
+        except OSError:
+            self.close()
+            if self.cancelled:
+                return None
+            raise OSError("A worker of the shell pool has died.")
+
+        marker = b'\0' + self._token.encode() + b':'
+        streams = {'stdout': _Demux(marker), 'stderr': _Demux(marker)}
+        output = OutputDigest()
+        deadline = None if limit is None else time.monotonic() + limit
+        timed_out = False
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ, 'stdout')
+            selector.register(self.process.stderr, selectors.EVENT_READ, 'stderr')
+            selector.register(self._wake[0], selectors.EVENT_READ, 'wake')
+            while any(demux.trailer is None for demux in streams.values()):
+                if deadline is not None and time.monotonic() >= deadline:
+                    timed_out = True
+                    break
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                for key, _ in selector.select(timeout):
+                    if key.data == 'wake':
+                        self.close()
+                        return None
+                    demux = streams[key.data]
+                    if demux.trailer is not None:
+                        continue
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        self.close()
+                        if self.cancelled:
+                            return None
+                        raise OSError("A worker of the shell pool has died.")
+                    data = demux.feed(chunk)
+                    if data:
+                        output.update(key.data, data)
+                        if sink is not None:
+                            sink(key.data, data)
+                        else:
+                            forward(getattr(sys, key.data), data)
+        if timed_out:
+            self.close()
+            return None, output, True
+        return int(streams['stdout'].trailer), output, False
+
+    def cancel(self):
+        """Wake the thread running a command, which then terminates the worker,
+        safe to call from any thread"""
+        with self._lock:
+            self.cancelled = True
+            if self.alive:
+                os.write(self._wake[1], b'\0')
+
+    def close(self):
+        """Terminate the worker along with anything it is running, only to be called
+        by the thread running its commands or while it is idle"""
+        with self._lock:
+            if not self.alive:
+                return
+            self.alive = False
+        signal_group(self.process.pid, signal.SIGTERM)
+        try:
+            self.process.wait(KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            pass
+        signal_group(self.process.pid, signal.SIGKILL)
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        with self._lock:
+            for fd in self._wake:
+                os.close(fd)
+
+
+class ShellPool:
+    """
+    Runs commands in a pool of long-lived shells. Takes the place of the
+    Executor, a worker is started for every thread running commands at once.
+    """
+
+    def __init__(self, shell=None):
+        self._shell = shell or shutil.which('bash') or '/bin/sh'
+        self._lock = threading.Lock()
+        self._idle = []
+        self._workers = []
+        self.cancelled = False
+
+    @property
+    def size(self):
+        return len(self._workers)
+
+    def _checkout(self):
+        with self._lock:
+            if self.cancelled:
+                return None
+            if self._idle:
+                return self._idle.pop()
+            worker = ShellWorker(self._shell)
+            self._workers.append(worker)
+            return worker
+
+    def _checkin(self, worker):
+        with self._lock:
+            if worker.alive:
+                self._idle.append(worker)
+            else:
+                self._workers.remove(worker)
+
+    def run(self, cmd, instance_path, timeout=None, deadline=None, sink=None, foreground=False):
+        """
+        Run the command in the specified directory and wait for it.
+        :param cmd: The command to run
+        :param instance_path: Path where the command should execute
+        :param timeout: Seconds after which the command is killed (optional)
+        :param deadline: time.monotonic() after which the command is killed (optional)
+        :param sink: Callable taking the stream name and a chunk of output (optional)
+        :param foreground: Ignored, the workers are never in the foreground (optional)
+        :return: ExecutionResult or None if the run has been cancelled
+        """
+        started = time.monotonic()
+        limit = time_left(timeout, deadline)
+        if limit is not None and limit <= 0:
+            return ExecutionResult(instance_path, None, 0.0, timed_out=True)
+        worker = self._checkout()
+        if worker is None:
+            return None
+        try:
+            outcome = worker.run(cmd, instance_path, limit, sink)
+        except BaseException:
+            worker.close()
+            raise
+        finally:
+            self._checkin(worker)
+        if outcome is None:
+            # Cancelled, left for 'lc run --resume'
+            return None
+        returncode, output, timed_out = outcome
+        return ExecutionResult(instance_path, returncode, time.monotonic() - started, None, output, timed_out)
+
+    def cancel(self):
+        """Start no more commands and terminate the workers, safe to call from any thread.
+        A busy worker is terminated by the thread running its command"""
+        with self._lock:
+            self.cancelled = True
+            idle, self._idle = self._idle, []
+            for worker in idle:
+                self._workers.remove(worker)
+            busy = list(self._workers)
+        for worker in busy:
+            worker.cancel()
+        for worker in idle:
+            worker.close()
+
+    def close(self):
+        """Terminate the idle workers"""
+        with self._lock:
+            workers, self._idle = self._idle, []
+            for worker in workers:
+                self._workers.remove(worker)
+        for worker in workers:
+            worker.close()
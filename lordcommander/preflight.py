@@ -0,0 +1,62 @@
+"""
+---------------------------------------------------------------------
+preflight.py
+---------------------------------------------------------------------
+This module checks whether the directories/instances of a project
+are there before a command runs. Instead of asking the filesystem
+about every single instance, the project root is read once with
+os.scandir and the answers are given from memory. Only symbolic
+links need an extra stat to find out where they are pointing.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import os
+
+# States of an instance
+PRESENT = 'present'
+MISSING = 'missing'
+NOT_A_DIRECTORY = 'not a directory'
+
+
+class DirectoryCache:
+    """
+    Entries of a project root, read in a single pass.
+    """
+    
+    def __init__(self, root):
+        self._root = str(root)
+        self._entries = {}
+        try:
+            with os.scandir(self._root) as entries:
+                for entry in entries:
+                    self._entries[entry.name] = self._state(entry)
+        except OSError:
+            # The root itself is gone, so is everything inside it
+            pass
+    
+    @staticmethod
+    def _state(entry):
+        """State of a directory entry, the type comes free with scandir except for links"""
+        try:
+            if entry.is_symlink():
+                return PRESENT if entry.is_dir() else (
+                    NOT_A_DIRECTORY if os.path.exists(entry.path) else MISSING)
+            return PRESENT if entry.is_dir(follow_symlinks=False) else NOT_A_DIRECTORY
+        except OSError:
+            return MISSING
+    
+    def state(self, instance):
+        """
+        Get the state of an instance.
+        :param instance: Name of the instance, relative to the root
+        :return: PRESENT, MISSING or NOT_A_DIRECTORY
+        """
+        if os.sep in instance or instance in (os.curdir, os.pardir):
+            # Nested paths are not in the listing, ask the filesystem
+            path = os.path.join(self._root, instance)
+            if not os.path.exists(path):
+                return MISSING
+            return PRESENT if os.path.isdir(path) else NOT_A_DIRECTORY
+        return self._entries.get(instance, MISSING)
@@ -0,0 +1,233 @@
+"""
+---------------------------------------------------------------------
+profiler.py
+---------------------------------------------------------------------
+This module tells where the time of an `lc` call goes. With
+--profile, the functions behind every phase, like loading the
+store, Fire dispatch, selecting the instances, the pre-flight
+checks, spawning the children and rendering the output, are wrapped
+to time them. For every instance the time spent starting the child
+is told apart from the time the child itself has run.
+
+The module is only loaded with --profile, and the wrappers are
+put in place only then, so the phases cost nothing otherwise. A
+table is written to stderr at the end. Optionally, the timings are
+written as a Chrome trace, to be opened in chrome://tracing or
+Perfetto, or cProfile statistics of the main thread are dumped.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+
+# Instances shown in the table, the slowest first
+SLOWEST_SHOWN = 5
+
+
+def process_age():
+    """
+    Seconds since the process has started, before Python got to run any of
+    our code. None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/stat') as stat:
+            started = int(stat.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime:
+            now = float(uptime.read().split()[0])
+        return max(now - started / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class Profiler:
+    """
+    Timings of the phases of an `lc` call, safe to use from several threads.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: File to write a Chrome trace to if it ends with .json,
+                     cProfile statistics otherwise (optional)
+        """
+        self.path = path
+        self.started = time.perf_counter()
+        self.startup = process_age()
+        # Total seconds and calls by phase, in the order they were first seen
+        self.phases = {}
+        # Spawn and total seconds of every instance by its path
+        self.instances = {}
+        # Complete events of the Chrome trace
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._patched = []
+        self._cprofile = None
+
+    def add(self, phase, started, ended, **args):
+        """Account a phase that ran from started to ended, both from time.perf_counter()"""
+        with self._lock:
+            total, calls = self.phases.get(phase, (0.0, 0))
+            self.phases[phase] = (total + ended - started, calls + 1)
+            if self.path is not None:
+                self.events.append({'name': phase, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                                    'ts': round((started - self.started) * 1e6, 1),
+                                    'dur': round((ended - started) * 1e6, 1), 'args': args})
+
+    def wrap(self, owner, name, phase):
+        """
+        Time every call of a function of a module or class as the phase.
+        :param owner: Module or class holding the function
+        :param name: Name of the function
+        :param phase: Name of the phase
+        """
+        original = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+        static = isinstance(original, staticmethod)
+        function = original.__func__ if static else original
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(phase, started, time.perf_counter())
+
+        setattr(owner, name, staticmethod(timed) if static else timed)
+        self._patched.append((owner, name, original))
+
+    def _wrap_spawn(self):
+        """Time the start of every child, it is added to the instance it is started for"""
+        import subprocess
+        original = subprocess.Popen.__init__
+
+        @functools.wraps(original)
+        def spawn(process, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(process, *args, **kwargs)
+            finally:
+                ended = time.perf_counter()
+                self._local.spawn = getattr(self._local, 'spawn', 0.0) + ended - started
+                self.add('spawn', started, ended)
+
+        subprocess.Popen.__init__ = spawn
+        self._patched.append((subprocess.Popen, '__init__', original))
+
+    def _wrap_run(self, owner):
+        """Time the instances run by an executor"""
+        original = owner.run
+
+        @functools.wraps(original)
+        def run(executor, cmd, instance_path, *args, **kwargs):
+            self._local.spawn = 0.0
+            started = time.perf_counter()
+            try:
+                return original(executor, cmd, instance_path, *args, **kwargs)
+            finally:
+                ended = time.perf_counter()
+                with self._lock:
+                    spawn, total = self.instances.get(str(instance_path), (0.0, 0.0))
+                    self.instances[str(instance_path)] = (spawn + self._local.spawn, total + ended - started)
+                self.add('instance', started, ended, instance=str(instance_path))
+
+        owner.run = run
+        self._patched.append((owner, 'run', original))
+
+    def install(self):
+        """Put the wrappers in place, importing what they wrap"""
+        started = time.perf_counter()
+        import fire
+        self.add('import fire', started, time.perf_counter())
+        started = time.perf_counter()
+        from lordcommander import commander, controllers, executor, output, pool, preflight
+        self.add('import lordcommander', started, time.perf_counter())
+
+        self.wrap(commander, 'read_data', 'load store')
+        self.wrap(commander.LordCommander, '_close', 'close store')
+        self.wrap(fire, 'Fire', 'fire dispatch')
+        self.wrap(controllers.CommandController, '_get_instances', 'select instances')
+        self.wrap(preflight.DirectoryCache, '__init__', 'pre-flight')
+        self.wrap(preflight.DirectoryCache, 'state', 'pre-flight')
+        self.wrap(output.Output, 'write', 'render output')
+        self._wrap_spawn()
+        self._wrap_run(executor.Executor)
+        self._wrap_run(pool.ShellPool)
+        if self.path is not None and not self.path.endswith('.json'):
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def uninstall(self):
+        """Put the wrapped functions back"""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+    def finish(self, stream=None):
+        """
+        Take the wrappers away, write the table and the trace or cProfile statistics.
+        :param stream: Where the table goes, sys.stderr by default
+        """
+        ended = time.perf_counter()
+        self.uninstall()
+        stream = stream if stream is not None else sys.stderr
+        self.report(ended - self.started, stream)
+        if self.path is None:
+            return
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(self.path)
+        else:
+            import json
+            with open(self.path, 'w') as trace:
+                json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, trace)
+        print("Profile is written to %s" % self.path, file=stream)
+
+    def report(self, wall, stream):
+        """Write the table of the phases and the breakdown of the instances"""
+        rows = [('start-up', 1, self.startup)] if self.startup is not None else []
+        rows += [(phase, calls, total) for phase, (total, calls) in self.phases.items()
+                 if phase not in ('spawn', 'instance')]
+        # Phases may be nested in one another, e.g. everything of a command is in its dispatch
+        wall += self.startup or 0.0
+        print("\n%-24s %8s %10s %7s" % ('Phase', 'Calls', 'Seconds', 'Share'), file=stream)
+        for phase, calls, total in rows:
+            print("%-24s %8d %10.4f %6.1f%%" % (phase, calls, total, total / wall * 100 if wall else 0),
+                  file=stream)
+        print("%-24s %8s %10.4f" % ('total', '', wall), file=stream)
+        if not self.instances:
+            return
+        spawns = [spawn for spawn, _ in self.instances.values()]
+        children = [total - spawn for spawn, total in self.instances.values()]
+        count = len(self.instances)
+        print("\n%d instances: spawn %.4fs in total (%.2fms each, at most %.2fms), "
+              "child %.4fs in total (%.2fms each)" % (
+                  count, sum(spawns), sum(spawns) / count * 1e3, max(spawns) * 1e3,
+                  sum(children), sum(children) / count * 1e3), file=stream)
+        print("%-40s %10s %10s" % ('Slowest instances', 'Spawn ms', 'Child ms'), file=stream)
+        slowest = sorted(self.instances.items(), key=lambda item: -item[1][1])[:SLOWEST_SHOWN]
+        for path, (spawn, total) in slowest:
+            print("%-40s %10.2f %10.2f" % (path[-40:], spawn * 1e3, (total - spawn) * 1e3), file=stream)
+
+
+def profile_argument(argv):
+    """
+    Take --profile or --profile=PATH out of the command line.
+    :param argv: Command line arguments without the program name
+    :return: Tuple of the rest of the arguments and the Profiler, None if not asked for
+    """
+    rest, profiler = [], None
+    for argument in argv:
+        if argument == '--profile':
+            profiler = Profiler()
+        elif argument.startswith('--profile='):
+            profiler = Profiler(argument.split('=', 1)[1] or None)
+        else:
+            rest.append(argument)
+    return rest, profiler
@@ -0,0 +1,186 @@
+"""
+---------------------------------------------------------------------
+scheduler.py
+---------------------------------------------------------------------
+This module decides in which order and how many at a time the
+instances are run. When several instances run at once, those that
+took the longest last time are started first, so the run doesn't
+end with a single slow instance running all alone. The durations
+recorded in the history also give an estimate of how long a run is
+going to take.
+
+The number of instances running at once can follow the load of
+the machine too. AdaptiveLimit lowers it while the load average is
+high or memory is getting short, and raises it back, up to the
+number of jobs asked for, once the machine has room again.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import heapq
+import os
+import threading
+import time
+
+# Load average per CPU above which fewer instances are run at once
+HIGH_LOAD = 1.25
+# Load average per CPU below which more instances are run at once
+LOW_LOAD = 0.75
+# Share of the memory that should stay available
+LOW_MEMORY = 0.10
+# Seconds between two looks at the load of the machine
+INTERVAL = 1.0
+
+
+def expected(names, durations):
+    """
+    Expected duration of each instance, those never run before are
+    expected to take the average time.
+    :param names: Names of the instances
+    :param durations: Dictionary of past durations by name
+    :return: List of seconds, None for all of them if nothing is known
+    """
+    known = [durations[name] for name in names if name in durations]
+    if not known:
+        return [None] * len(names)
+    average = sum(known) / len(known)
+    return [durations.get(name, average) for name in names]
+
+
+def longest_first(tasks, durations):
+    """
+    Order the tasks by their past duration, the longest first.
+    :param tasks: List of (index, name, path) tuples of the instances
+    :param durations: Dictionary of past durations by name
+    :return: List of the tasks, in their own order if nothing is known
+    """
+    seconds = expected([name for _, name, _ in tasks], durations)
+    if seconds and seconds[0] is None:
+        return list(tasks)
+    # sorted() is stable, so instances taking the same time keep their order
+    order = sorted(range(len(tasks)), key=lambda position: -seconds[position])
+    return [tasks[position] for position in order]
+
+
+def predict(seconds, jobs):
+    """
+    Predict the wall time of running the durations in the given order.
+    :param seconds: List of expected durations
+    :param jobs: Number of instances running at once
+    :return: float
+    """
+    workers = [0.0] * max(min(jobs, len(seconds)), 1)
+    for duration in seconds:
+        # The next instance starts on whichever worker is free first
+        heapq.heapreplace(workers, workers[0] + duration)
+    return max(workers)
+
+
+def system_load():
+    """
+    Look at how busy the machine is.
+    :return: Tuple of the 1 minute load average per CPU and the share of the
+             memory available, either of them None if it can't be found out
+    """
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        load = None
+    memory = None
+    try:
+        with open('/proc/meminfo') as meminfo:
+            fields = dict(line.split(':', 1) for line in meminfo)
+        memory = int(fields['MemAvailable'].split()[0]) / int(fields['MemTotal'].split()[0])
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        pass
+    return load, memory
+
+
+class AdaptiveLimit:
+    """
+    Number of instances allowed to run at once, following the load of the machine.
+    """
+
+    def __init__(self, maximum, minimum=1, probe=system_load, interval=INTERVAL):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self._probe = probe
+        self._interval = interval
+        self._limit = max(min(maximum, os.cpu_count() or 1), self.minimum)
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is None or now - self._checked >= self._interval:
+                self._checked = now
+                self._adjust(*self._probe())
+            return self._limit
+
+    def _adjust(self, load, memory):
+        if (load is not None and load > HIGH_LOAD) or (memory is not None and memory < LOW_MEMORY):
+            self._limit = max(self._limit - 1, self.minimum)
+        elif (load is None or load < LOW_LOAD) and (memory is None or memory >= 2 * LOW_MEMORY):
+            self._limit = min(self._limit + 1, self.maximum)
+
+
+class Throttle:
+    """
+    Lets a limited number of threads in at once. The limit is either a
+    number or a callable like AdaptiveLimit which is asked every time.
+    """
+
+    def __init__(self, limit):
+        self._limit = limit if callable(limit) else (lambda: limit)
+        self._condition = threading.Condition()
+        self.running = 0
+        # Most threads ever let in at once
+        self.peak = 0
+
+    def __enter__(self):
+        with self._condition:
+            # Wake up now and then, the limit may have been raised meanwhile
+            while self.running >= self._limit():
+                self._condition.wait(INTERVAL)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        return self
+
+    def __exit__(self, *exc):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+
+class AsyncThrottle:
+    """
+    Throttle for coroutines running in a single event loop.
+    """
+
+    def __init__(self, limit):
+        self._limit = limit if callable(limit) else (lambda: limit)
+        # Made in the event loop it is used in
+        self._condition = None
+        self.running = 0
+        self.peak = 0
+
+    async def __aenter__(self):
+        import asyncio
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            while self.running >= self._limit():
+                try:
+                    await asyncio.wait_for(self._condition.wait(), INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._condition:
+            self.running -= 1
+            self._condition.notify()
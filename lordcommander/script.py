@@ -0,0 +1,129 @@
+"""
+---------------------------------------------------------------------
+script.py
+---------------------------------------------------------------------
+This module runs a script, an ordered list of commands, inside
+every instance in a single pass. Once a step fails in an instance,
+the rest of the steps are skipped there, while the other instances
+carry on. When several instances run at once, each one goes through
+the steps on its own, none of them waits for the others to finish a
+step.
+
+A script shows as its steps joined with &&, so its history, and so
+`lc run --failed` and `--resume`, is kept apart from that of each of
+its commands.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import sys
+import time
+
+from lordcommander.executor import ExecutionResult, OutputDigest, forward
+
+
+def read_script(path):
+    """
+    Read the steps of a script from a file, one command per line.
+    Empty lines and lines starting with # are left out.
+    :param path: Path of the file
+    :return: List of commands
+    """
+    try:
+        with open(path) as script:
+            lines = [line.strip() for line in script]
+    except OSError as error:
+        raise ValueError("Script '%s' can't be read: %s" % (path, error.strerror))
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def step_records(steps):
+    """
+    Exit codes and durations of the steps of a script run, as plain data.
+    :param steps: Pairs of the command and ExecutionResult, None if skipped
+    :return: List of dictionaries
+    """
+    return [{'command': str(step), 'code': None} if result is None else
+            {'command': str(step), 'code': result.returncode, 'duration': round(result.duration, 4)}
+            for step, result in steps]
+
+
+class Script(str):
+    """
+    Commands run one after another in every instance. It shows as the
+    commands joined with &&, and carries them as steps.
+    """
+
+    def __new__(cls, steps):
+        steps = list(steps)
+        if not steps:
+            raise ValueError("The script has no steps.")
+        script = super().__new__(cls, ' && '.join(steps))
+        script.steps = steps
+        return script
+
+
+class StepExecutor:
+    """
+    Runs every step of a script on another executor, like Executor or
+    ShellPool. Plain commands are passed through as they are.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+
+    @property
+    def cancelled(self):
+        return self._executor.cancelled
+
+    def cancel(self):
+        self._executor.cancel()
+
+    def close(self):
+        close = getattr(self._executor, 'close', None)
+        if close is not None:
+            close()
+
+    def run(self, cmd, instance_path, timeout=None, deadline=None, sink=None, foreground=False):
+        """
+        Run the steps in the specified directory until one of them fails.
+        :param cmd: Script or a plain command
+        :param instance_path: Path where the steps should execute
+        :param timeout: Seconds all the steps get in the directory together (optional)
+        :param deadline: time.monotonic() after which the steps are killed (optional)
+        :param sink: Callable taking the stream name and a chunk of output (optional)
+        :param foreground: Keep the steps in our process group unless they have a time limit (optional)
+        :return: ExecutionResult with the results of the steps, None for those skipped,
+                 or None if cancelled
+        """
+        steps = getattr(cmd, 'steps', None)
+        if steps is None:
+            return self._executor.run(cmd, instance_path, timeout, deadline, sink, foreground)
+        started = time.monotonic()
+        if timeout is not None:
+            deadline = started + timeout if deadline is None else min(deadline, started + timeout)
+        output = OutputDigest()
+
+        def tee(stream, chunk):
+            output.update(stream, chunk)
+            if sink is not None:
+                sink(stream, chunk)
+            else:
+                forward(getattr(sys, stream), chunk)
+
+        results = []
+        result = None
+        for step in steps:
+            if result is not None and not result.succeeded:
+                # Skipped after a failure
+                results.append((step, None))
+                continue
+            result = self._executor.run(step, instance_path, None, deadline, tee, foreground)
+            if result is None:
+                return None
+            results.append((step, result))
+        rss = [step_result.max_rss for _, step_result in results
+               if step_result is not None and step_result.max_rss is not None]
+        return ExecutionResult(instance_path, result.returncode, time.monotonic() - started,
+                               max(rss) if rss else None, output, result.timed_out, results)
@@ -0,0 +1,68 @@
+"""
+---------------------------------------------------------------------
+shard.py
+---------------------------------------------------------------------
+This module splits the instances of a project into shards, so that
+several machines can share one run. By default an instance goes to
+the shard given by a hash of its name. That needs nothing but the
+name, so every machine comes to the same split on its own, and
+adding or removing a directory never moves any other one.
+
+When every machine has the same run history at hand, the split can
+be balanced by the durations recorded for the command instead, so
+that the shards take about the same time to finish.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import hashlib
+
+
+def parse(spec):
+    """
+    Read a shard given as K/N, K counting from 1.
+    :param spec: The shard, e.g. '2/4'
+    :return: Tuple of K and N
+    """
+    try:
+        shard, count = (int(part) for part in str(spec).split('/'))
+    except ValueError:
+        raise ValueError("Shard should look like K/N, e.g. 1/4.") from None
+    if count < 1 or not 1 <= shard <= count:
+        raise ValueError("Shard should look like K/N with 1 <= K <= N.")
+    return shard, count
+
+
+def stable_hash(name):
+    """A hash of the name that is the same in every process and on every machine"""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big')
+
+
+def split(names, count, durations=None):
+    """
+    Split the instances into shards.
+    :param names: Names of the instances
+    :param count: Number of shards
+    :param durations: Dictionary of past durations by name to balance the shards (optional)
+    :return: List of the names in each shard, in the order they were given
+    """
+    names = list(names)
+    assigned = {}
+    if durations is None:
+        for name in names:
+            assigned[name] = stable_hash(name) % count
+    else:
+        known = [durations[name] for name in names if name in durations]
+        # Instances never run before are expected to take the average time
+        default = sum(known) / len(known) if known else 1.0
+        loads = [0.0] * count
+        # Longest first onto the least loaded shard, ties broken by name
+        for name in sorted(names, key=lambda name: (-durations.get(name, default), name)):
+            shard = min(range(count), key=lambda shard: (loads[shard], shard))
+            assigned[name] = shard
+            loads[shard] += durations.get(name, default)
+    shards = [[] for _ in range(count)]
+    for name in names:
+        shards[assigned[name]].append(name)
+    return shards
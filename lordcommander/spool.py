@@ -0,0 +1,159 @@
+"""
+---------------------------------------------------------------------
+spool.py
+---------------------------------------------------------------------
+This module writes the output of every instance to its own log
+files, <instance>.out and <instance>.err, as it arrives. The path
+separators of nested instances are escaped as %2F, and % as %25, so
+no two instances share a file. Only the last few kilobytes of each
+instance are kept in memory, so that the
+tail of a failed instance can be shown at the end of the run. The
+memory used doesn't grow with the size of the output, however many
+instances are running at once.
+
+The log files can be capped in size, the output beyond the cap is
+counted but not written, and compressed with gzip once the instance
+is done. The terminal only gets a line per instance.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import os
+import threading
+
+from lordcommander.output import Output
+
+# Bytes of output of each instance kept in memory for the summary
+TAIL_SIZE = 4 * 1024
+# Lines of the tail shown in the summary
+TAIL_LINES = 10
+
+
+def log_name(name):
+    """File name of the logs of an instance, nested instances are flattened with their
+    separators escaped, so that no two instances share a name"""
+    return name.replace('%', '%25').replace(os.sep, '%2F')
+
+
+def human_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return "%d %s" % (size, unit) if unit == 'B' else "%.1f %s" % (size, unit)
+        size /= 1024
+
+
+class InstanceLog:
+    """
+    Log files of a single instance along with the tail of its output.
+    """
+
+    def __init__(self, base, limit=None):
+        self.paths = {'stdout': base + '.out', 'stderr': base + '.err'}
+        self._files = {}
+        try:
+            for stream, path in self.paths.items():
+                self._files[stream] = open(path, 'wb')
+        except OSError:
+            # Don't leave the stdout log open when the stderr one can't be written
+            for file in self._files.values():
+                file.close()
+            raise
+        self._limit = limit
+        self.written = {'stdout': 0, 'stderr': 0}
+        self.dropped = {'stdout': 0, 'stderr': 0}
+        self._tail = bytearray()
+
+    def __call__(self, stream, chunk):
+        self._tail += chunk
+        del self._tail[:-TAIL_SIZE]
+        room = len(chunk) if self._limit is None else max(self._limit - self.written[stream], 0)
+        if room < len(chunk):
+            self.dropped[stream] += len(chunk) - room
+            chunk = chunk[:room]
+        if chunk:
+            self._files[stream].write(chunk)
+            self.written[stream] += len(chunk)
+
+    def tail(self, lines=TAIL_LINES):
+        """Last lines of the output, both streams in the order they were written"""
+        return self._tail.decode(errors='replace').rstrip('\n').split('\n')[-lines:] if self._tail else []
+
+    def close(self, compress=False):
+        for stream, log in self._files.items():
+            if self.dropped[stream]:
+                log.write(b"\n[lc: %d more bytes are not logged]\n" % self.dropped[stream])
+            log.close()
+        if compress:
+            import gzip
+            import shutil
+            for stream, path in self.paths.items():
+                with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.unlink(path)
+                self.paths[stream] = path + '.gz'
+
+
+class LogSpool:
+    """
+    Log files of the instances of a run inside a directory, safe to use from several threads.
+    """
+
+    def __init__(self, directory, limit=None, compress=False, quiet=False):
+        """
+        :param directory: Directory of the log files, created if necessary
+        :param limit: Bytes of each stream of an instance written at most (optional)
+        :param compress: Compress the log files with gzip once an instance is done (optional)
+        :param quiet: Write only the log files, nothing to the terminal (optional)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._limit = limit
+        self._compress = compress
+        self._quiet = quiet
+        self._lock = threading.Lock()
+        # Tails of the instances that failed, by index
+        self._failures = {}
+
+    def open(self, index, name):
+        """
+        Start the log of an instance.
+        :return: InstanceLog, the sink of its output
+        """
+        return InstanceLog(os.path.join(self._directory, log_name(name)), self._limit)
+
+    def add(self, index, name, result, log):
+        """
+        Finish the log of an instance and tell how it went in a single line.
+        :param index: Index of the instance
+        :param name: Name of the instance
+        :param result: ExecutionResult
+        :param log: InstanceLog of the instance
+        """
+        log.close(self._compress)
+        if self._quiet:
+            return
+        if result.timed_out:
+            status = Output.colorize("timed out after %.2fs" % result.duration, Output.DANGER)
+        else:
+            status = Output.colorize("exited with %s in %.2fs" % (result.returncode, result.duration),
+                                     Output.SUCCESS if result.succeeded else Output.DANGER)
+        sizes = Output.colorize("%s out, %s err -> %s" % (
+            human_size(log.written['stdout'] + log.dropped['stdout']),
+            human_size(log.written['stderr'] + log.dropped['stderr']),
+            os.path.basename(log.paths['stdout'])), Output.MUTED)
+        with self._lock:
+            print("[%d] %s: %s %s" % (index, name, status, sizes), flush=True)
+            if not result.succeeded:
+                self._failures[index] = (name, log.tail())
+
+    def summary(self):
+        """Show the tail of the output of the failed instances"""
+        if not self._failures:
+            return
+        Output.info("\nLast lines of the failed directories, see %s for the rest:" % self._directory)
+        for index in sorted(self._failures):
+            name, tail = self._failures[index]
+            Output.warning("- %s (%d)" % (name, index))
+            for line in tail:
+                print(Output.colorize("  | ", Output.MUTED) + line)
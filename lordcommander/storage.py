@@ -0,0 +1,378 @@
+"""
+---------------------------------------------------------------------
+storage.py
+---------------------------------------------------------------------
+This module holds the storage backends of LordCommander. Both of
+them look the same to the controllers: a mapping with an 'active'
+key holding the name of the active project and a 'projects' key
+holding the projects along with their root and instances.
+
+The SqliteStore keeps projects and instances in their own tables.
+A project is loaded only when it is asked for, its instances only
+when they are touched, and on sync only the projects that have
+actually changed are written back in a single transaction. So a
+read-only command never rewrites anything.
+
+Several lc processes can use the SQLite store at the same time.
+The database runs in WAL mode, so readers work on a snapshot and
+never wait for writers. Every write is a short immediate
+transaction, and changes to an instance list are merged into the
+list as it is in the database at that moment, so concurrent
+writers don't lose each other's updates.
+
+The legacy writeback shelve that has been used until version 5.0
+is still available. Its data is migrated to SQLite automatically
+the first time the SQLite backend is opened, see legacy.py.
+
+Version: 5.x
+License: GNU General Public License 3
+"""
+
+import os
+import sqlite3
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+SQLITE = 'sqlite'
+SHELVE = 'shelve'
+BACKENDS = (SQLITE, SHELVE)
+
+SCHEMA_VERSION = 1
+
+# Seconds to wait for another process holding the write lock
+LOCK_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    root TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS instances (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (project_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS instances_by_name ON instances(project_id, name);
+"""
+
+
+def open_store(data_dir, backend=SQLITE):
+    """
+    Open the store of the selected backend inside the data directory.
+    :param data_dir: The data directory of LordCommander
+    :param backend: Either 'sqlite' or 'shelve' (optional)
+    :return: SqliteStore | shelve
+    """
+    if backend not in BACKENDS:
+        raise ValueError("Unknown storage backend '%s', use one of: %s." % (backend, ', '.join(BACKENDS)))
+    legacy = os.path.join(data_dir, 'lcdb')
+    if backend == SHELVE:
+        from lordcommander.legacy import open_shelve
+        return open_shelve(legacy)
+    return SqliteStore(os.path.join(data_dir, 'lcdb.sqlite3'), legacy=legacy)
+
+
+@contextmanager
+def transaction(connection):
+    """
+    Run the block in an immediate transaction, so the write lock is taken
+    upfront. Nested blocks join the transaction already running.
+    """
+    if connection.in_transaction:
+        yield connection
+        return
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def merge_instances(base, ours, theirs):
+    """
+    Three-way merge of instance lists.
+    :param base: The instances as they were loaded
+    :param ours: The instances as they are now in memory
+    :param theirs: The instances as they are now in the database
+    :return: list
+    """
+    base_set = set(base)
+    removed = base_set.difference(ours)
+    merged = [name for name in theirs if name not in removed]
+    present = set(merged)
+    for name in ours:
+        if name not in base_set and name not in present:
+            merged.append(name)
+            present.add(name)
+    return merged
+
+
+class ProjectRecord(dict):
+    """
+    A project loaded from SQLite. The instances are fetched on first access.
+    """
+    
+    def __init__(self, loader, **fields):
+        super().__init__(**fields)
+        self._loader = loader
+        # Instances as they were loaded, used to find out what has changed
+        self.snapshot = None
+    
+    @property
+    def loaded(self):
+        return self._loader is None
+    
+    def __missing__(self, key):
+        if key != 'instances' or self._loader is None:
+            raise KeyError(key)
+        instances = self._loader()
+        self._loader = None
+        self.snapshot = tuple(instances)
+        self['instances'] = instances
+        return instances
+    
+    def __contains__(self, key):
+        return (key == 'instances' and not self.loaded) or super().__contains__(key)
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+class ProjectMap(MutableMapping):
+    """
+    The 'projects' mapping of a SqliteStore, keyed by project name.
+    """
+    
+    def __init__(self, connection):
+        self._connection = connection
+        # Projects handed out, by name, along with their root and instances at that time
+        self._records = {}
+        self._snapshots = {}
+    
+    def _project_id(self, name):
+        row = self._connection.execute(
+            "SELECT id FROM projects WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+    
+    def _load_instances(self, project_id):
+        return [name for (name,) in self._connection.execute(
+            "SELECT name FROM instances WHERE project_id = ? ORDER BY position", (project_id,))]
+    
+    def __getitem__(self, name):
+        if name in self._records:
+            return self._records[name]
+        row = self._connection.execute(
+            "SELECT id, root FROM projects WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        project_id, root = row
+        record = ProjectRecord(lambda: self._load_instances(project_id), root=root)
+        self._records[name] = record
+        self._snapshots[name] = (root, None)
+        return record
+    
+    def __setitem__(self, name, project):
+        root, instances = project['root'], list(project['instances'])
+        with transaction(self._connection):
+            self._connection.execute("DELETE FROM projects WHERE name = ?", (name,))
+            cursor = self._connection.execute(
+                "INSERT INTO projects (name, root) VALUES (?, ?)", (name, root))
+            self._insert_instances(cursor.lastrowid, instances)
+        self._records[name] = project
+        self._snapshots[name] = (root, tuple(instances))
+    
+    def __delitem__(self, name):
+        with transaction(self._connection):
+            cursor = self._connection.execute("DELETE FROM projects WHERE name = ?", (name,))
+        self._records.pop(name, None)
+        self._snapshots.pop(name, None)
+        if cursor.rowcount == 0:
+            raise KeyError(name)
+    
+    def __contains__(self, name):
+        return name in self._records or self._project_id(name) is not None
+    
+    def __iter__(self):
+        return iter([name for (name,) in self._connection.execute(
+            "SELECT name FROM projects ORDER BY id")])
+    
+    def iter_instances(self, name):
+        """Go through the instances of a project without loading all of them at once"""
+        record = self._records.get(name)
+        if record is not None and (not isinstance(record, ProjectRecord) or record.loaded):
+            yield from record['instances']
+            return
+        project_id = self._project_id(name)
+        if project_id is None:
+            raise KeyError(name)
+        for (instance,) in self._connection.execute(
+                "SELECT name FROM instances WHERE project_id = ? ORDER BY position", (project_id,)):
+            yield instance
+    
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+    
+    def _insert_instances(self, project_id, instances, start=0):
+        self._connection.executemany(
+            "INSERT INTO instances (project_id, position, name) VALUES (?, ?, ?)",
+            ((project_id, position, name) for position, name in enumerate(instances, start)))
+    
+    def replace(self, projects):
+        """Replace every project with the given ones."""
+        with transaction(self._connection):
+            self.clear_all()
+            for name, project in projects.items():
+                self[name] = project
+    
+    def clear_all(self):
+        """Remove every project."""
+        with transaction(self._connection):
+            self._connection.execute("DELETE FROM projects")
+        self._records.clear()
+        self._snapshots.clear()
+    
+    def flush(self):
+        """Write back the changes made to the projects handed out."""
+        for name, record in self._records.items():
+            root, instances = self._snapshots[name]
+            if instances is None and isinstance(record, ProjectRecord) and record.loaded:
+                instances = record.snapshot
+            # Instances never touched can't have changed
+            current = tuple(record['instances']) if instances is not None else None
+            if record['root'] == root and current == instances:
+                continue
+            with transaction(self._connection):
+                project_id = self._project_id(name)
+                if project_id is None:
+                    # Removed by someone else meanwhile
+                    continue
+                if record['root'] != root:
+                    self._connection.execute(
+                        "UPDATE projects SET root = ? WHERE id = ?", (record['root'], project_id))
+                if current != instances:
+                    self._flush_instances(project_id, instances, current)
+            self._snapshots[name] = (record['root'], current)
+    
+    def _flush_instances(self, project_id, old, new):
+        """Merge the changes between two versions of the instance list into the stored one"""
+        stored = tuple(self._load_instances(project_id))
+        if stored != old:
+            new = tuple(merge_instances(old, new, stored))
+            old = stored
+        if len(new) > len(old) and new[:len(old)] == old:
+            # Only appended, the usual case of 'dirs add'
+            self._insert_instances(project_id, new[len(old):], start=len(old))
+            return
+        self._connection.execute("DELETE FROM instances WHERE project_id = ?", (project_id,))
+        self._insert_instances(project_id, new)
+
+
+class SqliteStore(MutableMapping):
+    """
+    LordCommander data kept in an SQLite database.
+    """
+    
+    KEYS = ('active', 'projects')
+    
+    def __init__(self, path, legacy=None):
+        # Transactions are handled explicitly, see transaction()
+        self._connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._projects = ProjectMap(self._connection)
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._create(legacy)
+    
+    def _create(self, legacy):
+        """Create the schema and migrate legacy data, only one process gets to do it"""
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        with transaction(self._connection):
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+                return
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    self._connection.execute(statement)
+            if legacy is not None:
+                self._migrate(legacy)
+            if self._get_meta('active') is None:
+                self._set_meta('active', '')
+            self._connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+    
+    def _get_meta(self, key):
+        row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def _set_meta(self, key, value):
+        with transaction(self._connection):
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    
+    def _migrate(self, legacy):
+        """Copy the data of the legacy shelve module, it is left untouched."""
+        import dbm
+        import shelve
+        if not dbm.whichdb(legacy):
+            return
+        with shelve.open(legacy, flag='r') as old:
+            self._projects.replace(old.get('projects', {}))
+            self._set_meta('active', old.get('active', ''))
+        self._set_meta('migrated_from', legacy)
+    
+    def __getitem__(self, key):
+        if key == 'active':
+            return self._get_meta('active')
+        if key == 'projects':
+            return self._projects
+        raise KeyError(key)
+    
+    def __setitem__(self, key, value):
+        if key == 'active':
+            self._set_meta('active', value)
+        elif key == 'projects':
+            self._projects.replace(value)
+        else:
+            raise KeyError(key)
+    
+    def __delitem__(self, key):
+        raise KeyError(key)
+    
+    def __iter__(self):
+        return iter(self.KEYS)
+    
+    def __len__(self):
+        return len(self.KEYS)
+    
+    def clear(self):
+        with transaction(self._connection):
+            self._projects.clear_all()
+            self._set_meta('active', '')
+    
+    def batch(self):
+        """Run the writes of a block in a single transaction, all of them or none are kept."""
+        return transaction(self._connection)
+    
+    def sync(self):
+        """Write back pending changes."""
+        self._projects.flush()
+    
+    def close(self):
+        if self._connection is None:
+            return
+        try:
+            self.sync()
+        finally:
+            self._connection.close()
+            self._connection = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
@@ -8,10 +8,9 @@ require over time to time.
 Version: 5.x
 License: GNU General Public License 3
 """
-import json
 import os
-from pathlib import Path
 
+from lordcommander.index import InstanceIndex
 from lordcommander.lcex import ActiveProjectNotSetException
 from lordcommander.output import Output
 
@@ -35,9 +34,9 @@ class Utils:
             if not self._project:
                 raise ActiveProjectNotSetException(
                     "May be no active project has been set. Please check.")
-            if key in self._project['instances']:
-                Output.success('Found! Index: {}'.format(
-                    self._project['instances'].index(key)))
+            index = InstanceIndex.of(self._project['instances']).position(key)
+            if index is not None:
+                Output.success('Found! Index: {}'.format(index))
             else:
                 Output.danger('Not found!')
         except ActiveProjectNotSetException as error:
@@ -56,54 +55,96 @@ class Utils:
         except ActiveProjectNotSetException as error:
             Output.danger(error)
 
-    def dump(self, strpath):
+    def dump(self, strpath, format='json', compress=None, project=None):
         """
-        Dump shelve module data to a JSON file.
+        Dump stored data to a JSON or an NDJSON file.
         :param strpath: The output file directory
+        :param format: Either 'json' or 'ndjson', the latter is written a record at a time (optional)
+        :param compress: Either 'gzip' or 'zstd' (optional)
+        :param project: Name of the only project to dump (optional)
         """
+        from pathlib import Path
+        from lordcommander import dump
         try:
             if not os.path.exists(strpath) or not os.path.isdir(strpath):
                 raise FileNotFoundError(
                     "Invalid path, please provide a valid path.")
-            path = Path(strpath)
-            filename = path.joinpath('lcdb_dump.json')
-            with open(filename, 'w') as output:
-                json.dump(dict(self._lcdb), output, indent=4)
+            compression = dump.check(format, compress)
+            if compression != compress:
+                Output.warning("zstd needs Python 3.14 or later, using gzip instead.")
+            if project is not None and project not in self._lcdb['projects']:
+                raise ValueError("Project %s does not exist." % project)
+            filename = Path(strpath).joinpath(dump.file_name(format, compression))
+            dump.write(self._lcdb, filename, format, compression, project)
             Output.success(
                 "Data dumping successful. Output file: %s" % filename)
         except FileNotFoundError as error:
             Output.danger(error)
+        except ValueError as error:
+            Output.danger(error)
 
-    def restore(self, strpath):
+    def restore(self, strpath, project=None):
         """
-        Restore data to shelve module from a dumped JSON file.
-        :param strpath: The path of the JSON file
+        Restore data to the store from a dumped JSON or NDJSON file, compressed or not.
+        :param strpath: The path of the file
+        :param project: Name of the only project to restore, the rest of the store is kept (optional)
         """
+        import contextlib
+        import json
+        from lordcommander import dump
         try:
             if not os.path.exists(strpath) or not os.path.isfile(strpath):
                 raise FileNotFoundError(
                     "Invalid path, please provide a valid path.")
 
-            # Load JSON file
-            with open(strpath) as backup_file:
-                data = json.load(backup_file)
+            header = dump.header(strpath)
+            if header is None:
+                # Load JSON file of earlier versions
+                with dump.open_dump(strpath) as backup_file:
+                    data = json.load(backup_file)
 
-            # Check content of the file and report if invalid
-            if not all(key in data for key in ['active', 'projects']) or len(data.keys()) > 2:
-                raise ValueError(
-                    "Failed! Not a valid LordCommander supported file.")
+                # Check content of the file and report if invalid
+                if not isinstance(data, dict) or not all(key in data for key in ['active', 'projects']) \
+                        or len(data.keys()) > 2:
+                    raise ValueError(
+                        "Failed! Not a valid LordCommander supported file.")
+                # Checked as a whole before anything is changed
+                checked = dump.legacy(data, project)
+                projects = lambda: checked
+                found = project is None or bool(checked)
+                active = data['active']
+            else:
+                # Go through the whole file once, so that nothing is changed if it is broken
+                projects = lambda: dump.read(strpath, project)
+                found = project is None
+                for _ in projects():
+                    found = True
+                active = header.get('active', '')
+            if not found:
+                raise ValueError("Project %s is not in the file." % project)
 
             # Ask for confirmation to restore
-            Output.normal(
-                "This will remove existing data completely. Are you sure? (yes/no)[no]:")
+            if project is None:
+                Output.normal(
+                    "This will remove existing data completely. Are you sure? (yes/no)[no]:")
+            else:
+                Output.normal(
+                    "This will replace project %s if it exists. Are you sure? (yes/no)[no]:" % project)
             yes = {'yes', 'y'}
             if input(">> ") not in yes:
                 raise KeyboardInterrupt("Aborted! Nothing is changed.")
 
-            # Clear existing and restore imported data
-            self._lcdb.clear()
-            for key, value in data.items():
-                self._lcdb[key] = value
+            # Clear existing and restore imported data, project by project, in a single
+            # transaction where the store has them
+            with getattr(self._lcdb, 'batch', contextlib.nullcontext)():
+                if project is None:
+                    self._lcdb.clear()
+                    self._lcdb['active'] = active
+                    self._lcdb['projects'] = {}
+                elif 'projects' not in self._lcdb:
+                    self._lcdb['projects'] = {}
+                for name, root, instances in projects():
+                    self._lcdb['projects'][name] = {'root': root, 'instances': instances}
             Output.success("Data has been imported successfully.")
 
         except FileNotFoundError as error:
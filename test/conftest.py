@@ -0,0 +1,9 @@
+import pytest
+
+from lordcommander.output import Output
+
+
+@pytest.fixture(autouse=True)
+def colored_output(monkeypatch):
+    # Captured output is not a terminal, the tests compare colored output nevertheless
+    monkeypatch.setattr(Output, 'COLORED', True)
@@ -0,0 +1,123 @@
+import io
+import os
+import re
+import threading
+
+import lordcommander.aggregate as aggregate
+from lordcommander.aggregate import Aggregator, Capture, ranges
+from lordcommander.controllers import CommandController
+from lordcommander.executor import ExecutionResult, OutputDigest
+from .commons import *
+
+
+def plain(text):
+    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+
+
+def captured(text, code=0):
+    capture, output = Capture(), OutputDigest()
+    capture('stdout', text.encode())
+    output.update('stdout', text.encode())
+    return ExecutionResult(None, code, 0.1, output=output), capture
+
+
+def test_indices_are_written_as_ranges():
+    assert ranges([9, 0, 1, 2, 3, 5, 7, 8]) == '0-3,5,7-9'
+    assert ranges([4]) == '4'
+
+
+def test_identical_outputs_are_collapsed(capsys):
+    aggregator = Aggregator()
+    for index, (text, code) in enumerate([('main\n', 0), ('main\n', 0), ('dev\n', 0), ('main\n', 1), ('main\n', 0)]):
+        aggregator.add(index, 'ins%d' % index, *captured(text, code))
+    assert len(aggregator) == 3
+    out = io.StringIO()
+    aggregator.show(out)
+    headers = plain(capsys.readouterr().out)
+    assert "[0-1,4] 3 directories, exited with 0" in headers
+    assert "[2] 1 directories, exited with 0" in headers
+    assert "[3] 1 directories, exited with 1" in headers
+    assert out.getvalue() == 'main\ndev\nmain\n'
+
+
+def test_large_output_is_spilled_to_disk(monkeypatch):
+    monkeypatch.setattr(aggregate, 'SPILL_SIZE', 16)
+    capture = Capture()
+    capture('stdout', b'x' * 8)
+    assert not capture.spilled
+    capture('stdout', b'x' * 32)
+    assert capture.spilled
+    out = io.StringIO()
+    capture.dump(out)
+    assert out.getvalue() == 'x' * 40
+
+
+def test_aggregated_run(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    CommandController().run(project, 'echo same', jobs=2, aggregate=True)
+    out = plain(capsys.readouterr().out)
+    assert out.count('same\n') == 1
+    assert "[0-1] 2 directories, exited with 0" in out
+    assert "1 distinct outputs of 2 directories." in out
+    assert "Changed directory" not in out
+
+
+def test_captures_are_closed_when_a_run_breaks_off(monkeypatch, capsys):
+    import pytest
+    from lordcommander.executor import Executor
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    captures = []
+    monkeypatch.setattr(Capture, 'close', lambda capture: captures.append(capture))
+
+    started = threading.Event()
+
+    def broken(executor, cmd, instance_path, timeout=None, deadline=None, sink=None):
+        if Path(instance_path).name == 'pro1ins1':
+            started.wait(5)
+            raise RuntimeError('broken')
+        started.set()
+        # Cancelled
+        return None
+
+    monkeypatch.setattr(Executor, 'run', broken)
+    with pytest.raises(RuntimeError):
+        CommandController().run(project, 'echo same', jobs=2, aggregate=True)
+    assert len(captures) == 2
+
+
+def test_kept_outputs_hold_no_open_files(monkeypatch):
+    monkeypatch.setattr(aggregate, 'SPILL_SIZE', 16)
+    aggregator = Aggregator()
+    for index in range(50):
+        result, _ = captured('%d' % index)
+        capture = aggregator.open(index, 'ins%d' % index)
+        capture('stdout', b'%032d' % index)
+        aggregator.add(index, 'ins%d' % index, result, capture)
+        assert capture.spilled and capture._file is None
+    directory = aggregator._directory
+    assert len(os.listdir(directory)) == 50
+    out = io.StringIO()
+    aggregator.show(out)
+    assert out.getvalue().startswith('%032d' % 0)
+    aggregator.close()
+    assert not os.path.exists(directory)
+
+
+def test_captures_move_to_files_once_memory_is_full(monkeypatch):
+    monkeypatch.setattr(aggregate, 'MEMORY_SIZE', 24)
+    aggregator = Aggregator()
+    first, second = aggregator.open(0, 'ins0'), aggregator.open(1, 'ins1')
+    first('stdout', b'x' * 16)
+    assert not first.spilled
+    second('stdout', b'y' * 16)
+    assert second.spilled and aggregator._held == 16
+    second.close()
+    first.close()
+    assert aggregator._held == 0
+    aggregator.close()
@@ -0,0 +1,157 @@
+import re
+
+from colr import color
+
+from lordcommander.controllers import CommandController
+from lordcommander.output import Output
+from .commons import *
+
+
+def plain(text):
+    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+
+
+def test_parallel_run_stays_in_instance_directory():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    cc = CommandController()
+    cc.run(project, 'pwd > where.txt', jobs=2)
+    for instance in project['instances']:
+        where = Path(project['root']) / instance / 'where.txt'
+        assert where.read_text().strip() == str(Path(project['root']) / instance)
+
+
+def test_parallel_run_counts_exit_codes(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    cc = CommandController()
+    (Path(project['root']) / 'pro1ins1' / 'marker').touch()
+    cc.run(project, 'test -f marker', jobs=2)
+    captured = capsys.readouterr()
+    assert "Successful run: 1 \nFailed run: 1" in plain(captured.out)
+
+
+def test_invalid_number_of_jobs(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    cc = CommandController()
+    cc.run(project, 'pwd', jobs=0)
+    captured = capsys.readouterr()
+    assert color("Number of jobs should be a positive integer or 'auto'.", Output.DANGER) + "\n" in captured.out
+
+
+def test_serial_run_counts_exit_codes(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    cc = CommandController()
+    (Path(project['root']) / 'pro1ins2' / 'marker').touch()
+    cc.run(project, 'test -f marker')
+    captured = capsys.readouterr()
+    assert "Successful run: 1 \nFailed run: 1" in plain(captured.out)
+
+
+def test_timed_out_instances_are_counted_apart(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    cc = CommandController()
+    (Path(project['root']) / 'pro1ins2' / 'marker').touch()
+    cc.run(project, 'test -f marker || sleep 30', timeout=0.5, jobs=2)
+    captured = capsys.readouterr()
+    assert "Successful run: 1 \nFailed run: 0 \nTimed out run: 1" in plain(captured.out)
+
+
+def test_total_timeout_stops_the_run(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    cc = CommandController()
+    cc.run(project, 'sleep 30', total_timeout=0.5)
+    captured = capsys.readouterr()
+    assert "Successful run: 0 \nFailed run: 0 \nTimed out run: 2" in plain(captured.out)
+
+
+def wave_project(count):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    project['instances'] = ['ins%d' % number for number in range(count)]
+    for name in project['instances']:
+        (Path(project['root']) / name).mkdir()
+    return project
+
+
+def test_waves_run_in_order_with_timing(capsys):
+    project = wave_project(7)
+    CommandController().run(project, 'true', canary=1, wave=3)
+    out = plain(capsys.readouterr().out)
+    assert "Canary ran 1 directories in" in out
+    assert "Wave 1/2 ran 3 directories in" in out and "Wave 2/2 ran 3 directories in" in out
+    assert "Successful run: 7" in out
+
+
+def test_failed_canary_stops_the_rollout(capsys):
+    project = wave_project(5)
+    CommandController().run(project, 'touch ran; false', canary=2, wave=2)
+    out = plain(capsys.readouterr().out)
+    assert "Canary has failed, 3 directories are left unstarted." in out
+    assert [name for name in project['instances'] if (Path(project['root']) / name / 'ran').exists()] == \
+        ['ins0', 'ins1']
+
+
+def test_failure_budget_stops_new_work(capsys):
+    project = wave_project(8)
+    (Path(project['root']) / 'ins0' / 'ok').touch()
+    CommandController().run(project, 'touch ran; test -f ok', canary=1, wave=2, max_failures=2)
+    out = plain(capsys.readouterr().out)
+    assert "Failure budget of 2 is used up, 5 directories are left unstarted." in out
+    assert "Successful run: 1 \nFailed run: 2" in out
+    assert not (Path(project['root']) / 'ins3' / 'ran').exists()
+
+
+def test_invalid_wave(capsys):
+    project = wave_project(1)
+    CommandController().run(project, 'true', wave=0)
+    assert "Wave should be a positive integer." in plain(capsys.readouterr().out)
+
+
+def test_failure_budget_stops_a_serial_rollout(capsys):
+    project = wave_project(6)
+    CommandController().run(project, 'touch ran; false', max_failures=1)
+    out = plain(capsys.readouterr().out)
+    assert "Failure budget of 1 is used up, 5 directories are left unstarted." in out
+    assert [name for name in project['instances'] if (Path(project['root']) / name / 'ran').exists()] == ['ins0']
+
+
+def test_waves_never_run_more_than_jobs_at_once(capsys):
+    from lordcommander.metrics import RunMetrics
+    project = wave_project(4)
+    metrics = RunMetrics('.testfiles/waves.prom', 'project1', 'sleep 0.1')
+    CommandController(metrics=metrics).run(project, 'sleep 0.1', wave=4)
+    assert "Wave 1/1 ran 4 directories in" in plain(capsys.readouterr().out)
+    assert metrics.peak == 1
+
+
+def test_exec_runs_the_command_without_a_shell(monkeypatch, capsys):
+    import lordcommander.commander as commander
+    from lordcommander.history import RunHistory
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    testdb['active'] = 'project1'
+    project = testdb['projects']['project1']
+    monkeypatch.setattr(commander, 'create_data_dir', lambda: '.testfiles')
+    commander.execute(['run', 'touch $HOME', '--exec_'], testdb, owns_store=False)
+    assert Path(project['root'], 'pro1ins1', '$HOME').exists()
+    assert RunHistory('.testfiles').runs()[-1]['selection']['exec'] is True
+    close_db(testdb)
@@ -0,0 +1,60 @@
+import multiprocessing
+
+from lordcommander.index import InstanceIndex
+from lordcommander.storage import SHELVE, SQLITE, open_store
+from .commons import *
+
+WRITERS = 6
+READERS = 3
+ROUNDS = 15
+
+
+def writer(backend, number):
+    for round_number in range(ROUNDS):
+        store = open_store('.testfiles', backend)
+        instances = store['projects']['project']['instances']
+        InstanceIndex(instances).extend(['w%d-%d' % (number, round_number)])
+        store.close()
+
+
+def reader(backend, counts):
+    for _ in range(ROUNDS):
+        store = open_store('.testfiles', backend)
+        counts.append(len(store['projects']['project']['instances']))
+        store.close()
+
+
+def stress(backend):
+    remove_test_files()
+    mkdir('.testfiles')
+    store = open_store('.testfiles', backend)
+    store['projects']['project'] = {'root': '/', 'instances': ['first']}
+    store.close()
+    
+    context = multiprocessing.get_context('spawn')
+    manager = context.Manager()
+    counts = manager.list()
+    processes = [context.Process(target=writer, args=(backend, number)) for number in range(WRITERS)]
+    processes += [context.Process(target=reader, args=(backend, counts)) for _ in range(READERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    
+    store = open_store('.testfiles', backend)
+    instances = list(store['projects']['project']['instances'])
+    store.close()
+    assert all(process.exitcode == 0 for process in processes)
+    assert len(counts) == READERS * ROUNDS
+    return instances
+
+
+def test_concurrent_writers_lose_nothing_with_sqlite():
+    instances = stress(SQLITE)
+    assert instances[0] == 'first'
+    assert len(instances) == len(set(instances)) == 1 + WRITERS * ROUNDS
+
+
+def test_concurrent_writers_lose_nothing_with_shelve():
+    instances = stress(SHELVE)
+    assert len(instances) == len(set(instances)) == 1 + WRITERS * ROUNDS
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import time
+
+from lordcommander.daemon import LOG_NAME, SOCKET_NAME, peer_uid
+from .commons import *
+
+ROOT = Path(__file__).parent.parent.resolve()
+ENTRY = "import sys; sys.argv[0] = 'lc'; from lordcommander import main; main()"
+
+
+def lc(env, *args):
+    return subprocess.run([sys.executable, '-c', ENTRY] + list(args), env=env,
+                          capture_output=True, text=True, timeout=30)
+
+
+def start_daemon():
+    remove_test_files()
+    data_home = ROOT / '.testfiles' / 'data'
+    makedirs(data_home)
+    env = dict(os.environ, XDG_DATA_HOME=str(data_home), NO_COLOR='1', PYTHONPATH=str(ROOT))
+    env.pop('LORDCOMMANDER_NO_DAEMON', None)
+    daemon = subprocess.Popen([sys.executable, '-c', ENTRY, 'daemon', 'start', '--foreground'],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    data_dir = data_home / 'LordCommander'
+    for _ in range(200):
+        if (data_dir / SOCKET_NAME).exists():
+            break
+        time.sleep(0.05)
+    return daemon, env, data_dir
+
+
+def test_commands_are_served_by_the_daemon():
+    daemon, env, data_dir = start_daemon()
+    try:
+        # Only we may connect to the socket
+        assert (data_dir / SOCKET_NAME).stat().st_mode & 0o777 == 0o600
+        (pro_path, pro_name, ins_name) = create_a_new_project()
+        assert lc(env, 'proj', 'add', pro_path).returncode == 0
+        lc(env, 'proj', 'active', pro_name)
+        lc(env, 'dirs', 'add', ins_name)
+        assert lc(env, 'utils', 'total').stdout == "Total 1 directories listed.\n"
+        # The cached store is dropped once it changes on disk
+        lc(env, 'dirs', 'add', 'another')
+        assert lc(env, 'utils', 'total').stdout == "Total 2 directories listed.\n"
+        run = lc(env, 'run', 'pwd')
+        assert run.returncode == 0
+        assert str(Path(pro_path) / ins_name) + "\n" in run.stdout
+        # Exit status of the command is handed back
+        assert lc(env, 'nonexistent').returncode != 0
+        log = (data_dir / LOG_NAME).read_text()
+        assert "inline ['utils', 'total'] -> 0" in log
+        assert "['run', 'pwd']" in log
+    finally:
+        lc(env, 'daemon', 'stop')
+        daemon.wait(10)
+    assert not (data_dir / SOCKET_NAME).exists()
+
+
+def test_falls_back_to_the_process_without_daemon():
+    remove_test_files()
+    data_home = ROOT / '.testfiles' / 'data'
+    makedirs(data_home)
+    env = dict(os.environ, XDG_DATA_HOME=str(data_home), NO_COLOR='1', PYTHONPATH=str(ROOT))
+    assert lc(env, 'daemon', 'status').stdout == "Daemon is not running.\n"
+    assert lc(env, 'proj', 'view').stdout == "No project has been found in the list.\n"
+
+
+def test_peer_of_a_socket_is_told():
+    import socket
+    first, second = socket.socketpair(socket.AF_UNIX)
+    with first, second:
+        assert peer_uid(first) in (os.getuid(), None)
@@ -32,3 +32,17 @@ def test_removing_an_instance():
     instances = testdb['projects']['project1']['instances']
     close_db(testdb)
     assert 'pro1ins1' not in instances
+
+
+def test_checking_stale_instances(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    dc = DirectoryController(project['instances'], project['root'])
+    dc.add('missing')
+    capsys.readouterr()
+    dc.check()
+    captured = capsys.readouterr()
+    close_db(testdb)
+    assert "- missing (2): " + color("missing", Output.DANGER) + "\n" in captured.out
+    assert color("1 of 3 directories are stale.", Output.DANGER) + "\n" in captured.out
@@ -0,0 +1,211 @@
+import gzip
+import json
+
+from lordcommander import dump
+from lordcommander.storage import SqliteStore
+from lordcommander.utils import Utils
+from .commons import *
+
+testfile_directory = Path(__file__).parent.parent.resolve() / '.testfiles'
+
+
+def restore(testdb, filename, project=None, monkeypatch=None):
+    monkeypatch.setattr('builtins.input', lambda prompt='': 'yes')
+    Utils(testdb, None).restore(str(filename), project)
+
+
+def stored(testdb):
+    return {name: (project['root'], list(project['instances']))
+            for name, project in testdb['projects'].items()}
+
+
+def test_ndjson_dump_is_a_record_per_line():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    testdb['active'] = 'project2'
+    Utils(testdb, None).dump(testfile_directory, format='ndjson')
+    close_db(testdb)
+    with open(testfile_directory / 'lcdb_dump.ndjson') as output:
+        lines = [json.loads(line) for line in output]
+    assert lines[0] == {'type': 'lcdb', 'version': dump.VERSION, 'active': 'project2'}
+    assert [line['type'] for line in lines[1:]] == ['project', 'instance', 'instance'] * 2
+    assert lines[2] == {'type': 'instance', 'project': 'project1', 'name': 'pro1ins1'}
+
+
+def test_compressed_ndjson_round_trip(monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    testdb['active'] = 'project1'
+    before = stored(testdb)
+    Utils(testdb, None).dump(testfile_directory, format='ndjson', compress='gzip')
+    filename = testfile_directory / 'lcdb_dump.ndjson.gz'
+    with open(filename, 'rb') as output:
+        assert output.read(2) == dump.MAGIC[dump.GZIP]
+    testdb['projects'] = {}
+    testdb['active'] = ''
+    restore(testdb, filename, monkeypatch=monkeypatch)
+    assert stored(testdb) == before
+    assert testdb['active'] == 'project1'
+    close_db(testdb)
+
+
+def test_zstd_falls_back_to_gzip_before_python_3_14(monkeypatch):
+    monkeypatch.setattr(dump, 'zstd_module', lambda: None)
+    assert dump.check(dump.NDJSON, dump.ZSTD) == dump.GZIP
+    assert dump.file_name(dump.NDJSON, dump.check(dump.NDJSON, dump.ZSTD)) == 'lcdb_dump.ndjson.gz'
+
+
+def test_broken_line_leaves_the_store_untouched(capsys, monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    before = stored(testdb)
+    filename = testfile_directory / 'broken.ndjson'
+    with open(filename, 'w') as output:
+        output.write('{"type":"lcdb","version":1,"active":"web"}\n'
+                     '{"type":"project","name":"web","root":"/srv/web"}\n'
+                     '{"type":"instance","project":"web","name":"app1"}\n'
+                     '{"type":"instance","project":"api","name":"app2"}\n')
+    restore(testdb, filename, monkeypatch=monkeypatch)
+    captured = capsys.readouterr()
+    assert 'Line 4: instance is not of the project above it.' in captured.out
+    assert stored(testdb) == before
+    close_db(testdb)
+
+
+def test_read_reports_the_line_of_invalid_json():
+    filename = testfile_directory / 'invalid.ndjson'
+    makedirs(testfile_directory, exist_ok=True)
+    with open(filename, 'w') as output:
+        output.write('{"type":"lcdb","version":1,"active":""}\n{"type":"project",\n')
+    try:
+        list(dump.read(filename))
+    except ValueError as error:
+        assert str(error) == 'Line 2 is not valid JSON.'
+    else:
+        assert False
+
+
+def test_restoring_a_project_keeps_the_others(monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    Utils(testdb, None).dump(testfile_directory, format='ndjson', project='project2')
+    testdb['projects']['project2']['instances'].append('pro2ins3')
+    testdb['active'] = 'project1'
+    restore(testdb, testfile_directory / 'lcdb_dump.ndjson', 'project2', monkeypatch)
+    assert testdb['projects']['project2']['instances'] == ['pro2ins1', 'pro2ins2']
+    assert testdb['projects']['project1']['instances'] == ['pro1ins1', 'pro1ins2']
+    assert testdb['active'] == 'project1'
+    close_db(testdb)
+
+
+def test_restoring_a_missing_project(capsys, monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    Utils(testdb, None).dump(testfile_directory, format='ndjson', project='project1')
+    capsys.readouterr()
+    restore(testdb, testfile_directory / 'lcdb_dump.ndjson', 'project2', monkeypatch)
+    captured = capsys.readouterr()
+    close_db(testdb)
+    assert 'Project project2 is not in the file.' in captured.out
+
+
+def test_legacy_json_dump_is_still_restored(monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    before = stored(testdb)
+    Utils(testdb, None).dump(testfile_directory)
+    testdb['projects'] = {}
+    restore(testdb, testfile_directory / 'lcdb_dump.json', monkeypatch=monkeypatch)
+    assert stored(testdb) == before
+    close_db(testdb)
+
+
+def test_gzipped_legacy_json_is_restored(monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    filename = testfile_directory / 'lcdb_dump.json.gz'
+    with gzip.open(filename, 'wt') as output:
+        json.dump({'active': 'web', 'projects': {'web': {'root': '/srv/web', 'instances': ['app1']}}}, output)
+    restore(testdb, filename, monkeypatch=monkeypatch)
+    assert stored(testdb) == {'web': ('/srv/web', ['app1'])}
+    assert testdb['active'] == 'web'
+    close_db(testdb)
+
+
+def test_sqlite_store_is_dumped_without_loading_the_projects():
+    remove_test_files()
+    makedirs(testfile_directory, exist_ok=True)
+    store = SqliteStore(str(testfile_directory / 'testdb.sqlite3'))
+    store['projects']['web'] = {'root': '/srv/web', 'instances': ['app%d' % n for n in range(100)]}
+    store.close()
+    store = SqliteStore(str(testfile_directory / 'testdb.sqlite3'))
+    filename = testfile_directory / 'lcdb_dump.ndjson'
+    dump.write(store, filename, dump.NDJSON)
+    assert not any(record.loaded for record in store['projects']._records.values())
+    store.close()
+    projects = list(dump.read(filename))
+    assert projects == [('web', '/srv/web', ['app%d' % n for n in range(100)])]
+
+
+def test_broken_line_after_the_first_project_leaves_the_store_untouched(capsys, monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    before = stored(testdb)
+    filename = testfile_directory / 'broken.ndjson'
+    with open(filename, 'w') as output:
+        output.write('{"type":"lcdb","version":1,"active":"web"}\n'
+                     '{"type":"project","name":"web","root":"/srv/web"}\n'
+                     '{"type":"instance","project":"web","name":"app1"}\n'
+                     '{"type":"project","name":"api","root":"/srv/api"}\n'
+                     '{"type":"instance","project":"api","name":\n')
+    restore(testdb, filename, monkeypatch=monkeypatch)
+    captured = capsys.readouterr()
+    assert 'Line 5 is not valid JSON.' in captured.out
+    assert stored(testdb) == before
+    close_db(testdb)
+
+
+def test_failed_restore_is_rolled_back(capsys, monkeypatch):
+    from lordcommander.storage import ProjectMap
+    remove_test_files()
+    makedirs(testfile_directory, exist_ok=True)
+    store = SqliteStore(str(testfile_directory / 'testdb.sqlite3'))
+    store['projects']['web'] = {'root': '/srv/web', 'instances': ['app1']}
+    store['active'] = 'web'
+    filename = testfile_directory / 'lcdb_dump.ndjson'
+    with open(filename, 'w') as output:
+        output.write('{"type":"lcdb","version":1,"active":"api"}\n'
+                     '{"type":"project","name":"api","root":"/srv/api"}\n'
+                     '{"type":"project","name":"db","root":"/srv/db"}\n')
+    setitem = ProjectMap.__setitem__
+
+    def failing(projects, name, project):
+        if name == 'db':
+            raise ValueError('Disk is full.')
+        setitem(projects, name, project)
+
+    monkeypatch.setattr(ProjectMap, '__setitem__', failing)
+    restore(store, filename, monkeypatch=monkeypatch)
+    assert 'Disk is full.' in capsys.readouterr().out
+    store.close()
+    store = SqliteStore(str(testfile_directory / 'testdb.sqlite3'))
+    assert list(store['projects']) == ['web']
+    assert store['active'] == 'web'
+    store.close()
+
+
+def test_broken_legacy_json_leaves_the_store_untouched(capsys, monkeypatch):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    before = stored(testdb)
+    filename = testfile_directory / 'broken.json'
+    with open(filename, 'w') as output:
+        json.dump({'active': 'web', 'projects': {'web': {'root': '/srv/web', 'instances': ['app1']},
+                                                 'api': {'instances': ['app2']}}}, output)
+    asked = []
+    monkeypatch.setattr('builtins.input', lambda prompt='': asked.append(prompt) or 'yes')
+    Utils(testdb, None).restore(str(filename))
+    assert "Project api: 'root' should be a non-empty string." in capsys.readouterr().out
+    assert asked == []
+    assert stored(testdb) == before
+    close_db(testdb)
@@ -0,0 +1,87 @@
+import io
+import re
+
+from lordcommander.engine import AsyncEngine
+from .commons import *
+
+
+def plain(text):
+    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+
+
+def get_tasks():
+    generate_full_dummy_data()
+    root = Path(__file__).parent.parent.resolve() / '.testfiles' / 'project1'
+    return [(0, 'pro1ins1', root / 'pro1ins1'), (1, 'pro1ins2', root / 'pro1ins2')]
+
+
+def test_lines_are_prefixed_with_instance():
+    out, err = io.StringIO(), io.StringIO()
+    results = AsyncEngine(out, err).run('echo one; echo two >&2; printf three', get_tasks(), 2)
+    lines = plain(out.getvalue()).splitlines()
+    assert '[0] pro1ins1 | one' in lines
+    assert '[1] pro1ins2 | three' in lines
+    assert '[1] pro1ins2 | two' in plain(err.getvalue()).splitlines()
+    assert all(result.succeeded for result in results)
+
+
+def test_results_keep_task_order_and_exit_codes():
+    out, err = io.StringIO(), io.StringIO()
+    results = AsyncEngine(out, err).run('test "$(basename "$(pwd)")" = pro1ins2', get_tasks(), 1)
+    assert [result.returncode for result in results] == [1, 0]
+
+
+def test_long_lines_are_forwarded_in_chunks():
+    out, err = io.StringIO(), io.StringIO()
+    engine = AsyncEngine(out, err)
+    engine.LINE_LIMIT = 16
+    engine.run('printf "%0100d\\n" 0', get_tasks()[:1], 1)
+    forwarded = ''.join(line.split('| ', 1)[1] for line in plain(out.getvalue()).splitlines()
+                        if 'exited with' not in line)
+    assert forwarded.count('0') == 100
+
+
+def test_timed_out_commands_are_killed():
+    out, err = io.StringIO(), io.StringIO()
+    results = AsyncEngine(out, err).run('echo started; sleep 30', get_tasks(), 2, timeout=0.5)
+    assert all(result.timed_out and not result.succeeded for result in results)
+    assert all(result.duration < 5 for result in results)
+    assert '[0] pro1ins1 | started' in plain(out.getvalue()).splitlines()
+    assert 'timed out after' in plain(out.getvalue())
+
+
+def test_timeout_holds_after_the_output_is_closed():
+    out, err = io.StringIO(), io.StringIO()
+    results = AsyncEngine(out, err).run('exec >/dev/null 2>&1; sleep 30', get_tasks(), 2, timeout=0.5)
+    assert all(result.timed_out and result.duration < 5 for result in results)
+
+
+def test_direct_commands_are_streamed():
+    from lordcommander.executor import DirectCommand
+    out, err = io.StringIO(), io.StringIO()
+    results = AsyncEngine(out, err).run(DirectCommand('echo $HOME'), get_tasks(), 2)
+    assert all(result.succeeded for result in results)
+    assert '[0] pro1ins1 | $HOME' in plain(out.getvalue()).splitlines()
+
+
+def test_cancelled_commands_leave_nothing_unretrieved():
+    import asyncio
+    import gc
+    out, err = io.StringIO(), io.StringIO()
+    engine = AsyncEngine(out, err)
+    unretrieved = []
+
+    async def cancelled():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        task = asyncio.ensure_future(engine._run_all('sleep 30', get_tasks(), 2, None, None))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        gc.collect()
+        await asyncio.sleep(0)
+
+    asyncio.run(cancelled())
+    assert unretrieved == []
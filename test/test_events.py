@@ -0,0 +1,57 @@
+import io
+import json
+
+from lordcommander.controllers import CommandController
+from lordcommander.events import EventStream
+from .commons import *
+from .test_history import commander_with_history
+
+
+def events_of(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_every_instance_starts_and_finishes():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    stream = io.StringIO()
+    cc = CommandController(events=EventStream(stream))
+    cc.run(project, 'test -d ../pro1ins2', jobs=2, inc=(0, 1, 5))
+    events = events_of(stream.getvalue())
+    assert [event['event'] for event in events].count('start') == 2
+    finished = {event['index']: event for event in events if event['event'] == 'finish'}
+    assert finished[0]['instance'] == 'pro1ins1' and finished[0]['code'] == 0 and finished[0]['duration'] >= 0
+    assert finished[1]['code'] == 0
+    summary = events[-1]
+    assert summary['event'] == 'summary' and summary['command'] == 'test -d ../pro1ins2'
+    assert (summary['succeeded'], summary['failed'], summary['complete']) == (2, 0, True)
+
+
+def test_jsonl_output_keeps_stdout_for_events(monkeypatch, capsys):
+    lc, project = commander_with_history(monkeypatch)
+    lc.run('echo hello; exit 3', output='jsonl')
+    captured = capsys.readouterr()
+    events = events_of(captured.out)
+    assert [event['event'] for event in events] == ['start', 'finish', 'start', 'finish', 'summary']
+    assert events[1]['code'] == 3 and events[-1]['failed'] == 2
+    assert captured.err.count('hello') == 2
+    lc.run('true', output='xml')
+    assert "Output should be either 'text' or 'jsonl'." in capsys.readouterr().out
+    close_db(lc._lcdb)
+
+
+def test_errors_before_the_run_are_events(monkeypatch, capsys):
+    lc, project = commander_with_history(monkeypatch)
+    lc.run('echo a | cat', exec_=True, output='jsonl')
+    captured = capsys.readouterr()
+    events = events_of(captured.out)
+    assert [event['event'] for event in events] == ['error']
+    assert events[0]['message'] == "'|' needs a shell, it can't be run with --exec_."
+    assert "needs a shell" in captured.err
+    lc.run('true', failed=True, output='jsonl')
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert "Nothing is left to run for 'true'." in captured.err
+    close_db(lc._lcdb)
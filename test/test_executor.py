@@ -0,0 +1,161 @@
+import os
+import time
+
+from lordcommander.executor import Executor
+from .commons import *
+
+
+def test_command_runs_in_instance_directory():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    result = Executor().run('pwd > where.txt', instance)
+    assert result.succeeded
+    assert (instance / 'where.txt').read_text().strip() == str(instance)
+
+
+def test_working_directory_is_left_alone():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    cwd = os.getcwd()
+    Executor().run('true', Path(pro_path) / ins_name)
+    assert os.getcwd() == cwd
+
+
+def test_exit_code_and_usage_are_reported():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    result = Executor().run('exit 3', Path(pro_path) / ins_name)
+    assert result.returncode == 3
+    assert not result.succeeded
+    assert result.duration >= 0
+    assert result.max_rss is None or result.max_rss > 0
+
+
+def test_peak_memory_inherited_from_us_is_not_reported():
+    import sys
+    from lordcommander.executor import own_max_rss
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    ballast = b'x' * (64 * 1024 * 1024)
+    assert Executor().run('true', Path(pro_path) / ins_name).max_rss is None
+    size = (own_max_rss() + 32 * 1024) * 1024
+    result = Executor().run("%s -c 'x = b\"x\" * %d'" % (sys.executable, size), Path(pro_path) / ins_name)
+    assert result.max_rss is not None and result.max_rss > own_max_rss()
+    del ballast
+
+
+def test_plain_serial_command_stays_in_the_foreground():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    script = 'python3 -c "import os; print(os.getpgrp())" > group.txt'
+    Executor().run(script, instance, foreground=True)
+    assert int((instance / 'group.txt').read_text()) == os.getpgrp()
+    # A time limit needs a group of its own to kill
+    Executor().run(script, instance, timeout=30, foreground=True)
+    assert int((instance / 'group.txt').read_text()) != os.getpgrp()
+    Executor().run(script, instance)
+    assert int((instance / 'group.txt').read_text()) != os.getpgrp()
+
+
+def test_foreground_command_is_terminated_on_cancel():
+    import threading
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    executor = Executor()
+    threading.Timer(0.3, executor.cancel).start()
+    result = executor.run('sleep 30', Path(pro_path) / ins_name, foreground=True)
+    assert result.returncode == -15 and result.duration < 5
+
+
+def test_killed_child_has_negative_exit_code():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    result = Executor().run('kill -9 $$', Path(pro_path) / ins_name)
+    assert result.returncode == -9
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A zombie waiting to be reaped by init is gone too
+    stat = Path('/proc/%d/stat' % pid)
+    return not stat.exists() or stat.read_text().rsplit(')', 1)[1].split()[0] != 'Z'
+
+
+def test_timeout_kills_the_whole_process_group():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    result = Executor().run('sleep 30 & echo $! > child.pid; wait', instance, timeout=0.5)
+    assert result.timed_out and not result.succeeded
+    assert result.duration < 5
+    child = int((instance / 'child.pid').read_text())
+    # SIGKILL is delivered asynchronously
+    for _ in range(100):
+        if not process_exists(child):
+            break
+        time.sleep(0.02)
+    assert not process_exists(child)
+
+
+def test_timeout_holds_after_the_output_is_closed():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    result = Executor().run('exec >/dev/null 2>&1; sleep 30', Path(pro_path) / ins_name, timeout=0.5)
+    assert result.timed_out and not result.succeeded
+    assert result.duration < 5
+
+
+def test_output_goes_straight_to_our_stdout_unless_redirected():
+    import subprocess
+    import sys
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    script = ("import sys; from lordcommander.executor import Executor; "
+              "result = Executor().run('echo hi; sleep 3 &', sys.argv[1]); "
+              "print(result.output, result.duration < 2)")
+    with open('.testfiles/straight.txt', 'w') as output:
+        subprocess.run([sys.executable, '-c', script, str(Path(pro_path) / ins_name)], stdout=output,
+                       cwd=str(Path(__file__).parent.parent), check=True)
+    assert Path('.testfiles/straight.txt').read_text().split() == ['hi', 'None', 'True']
+
+
+def test_reading_stops_when_the_command_exits():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    chunks = []
+    result = Executor().run('echo hi; sleep 30 & echo $! > child.pid', instance,
+                            sink=lambda stream, chunk: chunks.append(chunk))
+    os.kill(int((instance / 'child.pid').read_text()), 9)
+    assert result.succeeded and result.duration < 5
+    assert b''.join(chunks) == b'hi\n'
+
+
+def test_passed_deadline_does_not_start_the_command():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    result = Executor().run('touch ran', instance, deadline=time.monotonic() - 1)
+    assert result.timed_out and result.returncode is None
+    assert not (instance / 'ran').exists()
+
+
+def test_cancel_terminates_running_commands():
+    import threading
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    executor = Executor()
+    threading.Timer(0.3, executor.cancel).start()
+    result = executor.run('sleep 30', Path(pro_path) / ins_name)
+    assert result.returncode == -15
+    assert executor.run('true', Path(pro_path) / ins_name) is None
+
+
+def test_direct_command_runs_without_a_shell():
+    import pytest
+    from lordcommander.executor import DirectCommand
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    command = DirectCommand("touch 'with space' $HOME")
+    assert command == "touch 'with space' $HOME"
+    assert command.argv[0].endswith('/touch')
+    result = Executor().run(command, instance)
+    assert result.succeeded
+    # No shell, so nothing is expanded
+    assert (instance / 'with space').exists() and (instance / '$HOME').exists()
+    with pytest.raises(ValueError):
+        DirectCommand('git status | grep modified')
+    with pytest.raises(ValueError):
+        DirectCommand('surely-no-such-program-here')
@@ -0,0 +1,147 @@
+import os
+
+from lordcommander.controllers import CommandController
+from lordcommander.history import RunHistory
+from .commons import *
+
+
+def run_with_history(command, jobs=1, stream=False):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    project['instances'].append('missing')
+    history = RunHistory('.testfiles')
+    recorder = history.begin('project1', command, {'jobs': jobs})
+    CommandController(recorder=recorder).run(project, command, jobs=jobs, stream=stream)
+    return history, recorder.run_id
+
+
+def test_run_and_instances_are_recorded(capsys):
+    history, run_id = run_with_history('echo hello; echo oops >&2; test -f marker')
+    runs = history.runs()
+    assert len(runs) == 1
+    assert runs[0]['command'] == 'echo hello; echo oops >&2; test -f marker'
+    assert (runs[0]['succeeded'], runs[0]['failed']) == (0, 3)
+    instances = history.instances(run_id)
+    assert [record['index'] for record in instances] == [0, 1, 2]
+    first, second, missing = instances
+    assert missing['code'] is None and missing['state'] == 'missing'
+    assert first['code'] == 1 and first['out'] == 6 and first['err'] == 5
+    assert first['digest'] == second['digest']
+
+
+def test_streamed_and_parallel_runs_have_the_same_digest(capsys):
+    history, serial = run_with_history('echo same', jobs=1)
+    serial_digests = {r['name']: r.get('digest') for r in history.instances(serial)}
+    history, streamed = run_with_history('echo same', jobs=2, stream=True)
+    streamed_digests = {r['name']: r.get('digest') for r in history.instances(streamed)}
+    assert serial_digests == streamed_digests
+
+
+def test_viewing_an_unknown_run(capsys):
+    history, run_id = run_with_history('true')
+    capsys.readouterr()
+    history.view('doesnotexist')
+    assert "Run doesnotexist is not found in the history." in capsys.readouterr().out
+
+
+def commander_with_history(monkeypatch):
+    import lordcommander.commander as commander
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    testdb['active'] = 'project1'
+    monkeypatch.setattr(commander, 'create_data_dir', lambda: '.testfiles')
+    return commander.LordCommander(testdb), testdb['projects']['project1']
+
+
+def test_failed_runs_only_instances_that_failed_last(monkeypatch, capsys):
+    lc, project = commander_with_history(monkeypatch)
+    command = 'touch ran; test -f ok'
+    Path(project['root'], 'pro1ins1', 'ok').touch()
+    lc.run(command)
+    for name in project['instances']:
+        Path(project['root'], name, 'ran').unlink()
+    lc.run(command, failed=True)
+    assert not Path(project['root'], 'pro1ins1', 'ran').exists()
+    assert Path(project['root'], 'pro1ins2', 'ran').exists()
+    runs = RunHistory('.testfiles').runs()
+    assert runs[-1]['selection']['inc'] == [1]
+    lc.run(command, failed=True)
+    lc.run('true', failed=True)
+    assert "Nothing is left to run for 'true'." in capsys.readouterr().out
+    close_db(lc._lcdb)
+
+
+def test_resume_continues_an_interrupted_run(monkeypatch, capsys):
+    lc, project = commander_with_history(monkeypatch)
+    history = RunHistory('.testfiles')
+    recorder = history.begin('project1', 'touch ran', {'li': 0, 'ui': None, 'ex': [], 'inc': []})
+    recorder.record(0, 'pro1ins1', state='missing')
+    recorder.finish(0, 1, complete=False)
+    lc.run('touch ran', resume=True)
+    assert not Path(project['root'], 'pro1ins1', 'ran').exists()
+    assert Path(project['root'], 'pro1ins2', 'ran').exists()
+    assert history.runs()[-1]['selection']['resumed_from'] == recorder.run_id
+    assert history.unfinished('project1', 'touch ran') is None
+    lc.run('touch ran', resume=True)
+    assert "No interrupted run of 'touch ran' has been found." in capsys.readouterr().out
+    close_db(lc._lcdb)
+
+
+def test_interrupted_run_stops_cleanly(monkeypatch, capsys):
+    import pytest
+    from lordcommander.executor import Executor
+    lc, project = commander_with_history(monkeypatch)
+    run = Executor.run
+
+    def interrupted(executor, cmd, instance_path, *args, **kwargs):
+        if Path(instance_path).name == 'pro1ins2':
+            raise KeyboardInterrupt
+        return run(executor, cmd, instance_path, *args, **kwargs)
+
+    monkeypatch.setattr(Executor, 'run', interrupted)
+    with pytest.raises(SystemExit) as exit:
+        lc.run('touch ran')
+    assert exit.value.code == 130
+    out = capsys.readouterr().out
+    assert 'Successful run:' in out and 'Interrupted!' in out
+    assert RunHistory('.testfiles').unfinished('project1', 'touch ran') is not None
+    close_db(lc._lcdb)
+
+
+def test_durations_are_kept_apart_from_the_history(capsys):
+    from lordcommander.executor import ExecutionResult
+    history, run_id = run_with_history('true', jobs=2)
+    recorder = history.begin('project1', 'slow', {})
+    recorder.record(0, 'pro1ins1', ExecutionResult('pro1ins1', 0, 5.0))
+    recorder.finish(1, 0)
+    os.unlink('.testfiles/history.jsonl')
+    durations = RunHistory('.testfiles').durations('project1', 'true')
+    assert set(durations) == {'pro1ins1', 'pro1ins2'}
+    assert all(seconds < 5 for seconds in durations.values())
+    # The most recently run command wins
+    assert RunHistory('.testfiles').durations('project1')['pro1ins1'] == 5.0
+    assert RunHistory('.testfiles').durations('project2') == {}
+
+
+def test_durations_of_an_older_history_are_indexed(capsys):
+    history, run_id = run_with_history('true')
+    os.unlink('.testfiles/durations.json')
+    assert set(RunHistory('.testfiles').durations('project1', 'true')) == {'pro1ins1', 'pro1ins2'}
+    assert os.path.exists('.testfiles/durations.json')
+
+
+def test_history_is_rotated_once_it_is_large(monkeypatch, capsys):
+    import lordcommander.history as history_module
+    history, first = run_with_history('true')
+    monkeypatch.setattr(history_module, 'ROTATE_BYTES', 10)
+    recorder = history.begin('project1', 'false', {})
+    recorder.finish(0, 0)
+    assert os.path.exists('.testfiles/history.jsonl.1')
+    assert [run['run'] for run in history.runs()] == [first, recorder.run_id]
+    recorder = history.begin('project1', 'false', {})
+    recorder.finish(0, 0)
+    # Only the file before is kept
+    assert first not in [run['run'] for run in history.runs()]
+
@@ -0,0 +1,44 @@
+import time
+
+from lordcommander.controllers import CommandController, DirectoryController
+from lordcommander.index import InstanceIndex
+from lordcommander.utils import Utils
+
+
+def test_select_applies_slice_and_filters():
+    index = InstanceIndex(['a', 'b', 'c', 'd', 'e'])
+    assert index.select(1, 4) == [(1, 'b'), (2, 'c'), (3, 'd')]
+    assert index.select(ex=(0, 2)) == [(1, 'b'), (3, 'd'), (4, 'e')]
+    assert index.select(1, inc=(0, 2, 4)) == [(2, 'c'), (4, 'e')]
+
+
+def test_changes_are_made_on_the_shared_list():
+    instances = ['a', 'b']
+    index = InstanceIndex(instances)
+    assert index.extend(['b', 'c', 'c']) == ['c']
+    assert index.remove(['a', 'x']) == {'a'}
+    assert instances == ['b', 'c']
+    assert index.position('c') == 1
+    assert index.position('a') is None
+
+
+def test_items_are_sorted_with_original_indices():
+    index = InstanceIndex(['b', 'c', 'a'])
+    assert index.items(sort=True) == [(2, 'a'), (0, 'b'), (1, 'c')]
+
+
+def test_large_project_stays_linear(capsys):
+    # Regression benchmark, quadratic scans take minutes at this size
+    instances = ['instance%06d' % i for i in range(100000)]
+    started = time.monotonic()
+    project = {'root': '/', 'instances': instances}
+    selected = CommandController()._get_instances(project, 0, None, tuple(range(0, 100000, 2)), ())
+    dc = DirectoryController(instances)
+    dc.add(*['instance%06d' % i for i in range(99000, 101000)])
+    dc.view(sort=True)
+    Utils(None, project).search('instance099999')
+    elapsed = time.monotonic() - started
+    capsys.readouterr()
+    assert len(selected) == 50000
+    assert len(instances) == 101000
+    assert elapsed < 5
@@ -0,0 +1,68 @@
+import time
+
+from lordcommander.controllers import CommandController
+from lordcommander.executor import ExecutionResult
+from lordcommander.metrics import RunMetrics
+from .commons import *
+
+
+def samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_metrics_are_rendered_in_openmetrics_format():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    metrics = RunMetrics(str(Path(pro_path) / 'lc.prom'), 'web', 'echo "hi"')
+    metrics.observe(ExecutionResult('a', 0, 0.3), {'succeeded': 1, 'failed': 0, 'timed_out': 0})
+    metrics.observe(ExecutionResult('b', 1, 2.0), {'succeeded': 1, 'failed': 1, 'timed_out': 0})
+    metrics.observe(ExecutionResult('c', None, 5.0, timed_out=True), {'succeeded': 1, 'failed': 1, 'timed_out': 1})
+    metrics.observe(None, {'succeeded': 1, 'failed': 2, 'timed_out': 1})
+    text = metrics.render()
+    assert text.endswith('# EOF\n')
+    values = samples(text)
+    labels = 'project="web",command="echo \\"hi\\""'
+    assert values['lc_run_instances_total{%s,outcome="succeeded"}' % labels] == '1'
+    assert values['lc_run_instances_total{%s,outcome="failed"}' % labels] == '2'
+    assert values['lc_run_instances_total{%s,outcome="timed_out"}' % labels] == '1'
+    assert values['lc_run_instance_duration_seconds_bucket{%s,le="0.5"}' % labels] == '1'
+    assert values['lc_run_instance_duration_seconds_bucket{%s,le="2.5"}' % labels] == '2'
+    assert values['lc_run_instance_duration_seconds_bucket{%s,le="+Inf"}' % labels] == '3'
+    assert float(values['lc_run_instance_duration_seconds_sum{%s}' % labels]) == 7.3
+    assert values['lc_run_complete{%s}' % labels] == '0'
+
+
+def test_run_writes_the_metrics_file():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    path = Path(project['root'], 'lc.prom')
+    metrics = RunMetrics(str(path), 'project1', 'sleep 0.2', interval=0.05)
+    cc = CommandController(metrics=metrics)
+    cc.run(project, 'sleep 0.2', jobs=2, inc=(0, 1, 5))
+    values = samples(path.read_text())
+    labels = 'project="project1",command="sleep 0.2"'
+    assert values['lc_run_instances_total{%s,outcome="succeeded"}' % labels] == '2'
+    assert values['lc_run_instances_total{%s,outcome="failed"}' % labels] == '0'
+    assert values['lc_run_peak_concurrency{%s}' % labels] == '2'
+    # The same counts as the summary of the run
+    assert {outcome: int(values['lc_run_instances_total{%s,outcome="%s"}' % (labels, outcome)])
+            for outcome in cc._counts} == cc._counts
+    assert float(values['lc_run_preflight_seconds{%s}' % labels]) > 0
+    assert values['lc_run_complete{%s}' % labels] == '1'
+    # Only the file itself is left behind
+    assert [entry.name for entry in path.parent.iterdir() if entry.name.endswith('.tmp')] == []
+
+
+def test_metrics_are_written_during_the_run():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    path = Path(pro_path) / 'lc.prom'
+    metrics = RunMetrics(str(path), 'web', 'true', interval=0.05)
+    metrics.start()
+    for _ in range(100):
+        if path.exists():
+            break
+        time.sleep(0.02)
+    assert 'lc_run_complete{project="web",command="true"} 0' in path.read_text()
+    metrics.finish(True)
+    assert 'lc_run_complete{project="web",command="true"} 1' in path.read_text()
@@ -0,0 +1,46 @@
+import subprocess
+import sys
+
+import pytest
+from colr import color
+
+from lordcommander.output import Output
+
+
+@pytest.mark.parametrize('code', [Output.SUCCESS, Output.INFO, Output.WARNING, Output.DANGER, Output.MUTED, ''])
+@pytest.mark.parametrize('text', ['Success!', '', 'a\nb', 42, color('nested', fore='RED')])
+def test_colorize_matches_colr(code, text):
+    assert Output.colorize(text, code) == color(f"{text}", fore=code)
+
+
+def test_colorize_falls_back_to_colr_for_other_codes():
+    assert Output.colorize('text', 'ff0000') == color('text', fore='ff0000')
+
+
+def test_heavy_modules_are_not_loaded_on_start_up():
+    # Importing the entry point must not pull Fire, colr, asyncio or the controllers
+    code = ("import sys, lordcommander; "
+            "print(sorted(m for m in ('fire', 'colr', 'asyncio', 'concurrent.futures', 'pickle', "
+            "'lordcommander.controllers') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_colors_only_go_to_a_terminal():
+    import io
+    from lordcommander.output import wants_color
+
+    class Terminal(io.StringIO):
+        def isatty(self):
+            return True
+
+    assert wants_color(Terminal(), {})
+    assert not wants_color(io.StringIO(), {})
+    assert not wants_color(Terminal(), {'NO_COLOR': '1'})
+    assert wants_color(io.StringIO(), {'FORCE_COLOR': '1'})
+
+
+def test_message_of_several_parts_is_a_single_line(monkeypatch, capsys):
+    monkeypatch.setattr(Output, 'COLORED', False)
+    Output.write([{'text': 'Exited with', 'code': Output.MUTED}, {'text': 0, 'code': Output.SUCCESS}])
+    assert capsys.readouterr().out == "Exited with 0 \n\n"
@@ -0,0 +1,100 @@
+from lordcommander.controllers import CommandController
+from lordcommander.pool import ShellPool, _Demux
+from .commons import *
+
+
+def test_commands_run_in_their_own_directory_and_leave_no_state():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    pool = ShellPool()
+    try:
+        result = pool.run('cd / && export LC_POOL_TEST=1 && pwd > "%s/where.txt"; exit 3' % instance, instance)
+        assert result.returncode == 3 and not result.succeeded
+        assert (instance / 'where.txt').read_text().strip() == '/'
+        result = pool.run('pwd > where.txt; echo "${LC_POOL_TEST:-unset}" > leak.txt', instance)
+        assert result.succeeded
+        assert (instance / 'where.txt').read_text().strip() == str(instance)
+        assert (instance / 'leak.txt').read_text().strip() == 'unset'
+        # Both commands went to the same shell
+        assert pool.size == 1
+    finally:
+        pool.close()
+
+
+def test_output_is_split_from_the_sentinel():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    chunks = []
+    pool = ShellPool()
+    try:
+        result = pool.run("printf 'no newline'; printf 'oops' >&2; echo ')'", Path(pro_path) / ins_name,
+                          sink=lambda stream, chunk: chunks.append((stream, chunk)))
+        assert result.succeeded
+        assert b''.join(chunk for stream, chunk in chunks if stream == 'stdout') == b'no newline)\n'
+        assert b''.join(chunk for stream, chunk in chunks if stream == 'stderr') == b'oops'
+        # A syntax error doesn't break the worker
+        assert pool.run("echo 'unbalanced", Path(pro_path) / ins_name, sink=lambda *_: None).returncode != 0
+        assert pool.run('true', Path(pro_path) / ins_name).succeeded
+    finally:
+        pool.close()
+
+
+def test_sentinel_split_across_chunks():
+    demux = _Demux(b'\0token:')
+    data = b''.join(demux.feed(chunk) for chunk in (b'out\0tok', b'en:', b'7', b'\n'))
+    assert data == b'out' and demux.trailer == b'7'
+
+
+def test_timed_out_worker_is_replaced():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    pool = ShellPool()
+    try:
+        result = pool.run('sleep 30', instance, timeout=0.5)
+        assert result.timed_out and result.duration < 5
+        assert pool.size == 0
+        assert pool.run('true', instance).succeeded
+    finally:
+        pool.close()
+
+
+def test_controller_runs_on_the_pool():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    pool = ShellPool()
+    try:
+        cc = CommandController(executor=pool)
+        cc.run(project, 'test -d .', jobs=2)
+        assert cc._counts == {'succeeded': 2, 'failed': 0, 'timed_out': 0}
+        assert pool.size <= 2
+    finally:
+        pool.close()
+    assert pool.size == 0
+
+
+def test_cancel_wakes_the_running_commands():
+    import threading
+    import time
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    pool = ShellPool()
+    results = []
+
+    def run():
+        results.append(pool.run('sleep 30', instance, sink=lambda *_: None))
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    pool.cancel()
+    for thread in threads:
+        thread.join(10)
+    assert not any(thread.is_alive() for thread in threads)
+    assert time.monotonic() - started < 5
+    # Left for 'lc run --resume', not failed
+    assert results == [None, None]
+    assert pool.size == 0
+    pool.close()
@@ -0,0 +1,26 @@
+import os
+
+from lordcommander.preflight import MISSING, NOT_A_DIRECTORY, PRESENT, DirectoryCache
+from .commons import *
+
+
+def test_states_are_answered_from_a_single_scan():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    root = Path(pro_path)
+    (root / 'file').touch()
+    makedirs(root / 'nested' / 'deeper', exist_ok=True)
+    os.symlink(root / ins_name, root / 'link')
+    os.symlink(root / 'gone', root / 'broken')
+    cache = DirectoryCache(root)
+    assert cache.state(ins_name) == PRESENT
+    assert cache.state('link') == PRESENT
+    assert cache.state('file') == NOT_A_DIRECTORY
+    assert cache.state('broken') == MISSING
+    assert cache.state('unknown') == MISSING
+    assert cache.state('nested/deeper') == PRESENT
+    remove_test_files()
+
+
+def test_missing_root_has_nothing():
+    cache = DirectoryCache('/nonexistent/lordcommander/root')
+    assert cache.state('anything') == MISSING
@@ -0,0 +1,42 @@
+import io
+import json
+
+from lordcommander.controllers import CommandController
+from lordcommander.executor import Executor
+from lordcommander.output import Output
+from lordcommander.profiler import Profiler, profile_argument
+from .commons import *
+
+
+def test_profile_argument_is_taken_out():
+    argv, profiler = profile_argument(['run', 'true', '--profile', '--jobs=2'])
+    assert argv == ['run', 'true', '--jobs=2'] and profiler.path is None
+    argv, profiler = profile_argument(['proj', 'view', '--profile=trace.json'])
+    assert argv == ['proj', 'view'] and profiler.path == 'trace.json'
+    assert profile_argument(['run', 'make --profile']) == (['run', 'make --profile'], None)
+
+
+def test_phases_and_instances_are_timed(capsys):
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    run, write = Executor.run, Output.__dict__['write']
+    trace = Path(project['root'], 'trace.json')
+    profiler = Profiler(str(trace))
+    profiler.install()
+    assert Executor.run is not run
+    CommandController().run(project, 'true', jobs=2)
+    table = io.StringIO()
+    profiler.finish(table)
+    # Nothing is left wrapped
+    assert Executor.run is run and Output.__dict__['write'] is write
+    report = table.getvalue()
+    for phase in ('select instances', 'pre-flight', 'render output'):
+        assert phase in report
+    assert "2 instances: spawn" in report
+    assert set(profiler.instances) == {str(Path(project['root'], name)) for name in project['instances']}
+    assert all(0 < spawn <= total for spawn, total in profiler.instances.values())
+    events = json.loads(trace.read_text())['traceEvents']
+    assert {'spawn', 'instance', 'select instances'} <= {event['name'] for event in events}
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
@@ -0,0 +1,81 @@
+import re
+import threading
+import time
+
+from lordcommander.history import RunHistory
+from lordcommander.scheduler import AdaptiveLimit, Throttle, longest_first, predict
+from .commons import *
+
+
+def plain(text):
+    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+
+
+def test_longest_are_started_first():
+    tasks = [(0, 'a', None), (1, 'b', None), (2, 'c', None), (3, 'd', None)]
+    ordered = longest_first(tasks, {'a': 1.0, 'b': 9.0, 'd': 3.0})
+    # 'c' has never run, so it is expected to take the average
+    assert [name for _, name, _ in ordered] == ['b', 'c', 'd', 'a']
+    assert longest_first(tasks, {}) == tasks
+
+
+def test_run_time_is_predicted():
+    assert predict([5, 3, 3, 2, 1], 2) == 7
+    assert predict([5, 3, 3, 2, 1], 1) == 14
+    assert predict([5, 3], 8) == 5
+
+
+def test_adaptive_limit_follows_the_load():
+    load = {'value': (4.0, 0.5)}
+    limit = AdaptiveLimit(4, probe=lambda: load['value'], interval=0)
+    assert [limit() for _ in range(5)][-1] == 1
+    load['value'] = (0.1, 0.5)
+    assert [limit() for _ in range(5)][-1] == 4
+    # Short on memory, even if the CPUs are idle
+    load['value'] = (0.1, 0.05)
+    assert limit() == 3
+
+
+def test_throttle_lets_a_limited_number_in():
+    throttle = Throttle(2)
+    
+    def work():
+        with throttle:
+            time.sleep(0.05)
+    
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert throttle.peak == 2 and throttle.running == 0
+
+
+def test_dry_run_predicts_the_run_time(monkeypatch, capsys):
+    import lordcommander.commander as commander
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    testdb['active'] = 'project1'
+    monkeypatch.setattr(commander, 'create_data_dir', lambda: '.testfiles')
+    lc = commander.LordCommander(testdb)
+    lc.run('true', dry_run=True)
+    assert "'true' has never run here before" in capsys.readouterr().out
+    lc.run('true')
+    capsys.readouterr()
+    lc.run('true', jobs=2, adaptive=True, dry_run=True)
+    out = capsys.readouterr().out
+    assert "Predicted run time:" in out and "with 2 jobs" in out
+    assert "Changed directory" not in out
+    # Dry runs are not recorded
+    assert len(RunHistory('.testfiles').runs()) == 1
+    close_db(testdb)
+
+
+def test_adaptive_parallel_run(capsys):
+    from lordcommander.controllers import CommandController
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    CommandController().run(project, 'true', jobs=2, adaptive=True, durations={'pro1ins2': 1.0})
+    assert "Successful run: 2" in plain(capsys.readouterr().out)
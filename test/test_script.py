@@ -0,0 +1,87 @@
+import pytest
+
+from lordcommander.controllers import CommandController
+from lordcommander.executor import Executor
+from lordcommander.history import RunHistory
+from lordcommander.script import Script, StepExecutor, read_script
+from .commons import *
+from .test_history import commander_with_history
+
+
+def test_script_stops_at_the_first_failing_step():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    script = Script(['touch one', 'exit 4', 'touch three'])
+    assert script == 'touch one && exit 4 && touch three'
+    result = StepExecutor(Executor()).run(script, instance, sink=lambda *_: None)
+    assert result.returncode == 4 and not result.succeeded
+    assert (instance / 'one').exists() and not (instance / 'three').exists()
+    assert [step for step, _ in result.steps] == script.steps
+    assert [step_result.returncode for _, step_result in result.steps[:2]] == [0, 4]
+    assert result.steps[2][1] is None
+    assert result.duration >= sum(step_result.duration for _, step_result in result.steps[:2])
+    # Plain commands pass through
+    assert StepExecutor(Executor()).run('true', instance).steps is None
+    with pytest.raises(ValueError):
+        Script([])
+
+
+def test_timeout_covers_all_steps_of_a_directory():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    instance = Path(pro_path) / ins_name
+    result = StepExecutor(Executor()).run(Script(['sleep 0.4', 'sleep 0.4', 'touch late']), instance,
+                                          timeout=0.6)
+    assert result.timed_out and result.steps[1][1].timed_out
+    assert not (instance / 'late').exists()
+
+
+def test_read_script_skips_blank_lines_and_comments():
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    path = Path(pro_path) / 'steps.txt'
+    path.write_text("# deploy\ngit pull\n\n  make build  \n")
+    assert read_script(path) == ['git pull', 'make build']
+    with pytest.raises(ValueError):
+        read_script(Path(pro_path) / 'missing.txt')
+
+
+def test_directories_go_through_the_steps_independently():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    root = Path(project['root'])
+    (root / 'pro1ins1' / 'slow').touch()
+    script = Script(['if test -f slow; then sleep 1; fi; date +%s.%N > first',
+                     'date +%s.%N > second'])
+    cc = CommandController(executor=StepExecutor(Executor()))
+    cc.run(project, script, jobs=2)
+    assert cc._counts['succeeded'] == 2
+    # The fast directory is done before the slow one finishes its first step
+    assert float((root / 'pro1ins2' / 'second').read_text()) < float((root / 'pro1ins1' / 'first').read_text())
+
+
+def test_run_script_records_every_step(monkeypatch, capsys):
+    lc, project = commander_with_history(monkeypatch)
+    script = Path('.testfiles', 'steps.txt')
+    script.write_text("touch built\ntest -f built && test -f ok\ntouch deployed\n")
+    Path(project['root'], 'pro1ins1', 'ok').touch()
+    lc.run(script=str(script))
+    assert Path(project['root'], 'pro1ins1', 'deployed').exists()
+    assert not Path(project['root'], 'pro1ins2', 'deployed').exists()
+    out = capsys.readouterr().out
+    assert 'skipped' in out
+    records = [record for record in RunHistory('.testfiles')._records({'instance'})]
+    assert [step['code'] for step in records[-1]['steps']] == [0, 1, None]
+    lc.run('touch first', step=['touch second'], stream=True)
+    assert "You can not stream the output of a script." in capsys.readouterr().out
+    close_db(lc._lcdb)
+
+
+def test_every_step_flag_is_run(monkeypatch, capsys):
+    import lordcommander.commander as commander
+    lc, project = commander_with_history(monkeypatch)
+    commander.execute(['run', 'touch first', '--step', 'touch second', '--step', 'touch third'],
+                      lc._lcdb, owns_store=False)
+    for name in ('first', 'second', 'third'):
+        assert Path(project['root'], 'pro1ins1', name).exists()
+    close_db(lc._lcdb)
@@ -0,0 +1,63 @@
+import pytest
+
+from lordcommander.shard import parse, split
+from .commons import *
+
+
+def test_shard_is_parsed():
+    assert parse('2/4') == (2, 4)
+    for spec in ('0/4', '5/4', '1', 'a/b', '1/0'):
+        with pytest.raises(ValueError):
+            parse(spec)
+
+
+def test_hashed_split_is_stable():
+    names = ['ins%d' % number for number in range(200)]
+    shards = split(names, 4)
+    assert sorted(sum(shards, [])) == sorted(names)
+    assert all(shards)
+    # Adding a directory never moves the others
+    grown = split(names + ['newcomer'], 4)
+    for before, after in zip(shards, grown):
+        assert [name for name in after if name != 'newcomer'] == before
+
+
+def test_balanced_split_evens_out_durations():
+    durations = {'a': 10.0, 'b': 6.0, 'c': 4.0, 'd': 3.0, 'e': 3.0}
+    shards = split(['a', 'b', 'c', 'd', 'e'], 2, durations)
+    assert shards == [['a', 'd'], ['b', 'c', 'e']]
+    # Never run before, so expected to take the average of 5.2s
+    assert split(['a', 'b', 'new'], 2, {'a': 10.0, 'b': 0.4}) == [['a'], ['b', 'new']]
+
+
+def commander(monkeypatch):
+    import lordcommander.commander as commander
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    testdb['active'] = 'project1'
+    monkeypatch.setattr(commander, 'create_data_dir', lambda: '.testfiles')
+    return commander.LordCommander(testdb), testdb['projects']['project1']
+
+
+def test_shards_cover_the_selection_once(monkeypatch, capsys):
+    lc, project = commander(monkeypatch)
+    project['instances'].extend(['pro1ins%d' % number for number in range(3, 20)])
+    for name in project['instances']:
+        Path(project['root'], name).mkdir(exist_ok=True)
+    for number in (1, 2, 3):
+        lc.run('echo %d >> shard' % number, ex=(0,), shard='%d/3' % number)
+    ran = [name for name in project['instances'] if Path(project['root'], name, 'shard').exists()]
+    assert ran == project['instances'][1:]
+    assert all(len(Path(project['root'], name, 'shard').read_text().split()) == 1 for name in ran)
+    close_db(lc._lcdb)
+
+
+def test_plan_lists_the_shard(monkeypatch, capsys):
+    lc, project = commander(monkeypatch)
+    lc.plan('1/1')
+    out = capsys.readouterr().out
+    assert "- pro1ins1 (0)\n- pro1ins2 (1)" in out
+    assert "shard 1/1: 2 directories" in out
+    lc.plan('3/2')
+    assert "Shard should look like K/N with 1 <= K <= N." in capsys.readouterr().out
+    close_db(lc._lcdb)
@@ -0,0 +1,78 @@
+import gzip
+import re
+
+import lordcommander.spool as spool
+from lordcommander.controllers import CommandController
+from lordcommander.spool import InstanceLog, LogSpool
+from .commons import *
+
+
+def plain(text):
+    return re.sub(r'\x1b\[[0-9;]*m', '', text)
+
+
+def logdir():
+    return str(Path(__file__).parent.parent.resolve() / '.testfiles' / 'logs')
+
+
+def get_project():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    project = testdb['projects']['project1']
+    close_db(testdb)
+    return project
+
+
+def test_only_the_tail_is_kept_in_memory(monkeypatch):
+    monkeypatch.setattr(spool, 'TAIL_SIZE', 32)
+    generate_full_dummy_data()
+    log = InstanceLog(str(Path(logdir()).parent / 'instance'))
+    for number in range(100):
+        log('stdout', b'line %d\n' % number)
+    log('stderr', b'oops\n')
+    log.close()
+    assert log.tail(3) == ['line 98', 'line 99', 'oops']
+    assert Path(log.paths['stdout']).read_bytes().count(b'\n') == 100
+    assert Path(log.paths['stderr']).read_bytes() == b'oops\n'
+
+
+def test_logs_are_capped():
+    generate_full_dummy_data()
+    log = InstanceLog(str(Path(logdir()).parent / 'instance'), limit=10)
+    log('stdout', b'0123456789abcdef')
+    log('stdout', b'more')
+    log.close()
+    assert log.written['stdout'] == 10 and log.dropped['stdout'] == 10
+    assert Path(log.paths['stdout']).read_bytes() == b'0123456789\n[lc: 10 more bytes are not logged]\n'
+
+
+def test_run_is_spooled_to_files(capsys):
+    project = get_project()
+    (Path(project['root']) / 'pro1ins1' / 'ok').touch()
+    CommandController().run(project, 'echo out; echo err >&2; test -f ok', jobs=2,
+                            spool=LogSpool(logdir(), compress=True))
+    out = plain(capsys.readouterr().out)
+    assert "[0] pro1ins1: exited with 0" in out and "-> pro1ins1.out.gz" in out
+    assert "[1] pro1ins2: exited with 1" in out
+    failures = out.split("- pro1ins2 (1)\n", 1)[1]
+    assert "  | out\n" in failures and "  | err\n" in failures
+    assert "Changed directory" not in out
+    with gzip.open(str(Path(logdir()) / 'pro1ins2.err.gz')) as err:
+        assert err.read() == b'err\n'
+    assert not (Path(logdir()) / 'pro1ins2.out').exists()
+
+
+def test_nested_instances_have_files_of_their_own():
+    assert spool.log_name('a/b') == 'a%2Fb'
+    assert len({spool.log_name(name) for name in ('a/b', 'a__b', 'a%2Fb', 'a%b')}) == 4
+
+
+def test_unwritable_log_is_reported_like_a_failed_run(capsys):
+    project = get_project()
+    makedirs(str(Path(logdir()) / 'pro1ins1.out'))
+    cc = CommandController()
+    cc.run(project, 'true', jobs=2, spool=LogSpool(logdir()))
+    out = plain(capsys.readouterr().out)
+    assert "Is a directory" in out
+    assert "[1] pro1ins2: exited with 0" in out
+    assert cc._counts['failed'] == 1
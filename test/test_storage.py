@@ -0,0 +1,87 @@
+import shelve
+
+from lordcommander.controllers import DirectoryController, ProjectController
+from lordcommander.storage import SqliteStore, open_store
+from .commons import *
+
+
+def get_test_store():
+    if not path.exists('.testfiles'):
+        mkdir('.testfiles')
+    return SqliteStore('.testfiles/testdb.sqlite3')
+
+
+def test_projects_and_instances_are_persisted():
+    remove_test_files()
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    store = get_test_store()
+    ProjectController(store).add(pro_path)
+    ProjectController(store).active(pro_name)
+    DirectoryController(store['projects'][pro_name]['instances']).add(ins_name, 'other')
+    store.close()
+    store = get_test_store()
+    assert store['active'] == pro_name
+    assert store['projects'][pro_name]['root'] == pro_path
+    assert store['projects'][pro_name]['instances'] == [ins_name, 'other']
+    store.close()
+
+
+def test_removing_and_renaming_are_persisted():
+    remove_test_files()
+    (pro_path, pro_name, ins_name) = create_a_new_project()
+    store = get_test_store()
+    store['projects']['old'] = {'root': pro_path, 'instances': ['a', 'b', 'c']}
+    store.close()
+    store = get_test_store()
+    DirectoryController(store['projects']['old']['instances']).clear('b')
+    ProjectController(store).rename('old', 'new')
+    store.close()
+    store = get_test_store()
+    assert 'old' not in store['projects']
+    assert list(store['projects']) == ['new']
+    assert store['projects']['new']['instances'] == ['a', 'c']
+    store.close()
+
+
+def test_read_only_use_writes_nothing():
+    remove_test_files()
+    store = get_test_store()
+    store['projects']['p'] = {'root': '/', 'instances': ['a']}
+    store.close()
+    store = get_test_store()
+    connection = store._connection
+    changes = connection.total_changes
+    assert 'a' in store['projects']['p']['instances']
+    store.sync()
+    assert connection.total_changes == changes
+    store.close()
+
+
+def test_legacy_shelve_is_migrated():
+    generate_full_dummy_data()
+    testdb = get_test_shelve_file()
+    projects = testdb['projects']
+    close_db(testdb)
+    with shelve.open('.testfiles/lcdb') as legacy:
+        legacy['active'] = 'project2'
+        legacy['projects'] = projects
+    store = open_store('.testfiles')
+    assert store['active'] == 'project2'
+    assert store['projects']['project1']['instances'] == ['pro1ins1', 'pro1ins2']
+    store.close()
+
+
+def test_overlapping_writers_are_merged():
+    remove_test_files()
+    store = get_test_store()
+    store['projects']['p'] = {'root': '/', 'instances': ['a', 'b']}
+    store.close()
+    first, second = get_test_store(), get_test_store()
+    first['projects']['p']['instances'].append('c')
+    second['projects']['p']['instances'].remove('a')
+    second['projects']['p']['instances'].append('d')
+    first.close()
+    second.close()
+    store = get_test_store()
+    assert store['projects']['p']['instances'] == ['b', 'c', 'd']
+    store.close()